@@ -1,6 +1,17 @@
-from fastapi import FastAPI, HTTPException, status
+from contextlib import asynccontextmanager
+
+import json
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from database import Database
+from fastapi.responses import FileResponse, StreamingResponse
+from blob_store import BlobTooLarge
+from database import Database, parse_reading
+from ingest_queue import IngestQueue, IngestQueueFull
+from plan_service import PlanService
+from reporting import ReportingPolicy
 from smortPredictor import smortPredictorImplementor
 from os import getenv
 from dotenv import load_dotenv
@@ -8,7 +19,6 @@ from pathlib import Path
 
 import optimize_collection
 from pydantic import BaseModel
-from fastapi import status
 
 class DriverLocationInput(BaseModel):
     latitude: str
@@ -18,7 +28,21 @@ class DriverLocationInput(BaseModel):
 class OptimizationResponse(BaseModel):
     status: str
     message: str
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The connection pool lives as long as the application
+    await db.open()
+    ingest.start()
+    plans.start()
+    yield
+    await plans.stop()
+    await ingest.stop()
+    await optimize_collection.close_route_optimizer()
+    await db.close_connection()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +50,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After", "X-Next-Report-S"],
 )
 env_path = Path(__file__).resolve().parents[3] / '.env'
 load_dotenv(dotenv_path=env_path)
@@ -34,6 +59,33 @@ load_dotenv(dotenv_path=env_path)
 db = Database(getenv("DB_HOST"), getenv("DB_PORT"), getenv(
     "DB_USER"), getenv("DB_PASSWORD"), getenv("DB_NAME"))
 
+# Models live in the process-wide registry, so one predictor serves every request
+predictor = smortPredictorImplementor(model_directory=None, db=db)
+# POST /record readings are group-committed by a background flusher
+ingest = IngestQueue(db)
+# Tells each sensor when to report next (see reporting.py)
+reporting = ReportingPolicy()
+# New readings (POST /record) make the sensor's cached forecast stale
+db.add_record_listener(predictor.cache.invalidate)
+
+# Collection shifts run every COLLECTION_FREQUENCY_HOURS from COLLECTION_START_TIME
+COLLECTION_FREQUENCY_HOURS = float(getenv("COLLECTION_FREQUENCY_HOURS") or 24)
+COLLECTION_START_TIME = datetime.fromisoformat(getenv("COLLECTION_START_TIME") or "2024-01-01T08:00:00")
+# Plans are made for now, or for COLLECTION_REFERENCE_TIME when replaying old data
+COLLECTION_REFERENCE_TIME = getenv("COLLECTION_REFERENCE_TIME")
+
+
+def reference_time() -> datetime:
+    if COLLECTION_REFERENCE_TIME:
+        return datetime.fromisoformat(COLLECTION_REFERENCE_TIME)
+    return datetime.now()
+
+
+# Per-region collection plans and schedules, rebuilt in the background as readings arrive
+plans = PlanService(db, predictor, COLLECTION_FREQUENCY_HOURS, COLLECTION_START_TIME,
+                    refered_date=reference_time)
+db.add_record_listener(plans.mark_sensor_dirty)
+
 
 @app.get("/")
 async def root():
@@ -72,28 +124,236 @@ async def get_latest_sensor_trash_level(sensor_ID: int):
     return record
 
 
+def _record_line(record) -> str:
+    sensor_ID, time_stamp, trash_level, image_ref = record
+    return json.dumps([sensor_ID, time_stamp.isoformat(),
+                       None if trash_level is None else float(trash_level), image_ref]) + "\n"
+
+
+@app.get("/sensor/{sensor_ID}/compaction")
+async def get_sensor_compaction_stats(sensor_ID: int):
+    """Readings received and stored for the sensor by this process (see compaction.py)."""
+    return db.compaction.stats(sensor_ID)
+
+
 @app.get("/sensor/{sensor_ID}/records")
-async def get_sensor_records(sensor_ID: int):
-    records = await db.get_sensor_records(sensor_ID)
+async def get_sensor_records(
+    sensor_ID: int,
+    response: Response,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    after: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    order: Literal["asc", "desc"] = "asc",
+    stream: bool = False,
+):
+    """
+    Readings with time_stamp in [from, to). Pages are chained by passing the
+    X-Next-After header of a full page back as `after`. With stream=true the
+    rows are sent as NDJSON straight from a database cursor.
+    """
+    descending = order == "desc"
+    if stream:
+        records = db.stream_sensor_records(sensor_ID, start, end, after, limit, descending)
+        return StreamingResponse((_record_line(record) async for record in records),
+                                 media_type="application/x-ndjson")
+
+    records = await db.get_sensor_records(sensor_ID, start, end, after, limit, descending)
+    if limit is not None and len(records) == limit:
+        response.headers["X-Next-After"] = records[-1][1].isoformat()
     return records
 
 
+async def _ingest(reading: dict) -> bool:
+    try:
+        result = await ingest.submit(reading)
+    except IngestQueueFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Ingestion queue is full, retry later", headers={"Retry-After": "1"})
+    if result["status"] == "unavailable":
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Could not store the reading, retry later")
+    if result["status"] == "error":
+        raise HTTPException(status_code=422, detail=result["detail"])
+    # A duplicate (sensor, time_stamp) was already stored by an earlier attempt,
+    # a compacted one is represented by the sensor's last stored reading
+    return True
+
+
+async def _ingest_and_schedule(reading: dict, response: Response) -> dict:
+    """Store a reading and tell the sensor when to report next."""
+    # Read the forecast first: storing the reading invalidates it
+    forecast = predictor.cache.peek(reading.get("sensor_ID"))
+    stored = await _ingest(reading)
+
+    time_stamp = reading.get("time_stamp")
+    time_stamp = datetime.fromisoformat(time_stamp) if time_stamp else datetime.now()
+    if time_stamp.tzinfo is not None:
+        time_stamp = time_stamp.astimezone().replace(tzinfo=None)
+    full_at = forecast['predicted_timestamp'] if forecast else None
+    next_report_s = reporting.observe(reading["sensor_ID"], time_stamp,
+                                      float(reading["trash_level"]), full_at)
+    response.headers["X-Next-Report-S"] = str(next_report_s)
+    return {"stored": stored, "next_report_s": next_report_s}
+
+
 @app.post("/record")
-async def create_sensor_record(sensor_data: dict):
-    status = await db.add_sensor_record(**sensor_data)
-    if not status:
-        return HTTPException(status_code=422, detail="Maybe the JSON data is wrong...")
-    return status
+async def create_sensor_record(sensor_data: dict, response: Response):
+    """Responds with next_report_s, the seconds the sensor should wait before its next reading."""
+    return await _ingest_and_schedule(sensor_data, response)
+
+
+# Largest camera frame accepted by /record/image
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+
+async def _upload_chunks(upload, chunk_size: int = 64 * 1024):
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+@app.post("/record/image")
+async def create_sensor_record_with_image(request: Request, response: Response):
+    """
+    Reading with a raw camera frame, without base64 or JSON. Either:
+    - body is the JPEG (Content-Type image/jpeg or application/octet-stream)
+      and the reading is in X-Sensor-ID, X-Trash-Level and optionally
+      X-Time-Stamp headers, or
+    - multipart/form-data with sensor_ID, trash_level, optional time_stamp
+      fields and the JPEG in an "image" file part.
+    The next report interval is returned as for /record.
+    """
+    content_type = request.headers.get("content-type", "")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image larger than {MAX_IMAGE_BYTES} bytes")
+
+    form = None
+    try:
+        if content_type.startswith("multipart/form-data"):
+            # Starlette spools file parts to a temporary file past 1 MB
+            form = fields = await request.form()
+            upload = form.get("image")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=422, detail="Missing image file part")
+            chunks = _upload_chunks(upload)
+            names = ("sensor_ID", "trash_level", "time_stamp")
+        elif content_type.startswith(("image/jpeg", "application/octet-stream")):
+            fields = request.headers
+            chunks = request.stream()
+            names = ("x-sensor-id", "x-trash-level", "x-time-stamp")
+        else:
+            raise HTTPException(status_code=415, detail="Send image/jpeg, application/octet-stream or multipart/form-data")
+
+        # Check the reading before anything is written to the image store
+        sensor_ID, trash_level, time_stamp = (fields.get(name) for name in names)
+        if not isinstance(sensor_ID, str) or not sensor_ID.isdigit() or trash_level is None:
+            raise HTTPException(status_code=422, detail="sensor ID and trash level are required")
+        reading = {"sensor_ID": int(sensor_ID), "trash_level": trash_level}
+        if time_stamp:
+            reading["time_stamp"] = time_stamp
+        try:
+            parse_reading(reading, datetime.now())
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        try:
+            reading["image_ref"] = await db.images.put_stream(chunks, max_bytes=MAX_IMAGE_BYTES)
+        except BlobTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        if form is not None:
+            await form.close()
+    return await _ingest_and_schedule(reading, response)
+
+
+@app.get("/records/queue")
+async def get_ingest_queue_stats():
+    return ingest.stats()
+
+
+# Upper bound on readings accepted by one /records/bulk request
+MAX_BULK_READINGS = 10000
+
+
+@app.post("/records/bulk")
+async def create_sensor_records(request: Request):
+    """
+    Insert a batch of readings, sent as a JSON array or as NDJSON
+    (Content-Type: application/x-ndjson), each shaped like a POST /record
+    body with an optional ISO 8601 "time_stamp". Responds with counts and
+    one {"index", "status", "detail"?} result per reading; re-sending
+    readings that were already stored reports them as "duplicate".
+    """
+    body = await request.body()
+    parse_errors = {}
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        try:
+            text = body.decode()
+        except UnicodeDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid UTF-8: {e}")
+        readings = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                readings.append(json.loads(line))
+            except ValueError as e:
+                parse_errors[len(readings)] = f"Invalid JSON: {e}"
+                readings.append(None)
+    else:
+        try:
+            readings = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(readings, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of readings")
+
+    if len(readings) > MAX_BULK_READINGS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_READINGS} readings per request")
+
+    results = await db.add_sensor_records(readings)
+    if results is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Could not store the readings, retry later")
+
+    for index, detail in parse_errors.items():
+        results[index] = {"status": "error", "detail": detail}
+    counts = {"inserted": 0, "duplicate": 0, "compacted": 0, "error": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {**counts, "results": [{"index": i, **result} for i, result in enumerate(results)]}
+
+
+@app.get("/record/{sensor_ID}/{time_stamp}/image")
+async def get_record_image(sensor_ID: int, time_stamp: datetime):
+    image_ref = await db.get_record_image_ref(sensor_ID, time_stamp)
+    if not image_ref or not db.images.exists(image_ref):
+        raise HTTPException(status_code=404, detail="No image for this record")
+    # Content-addressed, so the bytes behind a reference never change
+    return FileResponse(db.images.path(image_ref), media_type="image/jpeg",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable",
+                                 "ETag": f'"{image_ref}"'})
 
 
 @app.get("/predict/{sensor_id}")
 async def predict(sensor_id: int):
-    predictor = smortPredictorImplementor(model_directory=None)
     prediction = await predictor.predict_full_level(sensor_id)
+    if prediction is None:
+        raise HTTPException(status_code=404, detail="Not enough readings to forecast this sensor")
 
     return prediction
 
 
+@app.get("/predict/region/{region_id}")
+async def predict_region(region_id: int):
+    predictions = await predictor.predict_region(region_id, db)
+
+    return predictions
+
+
 @app.get("/analytics/level/{region_id}")
 async def get_latest_trash_levels_in_region(region_id: int):
     trash_levels = await db.get_latest_trash_levels_in_region(region_id)
@@ -111,8 +371,83 @@ async def get_average_trash_levels_of_all_sensors_in_region(region_id: int):
     average_trash_levels = await db.get_average_trash_levels_all_sensors_in_region(region_id)
     return average_trash_levels
 
+
+@app.get("/analytics/rollup/sensor/{sensor_ID}")
+async def get_sensor_rollup(
+    sensor_ID: int,
+    resolution: Literal["hour", "day"] = "hour",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(168, ge=1, le=2000),
+):
+    """Rows of [bucket, min, max, avg, readings, last_level], oldest first."""
+    rollup = await db.get_sensor_rollup(sensor_ID, resolution, start, end, limit)
+    return rollup
+
+
+@app.get("/analytics/rollup/region/{region_id}")
+async def get_region_rollup(
+    region_id: int,
+    resolution: Literal["hour", "day"] = "hour",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(168, ge=1, le=2000),
+):
+    """Rows of [bucket, min, max, avg, readings, sensors], oldest first."""
+    rollup = await db.get_region_rollup(region_id, resolution, start, end, limit)
+    return rollup
+
 #prince part 
 
+@app.get("/plans/status")
+async def get_plans_status():
+    return plans.status()
+
+
+class FleetInput(BaseModel):
+    latitude: str
+    longitude: str
+    region_id: int
+    trucks: Optional[int] = None
+
+
+@app.post("/fleetRoutes")
+async def get_fleet_routes(data: FleetInput):
+    """
+    One route per truck through the region's planned bins, within truck
+    capacity (TRUCK_CAPACITY_BINS). `trucks` defaults to the fewest that
+    can carry the expected load.
+    """
+    if data.trucks is not None and data.trucks < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="trucks must be at least 1")
+    try:
+        plan = await plans.get_plan(data.region_id)
+        routes = await optimize_collection.generate_fleet_routes(
+            plan.bins, f"{data.latitude},{data.longitude}", trucks=data.trucks)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {
+        "region_id": data.region_id,
+        "trucks": len(routes),
+        "distance_km": round(sum(route["distance_km"] for route in routes), 2),
+        "routes": routes
+    }
+
+
+@app.get("/schedule/{region_id}")
+async def get_collection_schedule(region_id: int):
+    """
+    Which shifts over the horizon (SCHEDULE_HORIZON_DAYS) should have a
+    collection run, and which bins each one should empty.
+    """
+    scheduler = await plans.get_schedule(region_id)
+    return {
+        "region_id": region_id,
+        **scheduler.stats(),
+        "shifts": scheduler.schedule()
+    }
+
+
 @app.post("/driverLocation", response_model=OptimizationResponse)
 async def add_driver_location(data: DriverLocationInput):
     """
@@ -129,19 +464,15 @@ async def add_driver_location(data: DriverLocationInput):
         "message": "https://maps/link/api ............"
     }
     """
-    frequency = 24  # hours
-    start_time_string = "2024-01-01 08:00:00"
-
     collection_origin = f"{data.latitude},{data.longitude}"  # Corrected to use the fields properly
 
-    refered_date_string = "2025-04-26 22:00:00"  # Example 'now'
-    
     target_region_id = data.region_id  # Region ID comes from request
-    
+
     try:
-        link = await optimize_collection.main(frequency, start_time_string, collection_origin, target_region_id, refered_date_string)
+        # Bins and route skeleton are precomputed; only the origin is attached here
+        link = await plans.route(target_region_id, collection_origin)
     except Exception as e:
-        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
     return {
         "status": "200",
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from os import getenv
+from typing import AsyncIterator, Optional
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobTooLarge(ValueError):
+    """Raised by BlobStore.put_stream() when a stream exceeds its size limit."""
+
+
+def is_blob_ref(digest) -> bool:
+    return isinstance(digest, str) and bool(_DIGEST.match(digest))
+
+
+def default_store_directory() -> str:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return getenv("IMAGE_STORE_DIR") or os.path.abspath(os.path.join(base_dir, '..', 'image-store'))
+
+
+class BlobStore:
+    """
+    Content-addressed file store for camera images.
+
+    A blob is named by the SHA-256 of its bytes and sharded into
+    `<root>/ab/cd/<digest>`, so identical frames are stored once and a
+    reference never changes meaning. Writes go to a temporary file that is
+    renamed into place, so readers never see a partial image.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or default_store_directory()
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        if not is_blob_ref(digest):
+            raise ValueError(f"Invalid blob reference: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put(self, data: bytes) -> str:
+        """Store `data` (if not already present) and return its reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    async def put_stream(self, chunks: AsyncIterator[bytes], max_bytes: Optional[int] = None) -> str:
+        """
+        Store a blob arriving as an async stream of chunks and return its
+        reference. The digest is computed while the chunks are written to a
+        temporary file, so the blob is never held in memory as a whole.
+        Raises BlobTooLarge past `max_bytes` and ValueError if it is empty.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            sha256 = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"Blob larger than {max_bytes} bytes")
+                    sha256.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            if not size:
+                raise ValueError("Empty blob")
+
+            digest = sha256.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self.path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+async def migrate_inline_images(db, store: BlobStore, batch_size: int = 500) -> int:
+    """
+    Move base64 images still stored inline in sensor_record.image into the
+    store (run between migrations 002 and 003). Returns the rows moved.
+    """
+    import base64
+
+    moved = 0
+    while True:
+        async with db.pool.connection() as conn:
+            cursor = await conn.execute(
+                """
+                SELECT smort_ID, time_stamp, image FROM sensor_record
+                WHERE image IS NOT NULL AND image <> '' AND image_ref IS NULL
+                LIMIT %s
+                """, (batch_size,))
+            rows = await cursor.fetchall()
+            if not rows:
+                return moved
+
+            for smort_ID, time_stamp, image in rows:
+                digest = await asyncio.to_thread(store.put, base64.b64decode(image))
+                await conn.execute(
+                    "UPDATE sensor_record SET image_ref = %s, image = NULL WHERE smort_ID = %s AND time_stamp = %s",
+                    (digest, smort_ID, time_stamp))
+        moved += len(rows)
+        print(f"[+] Moved {moved} images")
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from database import Database
+
+    env_path = Path(__file__).resolve().parents[3] / '.env'
+    load_dotenv(dotenv_path=env_path)
+
+    async def main():
+        db = Database(getenv("DB_HOST"), getenv("DB_PORT"), getenv("DB_USER"),
+                      getenv("DB_PASSWORD"), getenv("DB_NAME"))
+        await db.open()
+        try:
+            moved = await migrate_inline_images(db, BlobStore())
+            print(f"Done: {moved} images moved to {default_store_directory()}")
+        finally:
+            await db.close_connection()
+
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from os import getenv
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Resolution SmortML.clean_data resamples readings to
+BUCKET_MINUTES = 15
+
+
+def bucket(time_stamp: datetime) -> datetime:
+    return time_stamp.replace(minute=time_stamp.minute - time_stamp.minute % BUCKET_MINUTES,
+                              second=0, microsecond=0)
+
+
+class Deadband:
+    """
+    Ingest-time deadband compaction of sensor readings.
+
+    A reading is stored only if it differs from the sensor's last stored
+    level by more than `tolerance`, is the first reading of its 15-minute
+    bucket, or arrives out of order. Every dropped
+    reading is within `tolerance` of the last stored one, so the
+    "last reading at or before each 15-minute mark" series that
+    SmortML.clean_data resamples to is rebuilt exactly at tolerance 0 and
+    within `tolerance` otherwise; keeping one reading per bucket keeps the
+    resampled series' extent unchanged.
+
+    Images do not affect the decision: the firmware attaches one to every
+    reading, so they would keep everything. A stored reading keeps its
+    image and a dropped one drops it, which leaves at least one image per
+    sensor and bucket, plus one at every level change.
+
+    Disabled (everything stored) when no tolerance is configured.
+    """
+
+    def __init__(self, tolerance: Optional[float] = None):
+        if tolerance is None:
+            setting = getenv("COMPACTION_TOLERANCE")
+            tolerance = float(setting) if setting else None
+        self.tolerance = None if tolerance is None else Decimal(str(tolerance))
+        self._stats: Dict[int, List[int]] = {}  # sensor -> [received, stored]
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.tolerance is not None
+
+    def select(self, sensor_ID: int, last: Optional[Tuple[datetime, Decimal]],
+               readings: Sequence[Tuple[datetime, Decimal]]) -> List[bool]:
+        """
+        Decide which of a sensor's new (time_stamp, trash_level) readings
+        to store, given its last stored (time_stamp, trash_level).
+        Returns one flag per reading, in the order given.
+        """
+        keep = [True] * len(readings)
+        if self.enabled:
+            last_time, last_level = last if last is not None else (None, None)
+            for i in sorted(range(len(readings)), key=lambda i: readings[i][0]):
+                time_stamp, level = readings[i]
+                if (last_time is not None and last_level is not None and level is not None
+                        and time_stamp > last_time
+                        and bucket(time_stamp) == bucket(last_time)
+                        and abs(level - last_level) <= self.tolerance):
+                    keep[i] = False
+                    continue
+                if last_time is None or time_stamp > last_time:
+                    last_time, last_level = time_stamp, level
+
+        with self._lock:
+            stats = self._stats.setdefault(sensor_ID, [0, 0])
+            stats[0] += len(readings)
+            stats[1] += sum(keep)
+        return keep
+
+    def stats(self, sensor_ID: int) -> dict:
+        with self._lock:
+            received, stored = self._stats.get(sensor_ID, (0, 0))
+        return {
+            'sensor_ID': sensor_ID,
+            'tolerance': None if self.tolerance is None else float(self.tolerance),
+            'received': received,
+            'stored': stored,
+            'compacted': received - stored,
+            'compaction_ratio': received / stored if stored else None,
+        }
+
+
+def verify(days: int = 3, interval_s: int = 30, tolerances=(0, 5, 10)) -> None:
+    """
+    Compact a synthetic 30-second series (ultrasonic levels quantised to
+    whole centimetres, as trash.ino reports them, each with its own image)
+    and check that SmortML.clean_data rebuilds the same 15-minute series
+    and that every 15-minute bucket keeps an image.
+    """
+    import numpy as np
+    import pandas as pd
+    from randomForest import SmortML
+
+    rng = np.random.default_rng(0)
+    n = days * 24 * 3600 // interval_s
+    start = datetime(2025, 4, 1)
+    # Slowly filling 13 cm bin, emptied when full, with +/-1 cm echo jitter
+    depth = np.minimum(np.cumsum(rng.uniform(0, 0.004, n)) % 14, 13)
+    distance = np.clip(np.round(13 - depth + rng.choice([-1, 1, 0], n, p=[0.03, 0.03, 0.94])), 0, 13)
+    levels = [Decimal(f"{(13 - d) / 13 * 100:.2f}") for d in distance]
+    # Unsynchronised clock: readings rarely land on a 15-minute mark
+    offsets = np.cumsum(rng.uniform(0.8, 1.2, n)) * interval_s + 7
+    times = [start + timedelta(seconds=float(s)) for s in offsets]
+    images = [f"{i:064x}" for i in range(n)]
+
+    def resampled(rows):
+        df = pd.DataFrame(rows, columns=['smort_ID', 'time_stamp', 'trash_level'])
+        df['trash_level'] = df['trash_level'].astype(float)
+        return df.set_index('time_stamp').resample('15min').ffill()['trash_level']
+
+    def cleaned(rows):
+        model = SmortML(rows)
+        model.clean_data()
+        return model.data.set_index('time_stamp')['trash_level']
+
+    full = [(1, t, level) for t, level in zip(times, levels)]
+    for tolerance in tolerances:
+        deadband = Deadband(tolerance)
+        keep = deadband.select(1, None, list(zip(times, levels)))
+        compacted = [row for row, kept in zip(full, keep) if kept]
+        kept_images = [image for image, kept in zip(images, keep) if kept]
+        assert {bucket(t) for t in times} == {bucket(row[1]) for row in compacted}, "a bucket lost its image"
+
+        diff = (resampled(full) - resampled(compacted)).abs().max()
+        clean_diff = (cleaned(full) - cleaned(compacted)).abs().max()
+        assert len(resampled(full)) == len(resampled(compacted))
+        assert diff <= tolerance, f"tolerance {tolerance}: resampled series off by {diff}"
+        print(f"tolerance {tolerance:>3}: {len(full)} -> {len(compacted)} rows "
+              f"({len(full) / len(compacted):.1f}x), resampled max diff {diff:.2f}, "
+              f"clean_data max diff {clean_diff:.2f}, {len(kept_images)} images kept")
+
+
+if __name__ == "__main__":
+    verify()
@@ -8,6 +8,8 @@ from dotenv import load_dotenv
 
 from database import Database
 from randomForest import SmortML  
+from forest_engine import compile_forest, compiled_model_path
+from retention import detach_old_partitions, ensure_partitions
 
 # Setup logging
 def setup_logging():
@@ -59,6 +61,11 @@ async def train_sensor(sensor_id: int, db: Database, model_save_path: str):
     joblib.dump(model.model, model_file)
     logging.info(f"[Sensor {sensor_id}] Model saved successfully at: {model_file}")
 
+    # Flat-array export used by the API for inference (see forest_engine)
+    compiled_file = compiled_model_path(model_file)
+    compile_forest(model.model).save(compiled_file)
+    logging.info(f"[Sensor {sensor_id}] Compiled model saved at: {compiled_file}")
+
 async def main():
     # Setup logging first
     setup_logging()
@@ -75,19 +82,27 @@ async def main():
         os.getenv("DB_PASSWORD"),
         os.getenv("DB_NAME")
     )
+    await db.open()
 
     # Create model directory if it doesn't exist
     model_save_path = os.path.join(os.getcwd(), "ML-model")
     os.makedirs(model_save_path, exist_ok=True)
 
     try:
+        # Partition upkeep: next months' partitions and retention
+        created = await ensure_partitions(db)
+        logging.info(f"sensor_record partitions: {', '.join(created)}")
+        detached = await detach_old_partitions(db)
+        if detached:
+            logging.info(f"Detached partitions: {', '.join(detached)}")
+
         # Loop over sensors 1 to 9
         for sensor_id in range(1, 10):
             logging.info(f"\n=== Training Sensor {sensor_id} ===")
             await train_sensor(sensor_id, db, model_save_path)
 
     finally:
-        db.close_connection()
+        await db.close_connection()
         logging.info("Database connection closed.")
 
 if __name__ == "__main__":
@@ -1,12 +1,84 @@
-import psycopg2 as pg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from blob_store import BlobStore, is_blob_ref
+from compaction import Deadband
+import asyncio
+import base64
 from datetime import datetime
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from os import getenv
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+# Rollup resolution -> table maintained by the sensor_record_rollup trigger
+ROLLUP_TABLES = {
+    "hour": "sensor_record_hourly",
+    "day": "sensor_record_daily",
+}
+
+# trash_level is DECIMAL(5,2)
+MAX_TRASH_LEVEL = Decimal("999.99")
+
+
+def parse_reading(reading, now: datetime) -> tuple:
+    """
+    Validate one reading into (sensor_ID, time_stamp, trash_level,
+    image_base64, image_ref); raises ValueError with a client-facing message.
+    """
+    if not isinstance(reading, dict):
+        raise ValueError("reading must be a JSON object")
+    sensor_ID = reading.get("sensor_ID")
+    if isinstance(sensor_ID, bool) or not isinstance(sensor_ID, int):
+        raise ValueError("sensor_ID must be an integer")
+
+    trash_level = reading.get("trash_level")
+    if isinstance(trash_level, bool) or not isinstance(trash_level, (int, float, str)):
+        raise ValueError("trash_level must be a number")
+    try:
+        trash_level = Decimal(str(trash_level)).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError("trash_level must be a number")
+    if not trash_level.is_finite():
+        raise ValueError("trash_level must be a number")
+    if abs(trash_level) > MAX_TRASH_LEVEL:
+        raise ValueError(f"trash_level must be within +/-{MAX_TRASH_LEVEL}")
+
+    time_stamp = reading.get("time_stamp")
+    if time_stamp is None:
+        time_stamp = now
+    else:
+        try:
+            time_stamp = datetime.fromisoformat(str(time_stamp))
+        except ValueError:
+            raise ValueError("time_stamp must be an ISO 8601 timestamp")
+        if time_stamp.tzinfo is not None:
+            # Readings are stored as naive local time
+            time_stamp = time_stamp.astimezone().replace(tzinfo=None)
+
+    image_base64 = reading.get("image_base64")
+    if image_base64 is not None and not isinstance(image_base64, str):
+        raise ValueError("image_base64 must be a string")
+    # Set instead of image_base64 when the image was already streamed to the store
+    image_ref = reading.get("image_ref")
+    if image_ref is not None and not is_blob_ref(image_ref):
+        raise ValueError("image_ref must be a blob store reference")
+    return sensor_ID, time_stamp, trash_level, image_base64, image_ref
 
 
 class Database:
-    def __init__(self, host: str, port: str, user: str, password: str, dbname: str):
-        self.connection = pg.connect(
+    """
+    Async data-access layer over a bounded psycopg connection pool.
+
+    Every call borrows its own connection for the duration of one statement
+    or transaction, so concurrent requests never share a cursor and a slow
+    query only holds one pool slot. Statements are server-side prepared.
+    The pool is opened by open() (the API does this in its lifespan) and
+    released by close_connection().
+    """
+
+    def __init__(self, host: str, port: str, user: str, password: str, dbname: str,
+                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 images: Optional[BlobStore] = None, compaction: Optional[Deadband] = None):
+        conninfo = make_conninfo(
             dbname=dbname,
             user=user,
             password=password,
@@ -14,29 +86,63 @@ class Database:
             port=port
 
         )
-        self.cursor = self.connection.cursor()
+        self.pool = AsyncConnectionPool(
+            conninfo,
+            min_size=min_size or int(getenv("DB_POOL_MIN_SIZE") or 1),
+            max_size=max_size or int(getenv("DB_POOL_MAX_SIZE") or 10),
+            open=False,
+        )
+        self.images = images if images is not None else BlobStore()
+        self.compaction = compaction if compaction is not None else Deadband()
+        # Called with the sensor ID after a new reading is committed
+        self.record_listeners: List[Callable[[int], None]] = []
+
+    async def open(self) -> None:
+        await self.pool.open()
 
-    def check_connection(self) -> bool:
+    def add_record_listener(self, listener: Callable[[int], None]) -> None:
+        self.record_listeners.append(listener)
+
+    def _notify_record(self, sensor_ID: int) -> None:
+        for listener in self.record_listeners:
+            try:
+                listener(sensor_ID)
+            except Exception as e:
+                print(f"An error occurred in record listener: {e}")
+
+    async def _fetchall(self, query: str, params: tuple = None) -> list:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(query, params, prepare=True)
+            return await cursor.fetchall()
+
+    async def _fetchone(self, query: str, params: tuple = None):
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(query, params, prepare=True)
+            return await cursor.fetchone()
+
+    async def _execute(self, query: str, params: tuple = None) -> None:
+        # Leaving the pool context commits, or rolls back if the statement failed
+        async with self.pool.connection() as conn:
+            await conn.execute(query, params, prepare=True)
+
+    async def check_connection(self) -> bool:
         try:
-            self.cursor.execute("SELECT version();")
-            record = self.cursor.fetchone()
+            record = await self._fetchone("SELECT version();")
             print("You are connected to - ", record, "\n")
             return True
         except Exception as e:
             print(f"An error occurred: {e}")
             return False
 
-    def close_connection(self):
-        if self.connection:
-            self.cursor.close()
-            print("PostgreSQL connection is closed")
-            self.connection.close()
+    async def close_connection(self):
+        if not self.pool.closed:
+            await self.pool.close()
+            print("PostgreSQL connection pool is closed")
 
     async def get_regions(self) -> list:
         try:
             query = "SELECT * FROM region"
-            self.cursor.execute(query)
-            regions = self.cursor.fetchall()
+            regions = await self._fetchall(query)
             return regions
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -45,8 +151,7 @@ class Database:
     async def get_region_sensors(self, region_ID: int) -> list:
         try:
             query = "SELECT id, latitude, longitude, name FROM region_sensor INNER JOIN sensor s on s.id = region_sensor.sensor_id WHERE region_id = %s"
-            self.cursor.execute(query, (region_ID,))
-            sensors = self.cursor.fetchall()
+            sensors = await self._fetchall(query, (region_ID,))
             return sensors
         except Exception as e:
             print(f"An error occured: {e}")
@@ -54,41 +159,54 @@ class Database:
 
     async def add_sensor(self, latitude: float, longitude: float, name: str, region_ID: int) -> bool:
         try:
-            query = "INSERT INTO sensor (latitude, longitude, name) VALUES (%s, %s, %s) RETURNING ID"
-            self.cursor.execute(query, (latitude, longitude, name))
-            sensor_id = self.cursor.fetchone()[0]
-            print(f"[+] Inserted new sensor with ID: {sensor_id}")
+            async with self.pool.connection() as conn:
+                async with conn.transaction():
+                    query = "INSERT INTO sensor (latitude, longitude, name) VALUES (%s, %s, %s) RETURNING ID"
+                    cursor = await conn.execute(query, (latitude, longitude, name), prepare=True)
+                    sensor_id = (await cursor.fetchone())[0]
+                    print(f"[+] Inserted new sensor with ID: {sensor_id}")
 
-            query = "INSERT INTO region_sensor (region_ID, sensor_ID) VALUES (%s, %s)"
-            self.cursor.execute(query, (region_ID, sensor_id))
+                    query = "INSERT INTO region_sensor (region_ID, sensor_ID) VALUES (%s, %s)"
+                    await conn.execute(query, (region_ID, sensor_id), prepare=True)
 
-            self.connection.commit()
             return True
         except Exception as e:
             print(f"An error occured: {e}")
-            self.connection.rollback()
             return False
 
     async def get_sensor_record(self, sensor_ID: int) -> list:
         try:
             query = """
-            SELECT * FROM sensor_record WHERE smort_ID = %s
+            SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS trash_level, image_ref
+            FROM sensor_record WHERE smort_ID = %s
             """
-            self.cursor.execute(query, (sensor_ID,))
-            records = self.cursor.fetchall()
+            records = await self._fetchall(query, (sensor_ID,))
             return records
         except Exception as e:
             print(f"An error occurred: {e}")
             return []
 
     # only for ML section
-    async def get_partial_sensor_record(self, sensor_ID: int) -> list:
+    async def get_partial_sensor_record(self, sensor_ID: int, window_days: Optional[int] = None) -> list:
+        """
+        Training data: the sensor's readings, or only the last `window_days`
+        days before its latest reading, so only those monthly partitions are
+        scanned (TRAINING_WINDOW_DAYS; unset means the whole history).
+        """
+        if window_days is None:
+            window_days = int(getenv("TRAINING_WINDOW_DAYS") or 0)
         try:
             query = """
-            SELECT smort_ID, time_stamp, trash_level FROM sensor_record WHERE smort_ID = %s
+            SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS trash_level
+            FROM sensor_record WHERE smort_ID = %s
+            """
+            params = (sensor_ID,)
+            if window_days:
+                query += """AND time_stamp >= (
+                SELECT time_stamp - make_interval(days => %s) FROM sensor_latest WHERE smort_ID = %s)
             """
-            self.cursor.execute(query, (sensor_ID,))
-            records = self.cursor.fetchall()
+                params = (sensor_ID, window_days, sensor_ID)
+            records = await self._fetchall(query, params)
             return records
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -97,26 +215,84 @@ class Database:
     async def get_latest_sensor_record(self, sensor_ID: int, num_of_row: int) -> list:
         try:
             query = """
-            SELECT smort_ID, time_stamp, trash_level
+            SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS trash_level
             FROM sensor_record
             WHERE smort_ID = %s
             ORDER BY time_stamp DESC
             LIMIT %s
             """
-            self.cursor.execute(query, (sensor_ID, num_of_row))
-            records = self.cursor.fetchall()
+            records = await self._fetchall(query, (sensor_ID, num_of_row))
             return records if records else []
         except Exception as e:
             print(f"An error occurred: {e}")
             return []
 
+    async def get_latest_sensor_records(self, sensor_IDs: List[int], num_of_row: int) -> Dict[int, list]:
+        """
+        The `num_of_row` most recent (smort_ID, time_stamp, trash_level) rows of
+        every sensor in `sensor_IDs`, newest first, in one query.
+        """
+        try:
+            query = """
+            SELECT s.ID, lr.time_stamp, lr.trash_level
+            FROM unnest(%s::INTEGER[]) AS s(ID)
+            JOIN LATERAL (
+                SELECT sr.time_stamp, sr.trash_level::DECIMAL(5,2) AS trash_level
+                FROM sensor_record sr
+                WHERE sr.smort_ID = s.ID
+                ORDER BY sr.time_stamp DESC
+                LIMIT %s
+            ) lr ON TRUE
+            ORDER BY s.ID, lr.time_stamp DESC
+            """
+            records = await self._fetchall(query, (list(sensor_IDs), num_of_row))
+            latest = {sensor_ID: [] for sensor_ID in sensor_IDs}
+            for record in records:
+                latest[record[0]].append(record)
+            return latest
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return {}
+
+    async def get_latest_region_records(self, region_ID: int, num_of_row: int) -> list:
+        """
+        Every sensor of a region as (ID, latitude, longitude, name, records),
+        where records are its `num_of_row` most recent (smort_ID, time_stamp,
+        trash_level) rows, newest first: the planner's input in one query.
+        """
+        try:
+            query = """
+            SELECT s.ID, s.latitude, s.longitude, s.name, lr.time_stamp, lr.trash_level
+            FROM region_sensor rs
+            JOIN sensor s ON s.ID = rs.sensor_ID
+            LEFT JOIN LATERAL (
+                SELECT sr.time_stamp, sr.trash_level::DECIMAL(5,2) AS trash_level
+                FROM sensor_record sr
+                WHERE sr.smort_ID = s.ID
+                ORDER BY sr.time_stamp DESC
+                LIMIT %s
+            ) lr ON TRUE
+            WHERE rs.region_ID = %s
+            ORDER BY s.ID, lr.time_stamp DESC
+            """
+            rows = await self._fetchall(query, (num_of_row, region_ID))
+            sensors = {}
+            for sensor_ID, latitude, longitude, name, time_stamp, trash_level in rows:
+                if sensor_ID not in sensors:
+                    sensors[sensor_ID] = (sensor_ID, latitude, longitude, name, [])
+                if time_stamp is not None:
+                    sensors[sensor_ID][4].append((sensor_ID, time_stamp, trash_level))
+            return list(sensors.values())
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return []
+
     async def get_sensor(self, ID: int) -> dict:
         try:
             query = """
             SELECT * FROM sensor WHERE ID = %s
             """
-            self.cursor.execute(query, (ID,))
-            sensor = self.cursor.fetchone()
+            sensor = await self._fetchone(query, (ID,))
             return sensor
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -142,85 +318,222 @@ class Database:
 
             query = f"UPDATE sensor SET {', '.join(updates)} WHERE ID = %s"
             params.append(ID)
-            self.cursor.execute(query, tuple(params))
-            self.connection.commit()
+            await self._execute(query, tuple(params))
             return True
         except Exception as e:
             print(f"An error occurred: {e}")
-            self.connection.rollback()
             return False
 
     async def get_latest_sensor_trash_level(self, sensor_ID: int) -> list:
         try:
             query = """
-            SELECT * FROM sensor_record WHERE smort_ID = %s ORDER BY time_stamp DESC LIMIT 1
+            SELECT smort_ID, time_stamp, trash_level FROM sensor_latest WHERE smort_ID = %s
             """
-            self.cursor.execute(query, (sensor_ID,))
-            record = self.cursor.fetchone()
+            record = await self._fetchone(query, (sensor_ID,))
             return record
         except Exception as e:
             print(f"An error occurred: {e}")
             return []
 
-    async def add_sensor_record(self, sensor_ID: int, trash_level: float, image_base64: str) -> bool:
+    async def add_sensor_records(self, readings: list) -> Optional[List[dict]]:
+        """
+        Insert many readings with one multi-row INSERT in one transaction.
+
+        Each reading is {"sensor_ID", "trash_level", optional "time_stamp"
+        (defaults to now) and "image_base64" or "image_ref"}. Returns one result per reading,
+        in order: {"status": "inserted" | "duplicate" | "compacted" | "error"}
+        plus a "detail" for errors. A reading whose (sensor, time_stamp)
+        already exists, or appears earlier in the batch, is a duplicate, so
+        replaying a batch is harmless. With compaction enabled, readings the
+        deadband drops are acknowledged as "compacted" without being written.
+        Returns None if the batch could not be written.
+        """
+        now = datetime.now().replace(microsecond=0)
+        results = [None] * len(readings)
+        rows = {}
+        for i, reading in enumerate(readings):
+            try:
+                sensor_ID, time_stamp, trash_level, image_base64, image_ref = parse_reading(reading, now)
+                if image_base64 and image_ref is None:
+                    image_ref = await asyncio.to_thread(self.images.put, base64.b64decode(image_base64))
+            except Exception as e:
+                results[i] = {"status": "error", "detail": str(e)}
+                continue
+            key = (sensor_ID, time_stamp)
+            if key in rows:
+                results[i] = {"status": "duplicate"}
+            else:
+                rows[key] = (i, trash_level, image_ref)
+
         try:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             query = """
-            INSERT INTO sensor_record (smort_ID, trash_level, time_stamp, image)
-            VALUES (%s, %s, %s, %s)
+            INSERT INTO sensor_record (smort_ID, time_stamp, trash_level, image_ref)
+            SELECT r.smort_ID, r.time_stamp, r.trash_level, r.image_ref
+            FROM unnest(%s::integer[], %s::timestamp[], %s::numeric[], %s::char(64)[])
+                AS r(smort_ID, time_stamp, trash_level, image_ref)
+            JOIN sensor s ON s.ID = r.smort_ID
+            ON CONFLICT (smort_ID, time_stamp) DO NOTHING
+            RETURNING smort_ID, time_stamp
             """
-            print(f"[*] Executing add_sensor_record")
-            self.cursor.execute(
-                query, (sensor_ID, trash_level, timestamp, image_base64))
-            print(f"[*] Executed add_sensor_record")
-            self.connection.commit()
+            print(f"[*] Executing add_sensor_records ({len(rows)} rows)")
+            async with self.pool.connection() as conn:
+                cursor = await conn.execute(
+                    "SELECT ID FROM sensor WHERE ID = ANY(%s)", (sorted({key[0] for key in rows}),), prepare=True)
+                known = {row[0] for row in await cursor.fetchall()}
+                if self.compaction.enabled:
+                    await self._compact(conn, rows, results, known)
+                cursor = await conn.execute(query, (
+                    [key[0] for key in rows],
+                    [key[1] for key in rows],
+                    [row[1] for row in rows.values()],
+                    [row[2] for row in rows.values()],
+                ), prepare=True)
+                inserted = set(await cursor.fetchall())
             print(f"[+] Committed changes.")
-            return True
         except Exception as e:
             print(f"An error occurred: {e}")
-            self.connection.rollback()
-            return False
+            return None
+
+        for key, (i, _, _) in rows.items():
+            if key in inserted:
+                results[i] = {"status": "inserted"}
+            elif key[0] not in known:
+                results[i] = {"status": "error", "detail": f"Unknown sensor {key[0]}"}
+            else:
+                results[i] = {"status": "duplicate"}
+        for sensor_ID in {key[0] for key in inserted}:
+            self._notify_record(sensor_ID)
+        return results
+
+    async def _compact(self, conn, rows: dict, results: list, known: set) -> None:
+        """Drop readings the deadband makes redundant from `rows` (see compaction.py)."""
+        by_sensor = {}
+        for key, (i, trash_level, image_ref) in rows.items():
+            if key[0] in known:
+                by_sensor.setdefault(key[0], []).append((key, trash_level))
+
+        # Locking the sensors' latest rows keeps concurrent batches for the
+        # same sensor from deciding against the same "last stored" reading
+        cursor = await conn.execute("""
+            SELECT smort_ID, time_stamp, trash_level FROM sensor_latest
+            WHERE smort_ID = ANY(%s) FOR UPDATE
+            """, (sorted(by_sensor),), prepare=True)
+        latest = {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
 
-    async def get_sensor_records(self, sensor_ID: int) -> list:
+        for sensor_ID, readings in by_sensor.items():
+            keep = self.compaction.select(sensor_ID, latest.get(sensor_ID),
+                                          [(key[1], level) for key, level in readings])
+            for (key, _), kept in zip(readings, keep):
+                if not kept:
+                    results[rows.pop(key)[0]] = {"status": "compacted"}
+
+    async def get_record_image_ref(self, sensor_ID: int, time_stamp: datetime) -> Optional[str]:
         try:
             query = """
-            SELECT * FROM sensor_record WHERE smort_ID = %s
+            SELECT image_ref FROM sensor_record WHERE smort_ID = %s AND time_stamp = %s
             """
-            self.cursor.execute(query, (sensor_ID,))
-            records = self.cursor.fetchall()
+            record = await self._fetchone(query, (sensor_ID, time_stamp))
+            return record[0] if record else None
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+
+    @staticmethod
+    def _sensor_records_query(sensor_ID: int, start: Optional[datetime], end: Optional[datetime],
+                              after: Optional[datetime], limit: Optional[int], descending: bool):
+        # Keyset pagination on the (smort_ID, time_stamp) primary key: every
+        # page is an index range scan, however deep into the history it starts
+        conditions = ["smort_ID = %s"]
+        params = [sensor_ID]
+        if start is not None:
+            conditions.append("time_stamp >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("time_stamp < %s")
+            params.append(end)
+        if after is not None:
+            conditions.append("time_stamp < %s" if descending else "time_stamp > %s")
+            params.append(after)
+        query = f"""
+            SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS trash_level, image_ref
+            FROM sensor_record
+            WHERE {' AND '.join(conditions)}
+            ORDER BY time_stamp {'DESC' if descending else 'ASC'}
+            """
+        if limit is not None:
+            query += "LIMIT %s"
+            params.append(limit)
+        return query, tuple(params)
+
+    async def get_sensor_records(self, sensor_ID: int, start: Optional[datetime] = None,
+                                 end: Optional[datetime] = None, after: Optional[datetime] = None,
+                                 limit: Optional[int] = None, descending: bool = False) -> list:
+        """
+        A sensor's readings in [start, end), ordered by time. `after` is the
+        time_stamp of the last row of the previous page.
+        """
+        try:
+            query, params = self._sensor_records_query(sensor_ID, start, end, after, limit, descending)
+            records = await self._fetchall(query, params)
             return records
         except Exception as e:
             print(f"An error occurred: {e}")
             return []
 
+    async def stream_sensor_records(self, sensor_ID: int, start: Optional[datetime] = None,
+                                    end: Optional[datetime] = None, after: Optional[datetime] = None,
+                                    limit: Optional[int] = None, descending: bool = False,
+                                    batch_size: int = 1000) -> AsyncIterator[tuple]:
+        """
+        Same rows as get_sensor_records(), read through a server-side cursor
+        `batch_size` rows at a time so the whole range is never held in memory.
+        Errors are re-raised: the response has already started, so aborting
+        it is the only way the client can tell the body is incomplete.
+        """
+        query, params = self._sensor_records_query(sensor_ID, start, end, after, limit, descending)
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor(name="sensor_records") as cursor:
+                    cursor.itersize = batch_size
+                    await cursor.execute(query, params)
+                    async for record in cursor:
+                        yield record
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            raise
+
     async def get_latest_trash_levels_in_region(self, region_ID: int) -> list:
         try:
             query = """
             SELECT
-                s.ID AS sensor_ID,
-                sr.trash_level,
-                sr.time_stamp
+                sl.smort_ID AS sensor_ID,
+                sl.trash_level,
+                sl.time_stamp
             FROM
-                sensor_record sr
-            JOIN
-                sensor s ON sr.smort_ID = s.ID
-            JOIN
-                region_sensor rs ON s.ID = rs.sensor_ID
+                region_sensor rs
             JOIN
-                region r ON rs.region_ID = r.ID
+                sensor_latest sl ON sl.smort_ID = rs.sensor_ID
             WHERE
-                r.ID = %s
-                AND sr.time_stamp = (
-                    SELECT MAX(time_stamp)
-                    FROM sensor_record
-                    WHERE smort_ID = s.ID
-                )
+                rs.region_ID = %s
             ORDER BY
-                s.ID;
+                sl.smort_ID;
             """
 
-            self.cursor.execute(query, (region_ID,))
-            results = self.cursor.fetchall()
+            results = await self._fetchall(query, (region_ID,))
+            return results
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return []
+
+    async def get_latest_trash_levels(self, sensor_IDs: List[int]) -> list:
+        try:
+            query = """
+            SELECT smort_ID, time_stamp, trash_level
+            FROM sensor_latest
+            WHERE smort_ID = ANY(%s)
+            ORDER BY smort_ID
+            """
+            results = await self._fetchall(query, (list(sensor_IDs),))
             return results
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -229,15 +542,6 @@ class Database:
     async def get_average_trash_levels_all_sensors_in_region(self, region_ID: int) -> list:
         try:
             query = """
-                    WITH latest_records AS (
-                        SELECT
-                            sr.smort_ID,
-                            sr.trash_level,
-                            sr.time_stamp,
-                            ROW_NUMBER() OVER (PARTITION BY sr.smort_ID ORDER BY sr.time_stamp DESC) AS rn
-                        FROM
-                            sensor_record sr
-                    )
                     SELECT
                         r.ID AS region_ID,
                         r.name AS region_name,
@@ -250,18 +554,21 @@ class Database:
                         region_sensor rs ON r.ID = rs.region_ID
                     JOIN
                         sensor s ON rs.sensor_ID = s.ID
-                    JOIN
-                        latest_records lr ON s.ID = lr.smort_ID
+                    JOIN LATERAL (
+                        SELECT sr.trash_level::DECIMAL(5,2) AS trash_level
+                        FROM sensor_record sr
+                        WHERE sr.smort_ID = s.ID
+                        ORDER BY sr.time_stamp DESC
+                        LIMIT 6
+                    ) lr ON TRUE
                     WHERE
-                        lr.rn <= 6
-                        AND r.ID = %s
+                        r.ID = %s
                     GROUP BY
                         r.ID, r.name, s.ID, s.name
                     ORDER BY
                         r.ID, s.ID;
                 """
-            self.cursor.execute(query, (region_ID,))
-            results = self.cursor.fetchall()
+            results = await self._fetchall(query, (region_ID,))
             return results
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -270,15 +577,6 @@ class Database:
     async def get_average_trash_levels_all_sensors(self) -> list:
         try:
             query = """
-                WITH latest_records AS (
-                    SELECT
-                        sr.smort_ID,
-                        sr.trash_level,
-                        sr.time_stamp,
-                        ROW_NUMBER() OVER (PARTITION BY sr.smort_ID ORDER BY sr.time_stamp DESC) AS rn
-                    FROM
-                        sensor_record sr
-                )
                 SELECT
                     r.ID AS region_ID,
                     r.name AS region_name,
@@ -291,17 +589,98 @@ class Database:
                     region_sensor rs ON r.ID = rs.region_ID
                 JOIN
                     sensor s ON rs.sensor_ID = s.ID
-                JOIN
-                    latest_records lr ON s.ID = lr.smort_ID
-                WHERE
-                    lr.rn <= 6
+                JOIN LATERAL (
+                    SELECT sr.trash_level::DECIMAL(5,2) AS trash_level
+                    FROM sensor_record sr
+                    WHERE sr.smort_ID = s.ID
+                    ORDER BY sr.time_stamp DESC
+                    LIMIT 6
+                ) lr ON TRUE
                 GROUP BY
                     r.ID, r.name, s.ID, s.name
                 ORDER BY
                     r.ID, s.ID;
             """
-            self.cursor.execute(query)
-            results = self.cursor.fetchall()
+            results = await self._fetchall(query)
+            return results
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return []
+
+    @staticmethod
+    def _rollup_range(start: Optional[datetime], end: Optional[datetime]):
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("AND bucket >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("AND bucket < %s")
+            params.append(end)
+        return " ".join(conditions), params
+
+    async def get_sensor_rollup(self, sensor_ID: int, resolution: str = "hour",
+                                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                limit: int = 168) -> list:
+        """
+        (bucket, min, max, avg, readings, last) per hour or day, the newest
+        `limit` buckets in [start, end), oldest first.
+        """
+        try:
+            table = ROLLUP_TABLES[resolution]
+            conditions, params = self._rollup_range(start, end)
+            query = f"""
+                SELECT bucket, min_level, max_level,
+                       ROUND(sum_level / NULLIF(readings, 0), 2) AS avg_level,
+                       readings, last_level
+                FROM (
+                    SELECT * FROM {table}
+                    WHERE smort_ID = %s {conditions}
+                    ORDER BY bucket DESC
+                    LIMIT %s
+                ) latest
+                ORDER BY bucket
+            """
+            results = await self._fetchall(query, (sensor_ID, *params, limit))
+            return results
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return []
+
+    async def get_region_rollup(self, region_ID: int, resolution: str = "hour",
+                                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                limit: int = 168) -> list:
+        """
+        (bucket, min, max, avg, readings, sensors) across a region's sensors,
+        from each sensor's newest `limit` buckets in [start, end).
+        """
+        try:
+            table = ROLLUP_TABLES[resolution]
+            conditions, params = self._rollup_range(start, end)
+            query = f"""
+                SELECT
+                    ru.bucket,
+                    MIN(ru.min_level) AS min_level,
+                    MAX(ru.max_level) AS max_level,
+                    ROUND(SUM(ru.sum_level) / NULLIF(SUM(ru.readings), 0), 2) AS avg_level,
+                    SUM(ru.readings) AS readings,
+                    COUNT(*) AS sensors
+                FROM
+                    region_sensor rs
+                JOIN LATERAL (
+                    SELECT * FROM {table}
+                    WHERE smort_ID = rs.sensor_ID {conditions}
+                    ORDER BY bucket DESC
+                    LIMIT %s
+                ) ru ON TRUE
+                WHERE
+                    rs.region_ID = %s
+                GROUP BY
+                    ru.bucket
+                ORDER BY
+                    ru.bucket
+            """
+            results = await self._fetchall(query, (*params, limit, region_ID))
             return results
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -309,15 +688,21 @@ class Database:
 
 
 if __name__ == "__main__":
+    import asyncio
     from dotenv import load_dotenv
 
     load_dotenv()
 
-    db = Database(getenv("DB_HOST"), getenv("DB_PORT"), getenv(
-        "DB_USER"), getenv("DB_PASSWORD"), getenv("DB_NAME"))
-    db.check_connection()
+    async def main():
+        db = Database(getenv("DB_HOST"), getenv("DB_PORT"), getenv(
+            "DB_USER"), getenv("DB_PASSWORD"), getenv("DB_NAME"))
+        await db.open()
+        try:
+            await db.check_connection()
 
-    dataRow = db.get_sensor_record(1)
-    print(dataRow)
+            dataRow = await db.get_sensor_record(1)
+            print(dataRow)
+        finally:
+            await db.close_connection()
 
-    db.close_connection()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
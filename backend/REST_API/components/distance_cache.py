@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+import time
+from os import getenv
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_TTL_DAYS = 30
+# Coordinates are rounded to ~0.1 m so the same bin always maps to the same key
+COORDINATE_DECIMALS = 6
+
+
+def default_cache_path() -> str:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return getenv("DISTANCE_CACHE_PATH") or os.path.abspath(
+        os.path.join(base_dir, '..', 'cache', 'distances.sqlite3'))
+
+
+def point_key(point: str) -> str:
+    """Canonical "lat,lng" key of a coordinate string."""
+    latitude, longitude = (float(part) for part in point.split(','))
+    return f"{latitude:.{COORDINATE_DECIMALS}f},{longitude:.{COORDINATE_DECIMALS}f}"
+
+
+class DistanceCache:
+    """
+    Persistent cache of road distances between coordinate pairs.
+
+    Bins do not move, so bin-to-bin distances fetched from the Distance
+    Matrix API stay valid; only pairs involving a new driver origin are
+    missing. Entries older than `ttl_days` (DISTANCE_CACHE_TTL_DAYS; 0
+    keeps them forever) count as missing so road changes are eventually
+    picked up. Stored in SQLite so it survives restarts without a schema
+    change.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_days: Optional[float] = None):
+        if ttl_days is None:
+            ttl_days = float(getenv("DISTANCE_CACHE_TTL_DAYS") or DEFAULT_TTL_DAYS)
+        self.path = path or default_cache_path()
+        self.ttl_s = ttl_days * 86400
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS distance (
+                    origin TEXT NOT NULL,
+                    destination TEXT NOT NULL,
+                    metres INTEGER NOT NULL,
+                    seconds INTEGER,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (origin, destination)
+                ) WITHOUT ROWID
+                """)
+
+    def get_many(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """Cached metres for each fresh (origin, destination) pair; missing pairs are left out."""
+        keys = {(point_key(origin), point_key(destination)): (origin, destination)
+                for origin, destination in pairs}
+        found = {}
+        oldest = time.time() - self.ttl_s if self.ttl_s > 0 else float("-inf")
+        with self._lock:
+            by_origin: Dict[str, List[str]] = {}
+            for origin, destination in keys:
+                by_origin.setdefault(origin, []).append(destination)
+            for origin, destinations in by_origin.items():
+                placeholders = ",".join("?" * len(destinations))
+                rows = self._conn.execute(
+                    f"""
+                    SELECT destination, metres FROM distance
+                    WHERE origin = ? AND destination IN ({placeholders}) AND fetched_at >= ?
+                    """, (origin, *destinations, oldest)).fetchall()
+                for destination, metres in rows:
+                    found[keys[(origin, destination)]] = metres
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, str, int, Optional[int]]]) -> None:
+        """Store (origin, destination, metres, seconds) entries."""
+        now = time.time()
+        rows = [(point_key(origin), point_key(destination), metres, seconds, now)
+                for origin, destination, metres, seconds in entries]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO distance VALUES (?, ?, ?, ?, ?)", rows)
+
+    def purge_stale(self) -> int:
+        if self.ttl_s <= 0:
+            return 0
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM distance WHERE fetched_at < ?", (time.time() - self.ttl_s,)).rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM distance").fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,215 @@
+import asyncio
+import time
+from os import getenv
+from typing import List, Optional, Sequence, Tuple
+
+import httpx
+
+DEFAULT_BASE_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+# Distance Matrix API limits per request
+MAX_DIMENSION = 25
+MAX_ELEMENTS = 100
+DEFAULT_CONCURRENCY = 4
+DEFAULT_ELEMENTS_PER_S = 1000
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF_S = 0.5
+# Statuses worth retrying; anything else (REQUEST_DENIED, INVALID_REQUEST, ...) will not get better
+RETRYABLE_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+class DistanceMatrixError(RuntimeError):
+    """The API refused or kept failing a tile."""
+
+
+def tiles(origins: int, destinations: int, max_dimension: int = MAX_DIMENSION,
+          max_elements: int = MAX_ELEMENTS) -> List[Tuple[slice, slice]]:
+    """Split an origins x destinations matrix into blocks the API accepts in one request."""
+    columns = min(destinations, max_dimension, max_elements)
+    rows = min(origins, max_dimension, max(max_elements // columns, 1))
+    return [(slice(r, min(r + rows, origins)), slice(c, min(c + columns, destinations)))
+            for r in range(0, origins, rows) for c in range(0, destinations, columns)]
+
+
+class _RateLimiter:
+    """Token bucket over matrix elements, so bursts of tiles stay under the API's quota."""
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.tokens = per_second
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, elements: int) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.per_second, self.tokens + (now - self.updated) * self.per_second)
+                self.updated = now
+                if self.tokens >= elements or self.tokens >= self.per_second:
+                    self.tokens -= elements
+                    return
+                await asyncio.sleep((elements - self.tokens) / self.per_second)
+
+
+class DistanceMatrixClient:
+    """
+    Async Distance Matrix API client.
+
+    A request larger than the API allows (25 origins or destinations, 100
+    elements) is split into tiles that are fetched concurrently, at most
+    `concurrency` at a time and `elements_per_s` elements per second, over
+    one pooled HTTP connection set. Failed tiles are retried with
+    exponential backoff; the tiles are stitched back into a single
+    response in the API's own format.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, concurrency: Optional[int] = None,
+                 elements_per_s: Optional[float] = None, retries: Optional[int] = None,
+                 timeout_s: float = 30.0):
+        if concurrency is None:
+            concurrency = int(getenv("DISTANCE_MATRIX_CONCURRENCY") or DEFAULT_CONCURRENCY)
+        if elements_per_s is None:
+            elements_per_s = float(getenv("DISTANCE_MATRIX_ELEMENTS_PER_S") or DEFAULT_ELEMENTS_PER_S)
+        if retries is None:
+            retries = int(getenv("DISTANCE_MATRIX_RETRIES") or DEFAULT_RETRIES)
+        self.api_key = api_key
+        self.base_url = base_url or getenv("DISTANCE_MATRIX_URL") or DEFAULT_BASE_URL
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout_s = timeout_s
+        self._rate = _RateLimiter(elements_per_s)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.retried = 0
+
+    def _session(self) -> httpx.AsyncClient:
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            self._client = httpx.AsyncClient(timeout=self.timeout_s, limits=limits)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_tile(self, origins: Sequence[str], destinations: Sequence[str]) -> List[dict]:
+        params = {
+            "origins": "|".join(origins),
+            "destinations": "|".join(destinations),
+            "key": self.api_key
+        }
+        for attempt in range(self.retries + 1):
+            await self._rate.acquire(len(origins) * len(destinations))
+            async with self._semaphore:
+                self.requests += 1
+                try:
+                    response = await self._session().get(self.base_url, params=params)
+                    if response.status_code >= 500 or response.status_code == 429:
+                        problem = f"HTTP {response.status_code}"
+                    else:
+                        response.raise_for_status()
+                        data = response.json()
+                        status = data.get("status")
+                        if status == "OK":
+                            return data["rows"]
+                        if status not in RETRYABLE_STATUSES:
+                            raise DistanceMatrixError(f"Distance Matrix API failed: {status}")
+                        problem = status
+                except httpx.TransportError as e:
+                    problem = str(e) or type(e).__name__
+            if attempt < self.retries:
+                self.retried += 1
+                await asyncio.sleep(RETRY_BACKOFF_S * 2 ** attempt)
+        raise DistanceMatrixError(f"Distance Matrix API failed after {self.retries + 1} attempts: {problem}")
+
+    async def get_distance_matrix(self, origins: Sequence[str], destinations: Sequence[str]) -> dict:
+        """Same response as one Distance Matrix request, for any number of origins and destinations."""
+        blocks = tiles(len(origins), len(destinations))
+        results = await asyncio.gather(*(self._fetch_tile(origins[r], destinations[c]) for r, c in blocks))
+
+        rows = [{"elements": [None] * len(destinations)} for _ in origins]
+        for (r, c), tile_rows in zip(blocks, results):
+            for i, row in zip(range(r.start, r.stop), tile_rows):
+                rows[i]["elements"][c] = row["elements"]
+        return {"status": "OK", "rows": rows}
+
+
+def check(origins: int = 40, destinations: int = 60) -> None:
+    """
+    Fetch a 40 x 60 matrix from a local stand-in server that enforces the
+    API's size limits, computes haversine distances, and fails a share of
+    requests with HTTP 500 or OVER_QUERY_LIMIT; the stitched result must
+    equal the direct computation.
+    """
+    import json
+    import random
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    from distance_provider import haversine_matrix, parse_points
+
+    flaky = random.Random(0)
+
+    class StandIn(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            tile_origins = query["origins"][0].split("|")
+            tile_destinations = query["destinations"][0].split("|")
+            roll = flaky.random()
+            if roll < 0.15:
+                self.send_response(500)
+                self.end_headers()
+                return
+            if roll < 0.3:
+                body = {"status": "OVER_QUERY_LIMIT", "rows": []}
+            elif (len(tile_origins) > MAX_DIMENSION or len(tile_destinations) > MAX_DIMENSION
+                    or len(tile_origins) * len(tile_destinations) > MAX_ELEMENTS):
+                body = {"status": "MAX_ELEMENTS_EXCEEDED", "rows": []}
+            else:
+                metres = haversine_matrix(parse_points(tile_origins), parse_points(tile_destinations))
+                body = {"status": "OK", "rows": [
+                    {"elements": [{"status": "OK", "distance": {"value": int(m)}} for m in row]}
+                    for row in metres]}
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    rng = random.Random(1)
+    points = [f"{4.35 + rng.random() * 0.05:.6f},{100.95 + rng.random() * 0.05:.6f}"
+              for _ in range(origins + destinations)]
+
+    async def main():
+        client = DistanceMatrixClient("test", base_url=f"http://127.0.0.1:{server.server_port}/",
+                                      elements_per_s=100000, retries=6)
+        client_start = time.perf_counter()
+        try:
+            data = await client.get_distance_matrix(points[:origins], points[origins:])
+        finally:
+            await client.aclose()
+        elapsed = time.perf_counter() - client_start
+
+        fetched = [[element["distance"]["value"] for element in row["elements"]] for row in data["rows"]]
+        expected = haversine_matrix(parse_points(points[:origins]), parse_points(points[origins:])).astype(int)
+        assert fetched == expected.tolist(), "stitched matrix differs"
+        print(f"{origins}x{destinations} in {len(tiles(origins, destinations))} tiles: "
+              f"{client.requests} requests ({client.retried} retried), {elapsed * 1000:.0f} ms")
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    check()
@@ -0,0 +1,280 @@
+import asyncio
+import json
+from os import getenv
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from distance_cache import DistanceCache
+from distance_matrix_client import DistanceMatrixClient
+
+EARTH_RADIUS_M = 6371008.8
+# Road distance is rarely the straight line; ~1.3 is typical for a town street grid
+DEFAULT_DETOUR_FACTOR = 1.3
+
+
+def parse_points(points: Sequence[str]) -> np.ndarray:
+    """(n, 2) array of latitude/longitude degrees from "lat,lng" strings."""
+    return np.array([[float(part) for part in point.split(',')] for point in points], dtype=float)
+
+
+def haversine_matrix(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    """Great-circle metres between every origin and destination, in one vectorized pass."""
+    lat1, lng1 = np.radians(origins[:, 0])[:, None], np.radians(origins[:, 1])[:, None]
+    lat2, lng2 = np.radians(destinations[:, 0])[None, :], np.radians(destinations[:, 1])[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class DistanceProvider:
+    """
+    Source of road distances for routing.
+
+    matrix() returns metres between every pair of "lat,lng" points. With
+    `open_route` the route starts at points[0] and never returns there,
+    so column 0 is not needed and may be left at 0.
+    """
+
+    name = "base"
+
+    async def matrix(self, points: Sequence[str], open_route: bool = False) -> np.ndarray:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class HaversineDistanceProvider(DistanceProvider):
+    """Offline: straight-line distance scaled by a detour factor (DISTANCE_DETOUR_FACTOR)."""
+
+    name = "haversine"
+
+    def __init__(self, detour_factor: Optional[float] = None):
+        if detour_factor is None:
+            detour_factor = float(getenv("DISTANCE_DETOUR_FACTOR") or DEFAULT_DETOUR_FACTOR)
+        self.detour_factor = detour_factor
+
+    async def matrix(self, points: Sequence[str], open_route: bool = False) -> np.ndarray:
+        coordinates = parse_points(points)
+        return haversine_matrix(coordinates, coordinates) * self.detour_factor
+
+
+class RoadGraphDistanceProvider(DistanceProvider):
+    """
+    Offline: shortest paths over a locally loaded road graph (ROAD_GRAPH_PATH),
+    a JSON file of the form
+
+        {"nodes": [[node_id, latitude, longitude], ...],
+         "edges": [[from_id, to_id, metres, oneway], ...]}
+
+    where `oneway` is optional and defaults to false. Points are snapped to
+    their nearest node and the snapping distance is added to both ends.
+    Pairs the graph cannot connect (a gap in the graph, one-way streets)
+    get the haversine estimate instead of an infinite distance.
+    """
+
+    name = "road"
+
+    def __init__(self, path: Optional[str] = None, detour_factor: Optional[float] = None):
+        from scipy.sparse import csr_matrix
+
+        path = path or getenv("ROAD_GRAPH_PATH")
+        if not path:
+            raise ValueError("ROAD_GRAPH_PATH is not set")
+        with open(path) as f:
+            graph = json.load(f)
+
+        index: Dict = {}
+        coordinates = []
+        for node_id, latitude, longitude in graph["nodes"]:
+            index[node_id] = len(coordinates)
+            coordinates.append((latitude, longitude))
+        self.nodes = np.array(coordinates, dtype=float)
+
+        rows, cols, lengths = [], [], []
+        for edge in graph["edges"]:
+            start, end, metres = index[edge[0]], index[edge[1]], float(edge[2])
+            oneway = len(edge) > 3 and bool(edge[3])
+            rows.append(start); cols.append(end); lengths.append(metres)
+            if not oneway:
+                rows.append(end); cols.append(start); lengths.append(metres)
+        self.graph = csr_matrix((lengths, (rows, cols)), shape=(len(self.nodes), len(self.nodes)))
+        self.fallback = HaversineDistanceProvider(detour_factor)
+
+    def snap(self, coordinates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest graph node of each point, and the distance to it."""
+        distances = haversine_matrix(coordinates, self.nodes)
+        nearest = np.argmin(distances, axis=1)
+        return nearest, distances[np.arange(len(coordinates)), nearest]
+
+    def _shortest_paths(self, points: Sequence[str]) -> np.ndarray:
+        from scipy.sparse.csgraph import dijkstra
+
+        coordinates = parse_points(points)
+        nearest, offsets = self.snap(coordinates)
+        sources, inverse = np.unique(nearest, return_inverse=True)
+        paths = dijkstra(self.graph, directed=True, indices=sources)
+        matrix = paths[inverse][:, nearest] + offsets[:, None] + offsets[None, :]
+        np.fill_diagonal(matrix, 0.0)
+
+        unreachable = ~np.isfinite(matrix)
+        if unreachable.any():
+            print(f"Warning: {int(unreachable.sum())} point pairs are not connected in the road graph; "
+                  f"using {self.fallback.name} distances for them")
+            estimate = haversine_matrix(coordinates, coordinates) * self.fallback.detour_factor
+            matrix[unreachable] = estimate[unreachable]
+        return matrix
+
+    async def matrix(self, points: Sequence[str], open_route: bool = False) -> np.ndarray:
+        return await asyncio.to_thread(self._shortest_paths, points)
+
+
+class GoogleDistanceProvider(DistanceProvider):
+    """
+    Google Distance Matrix API, through a persistent DistanceCache so only
+    pairs not seen before are requested: with a new driver location that
+    is just the origin-to-bins row. Requests go through a tiling
+    DistanceMatrixClient, so regions of any size fit the API's limits.
+    """
+
+    name = "google"
+
+    def __init__(self, api_key: str, cache: Optional[DistanceCache] = None,
+                 client: Optional[DistanceMatrixClient] = None):
+        self.api_key = api_key
+        self.cache = cache if cache is not None else DistanceCache()
+        self.client = client if client is not None else DistanceMatrixClient(api_key)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def _fetch_into_cache(self, origins: List[str], destinations: List[str]) -> dict:
+        data = await self.client.get_distance_matrix(origins, destinations)
+        if data.get('status') != 'OK':
+            raise RuntimeError(f"Distance Matrix API failed: {data.get('status')}")
+
+        entries = []
+        for origin, row in zip(origins, data['rows']):
+            for destination, element in zip(destinations, row['elements']):
+                if element.get('status', 'OK') == 'OK':
+                    duration = element.get('duration', {}).get('value')
+                    entries.append((origin, destination, element['distance']['value'], duration))
+        await asyncio.to_thread(self.cache.put_many, entries)
+        return {(origin, destination): metres for origin, destination, metres, _ in entries}
+
+    async def matrix(self, points: Sequence[str], open_route: bool = False) -> np.ndarray:
+        n = len(points)
+        first = 1 if open_route else 0
+        needed = [(points[i], points[j]) for i in range(n) for j in range(first, n) if i != j]
+        # SQLite I/O stays off the event loop
+        known = await asyncio.to_thread(self.cache.get_many, needed)
+
+        missing: Dict[str, List[str]] = {}
+        for origin, destination in needed:
+            if (origin, destination) not in known:
+                missing.setdefault(origin, []).append(destination)
+
+        # Only missing pairs are billed. Origins missing the same destinations
+        # share a request: the driver's row in one, the column into a new bin
+        # (every other bin missing just that one) in another. Origins missing
+        # each other, as in a cold region, share one whose only extra
+        # elements are the origins to themselves.
+        with_self: Dict[frozenset, List[str]] = {}
+        for origin, destinations in missing.items():
+            with_self.setdefault(frozenset(destinations) | {origin}, []).append(origin)
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for points_missing, origins in with_self.items():
+            if len(origins) > 1 and points_missing.issuperset(origins):
+                groups[tuple(point for point in points if point in points_missing)] = origins
+            else:
+                for origin in origins:
+                    groups.setdefault(tuple(missing[origin]), []).append(origin)
+        for destinations, origins in groups.items():
+            known.update(await self._fetch_into_cache(origins, list(destinations)))
+
+        matrix = np.zeros((n, n))
+        for i, j in ((i, j) for i in range(n) for j in range(first, n) if i != j):
+            pair = (points[i], points[j])
+            if pair not in known:
+                raise RuntimeError(f"No route from {pair[0]} to {pair[1]}")
+            matrix[i, j] = known[pair]
+        return matrix
+
+
+class FallbackDistanceProvider(DistanceProvider):
+    """Use `primary`, and `fallback` whenever it fails (network outage, quota, no route)."""
+
+    def __init__(self, primary: DistanceProvider, fallback: DistanceProvider):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    async def matrix(self, points: Sequence[str], open_route: bool = False) -> np.ndarray:
+        try:
+            return await self.primary.matrix(points, open_route)
+        except Exception as e:
+            print(f"An error occurred: {e}; using {self.fallback.name} distances")
+            return await self.fallback.matrix(points, open_route)
+
+    async def aclose(self) -> None:
+        await self.primary.aclose()
+        await self.fallback.aclose()
+
+
+def get_provider(api_key: Optional[str] = None) -> DistanceProvider:
+    """
+    Provider named by DISTANCE_PROVIDER: "google" (the default when an API
+    key is configured; falls back to haversine when Google is unreachable),
+    "road" or "haversine".
+    """
+    api_key = api_key or getenv("GOOGLE_MAPS_API_KEY")
+    kind = (getenv("DISTANCE_PROVIDER") or ("google" if api_key else "haversine")).lower()
+    if kind == "haversine":
+        return HaversineDistanceProvider()
+    if kind == "road":
+        return RoadGraphDistanceProvider()
+    if kind == "google":
+        return FallbackDistanceProvider(GoogleDistanceProvider(api_key), HaversineDistanceProvider())
+    raise ValueError(f"Unknown DISTANCE_PROVIDER: {kind}")
+
+
+def benchmark(sizes=(10, 100, 1000), grid: int = 40, spacing_m: float = 100.0) -> None:
+    """
+    Time the offline providers and check the road graph on a synthetic
+    street grid, where the shortest path is the Manhattan distance.
+    """
+    import os
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(0)
+    origin = np.array([4.38, 100.97])
+    degree = spacing_m / (EARTH_RADIUS_M * np.pi / 180)  # latitude degrees per block
+
+    nodes = [[r * grid + c, origin[0] + r * degree, origin[1] + c * degree] for r in range(grid) for c in range(grid)]
+    edges = [[r * grid + c, r * grid + c + 1, spacing_m] for r in range(grid) for c in range(grid - 1)]
+    edges += [[r * grid + c, (r + 1) * grid + c, spacing_m] for r in range(grid - 1) for c in range(grid)]
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, 'w') as f:
+        json.dump({"nodes": nodes, "edges": edges}, f)
+
+    try:
+        road = RoadGraphDistanceProvider(path)
+        haversine = HaversineDistanceProvider()
+        for size in sizes:
+            cells = rng.integers(0, grid, (size, 2))
+            points = [f"{origin[0] + r * degree},{origin[1] + c * degree}" for r, c in cells]
+            for provider in (haversine, road):
+                start = time.perf_counter()
+                matrix = asyncio.run(provider.matrix(points))
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"{provider.name:>10} {size:>5} points: {elapsed:8.1f} ms")
+            manhattan = np.abs(cells[:, None, :] - cells[None, :, :]).sum(axis=2) * spacing_m
+            error = np.abs(matrix - manhattan).max()
+            assert error < 1.0, f"road graph off by {error:.2f} m"
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import Dict, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_TTL_SECONDS = 300
+
+
+class _Entry:
+    def __init__(self, time_stamp, version: str, forecast: dict, expires_at: float):
+        self.time_stamp = time_stamp
+        self.version = version
+        self.forecast = forecast
+        self.expires_at = expires_at
+
+
+class ForecastCache:
+    """
+    Time-to-full forecasts keyed by (sensor_id, latest time_stamp, model version).
+
+    A forecast only changes when a new reading arrives or the model is
+    retrained, so ingestion invalidates the sensor's entry and lookups check
+    the model version. The TTL bounds staleness when a reading is written by
+    another process; size is bounded with LRU eviction.
+
+    A forecast is computed from a reading fetched after an await, so callers
+    take the sensor's generation() before reading and pass it to put(); a
+    put whose generation was invalidated in between is dropped rather than
+    caching a forecast of an older reading.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        if max_entries is None:
+            max_entries = int(getenv("FORECAST_CACHE_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES)
+        if ttl_seconds is None:
+            ttl_seconds = float(getenv("FORECAST_CACHE_TTL_SECONDS") or DEFAULT_TTL_SECONDS)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sensor_id: int, version: Optional[str], time_stamp=None) -> Optional[dict]:
+        """
+        Cached forecast for the sensor, or None. `time_stamp`, when known,
+        must match the latest reading the forecast was computed from.
+        """
+        with self._lock:
+            entry = self._entries.get(sensor_id)
+            if entry is None or version is None:
+                self.misses += 1
+                return None
+            if (entry.expires_at <= time.monotonic() or entry.version != version
+                    or (time_stamp is not None and entry.time_stamp != time_stamp)):
+                del self._entries[sensor_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(sensor_id)
+            self.hits += 1
+            return dict(entry.forecast)
+
+    def peek(self, sensor_id: int) -> Optional[dict]:
+        """Last forecast stored for the sensor, however stale; not counted in stats."""
+        with self._lock:
+            entry = self._entries.get(sensor_id)
+            return dict(entry.forecast) if entry is not None else None
+
+    def generation(self, sensor_id: int) -> Tuple[int, int]:
+        """Changes whenever the sensor's entry (or the whole cache) is invalidated."""
+        with self._lock:
+            return self._epoch, self._generations.get(sensor_id, 0)
+
+    def put(self, sensor_id: int, time_stamp, version: Optional[str], forecast: dict,
+            generation: Optional[Tuple[int, int]] = None) -> None:
+        if version is None:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(sensor_id, 0)):
+                return  # a newer reading arrived while this forecast was computed
+            self._entries[sensor_id] = _Entry(time_stamp, version, dict(forecast),
+                                              time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(sensor_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sensor_id: Optional[int] = None) -> None:
+        with self._lock:
+            if sensor_id is None:
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                self._entries.pop(sensor_id, None)
+                self._generations[sensor_id] = self._generations.get(sensor_id, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_cache: Optional[ForecastCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_forecast_cache() -> ForecastCache:
+    """Shared forecast cache (one per process)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ForecastCache()
+        return _cache
@@ -0,0 +1,190 @@
+import os
+import time
+from typing import List, Sequence
+
+import numpy as np
+
+
+class CompiledForest:
+    """
+    Tree ensembles flattened into contiguous node arrays.
+
+    All trees of one or more forests share the `feature`, `threshold`,
+    `children` and `value` arrays; `roots[f]` lists the root node of every
+    tree of forest f. Leaves point back to themselves, so every row can be
+    pushed through exactly `max_depth` vectorized steps regardless of where
+    its path ends. Rows are compared as float32 (like sklearn's trees) and
+    tree outputs are accumulated in tree order, so predictions match
+    `RandomForestRegressor.predict` bit for bit. Inputs must not contain NaN.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, n_trees: np.ndarray, max_depth: int):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int64)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = np.ascontiguousarray(children, dtype=np.int64)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int64)
+        self.n_trees = np.ascontiguousarray(n_trees, dtype=np.float64)
+        self.max_depth = int(max_depth)
+
+    @property
+    def n_forests(self) -> int:
+        return self.roots.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.children,
+                                      self.value, self.roots, self.n_trees))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict every row with the first (usually only) forest."""
+        X = np.asarray(X)
+        return self.predict_rows(np.zeros(X.shape[0], dtype=np.int64), X)
+
+    def predict_rows(self, forests: np.ndarray, X: np.ndarray) -> np.ndarray:
+        """Predict row i with forest `forests[i]`, all rows and trees at once."""
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_offset = np.arange(n_rows, dtype=np.int64) * n_features
+
+        # (trees, rows): one traversal state per tree per row
+        nodes = self.roots[forests].T.copy()
+        for _ in range(self.max_depth):
+            x = flat_X[self.feature[nodes] + row_offset]
+            nodes = self.children[2 * nodes + (x > self.threshold[nodes])]
+
+        # cumsum adds tree by tree, the same order sklearn accumulates in
+        y = np.cumsum(self.value[nodes], axis=0)[-1]
+        return y / self.n_trees[forests]
+
+    def save(self, path: str) -> None:
+        # Written beside the target and renamed so readers never see half a file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, feature=self.feature, threshold=self.threshold, children=self.children,
+                     value=self.value, roots=self.roots, n_trees=self.n_trees,
+                     max_depth=np.array(self.max_depth))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        with np.load(path) as data:
+            return cls(data['feature'], data['threshold'], data['children'], data['value'],
+                       data['roots'], data['n_trees'], int(data['max_depth']))
+
+    @classmethod
+    def stack(cls, forests: Sequence["CompiledForest"]) -> "CompiledForest":
+        """Combine single forests so one call can evaluate rows of different sensors."""
+        n_nodes = [len(f.feature) for f in forests]
+        offsets = np.concatenate([[0], np.cumsum(n_nodes)[:-1]]).astype(np.int64)
+        max_trees = max(f.roots.shape[1] for f in forests)
+
+        # Forests with fewer trees are padded with a zero-valued leaf, which
+        # leaves their cumulative sum unchanged
+        pad = int(np.sum(n_nodes))
+        roots = np.full((len(forests), max_trees), pad, dtype=np.int64)
+        for i, (forest, offset) in enumerate(zip(forests, offsets)):
+            roots[i, :forest.roots.shape[1]] = forest.roots[0] + offset
+
+        return cls(
+            np.concatenate([f.feature for f in forests] + [[0]]),
+            np.concatenate([f.threshold for f in forests] + [[np.inf]]),
+            np.concatenate([f.children + offset for f, offset in zip(forests, offsets)]
+                           + [[pad, pad]]),
+            np.concatenate([f.value for f in forests] + [[0.0]]),
+            roots,
+            np.concatenate([f.n_trees[:1] for f in forests]),
+            max(f.max_depth for f in forests),
+        )
+
+
+def compile_forest(model) -> CompiledForest:
+    """Flatten a fitted single-output sklearn forest into a CompiledForest."""
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    if any(tree.n_outputs != 1 for tree in trees):
+        raise ValueError("Only single-output forests can be compiled.")
+
+    n_nodes = [tree.node_count for tree in trees]
+    offsets = np.concatenate([[0], np.cumsum(n_nodes)[:-1]]).astype(np.int64)
+    total = int(np.sum(n_nodes))
+
+    feature = np.empty(total, dtype=np.int64)
+    threshold = np.empty(total, dtype=np.float64)
+    children = np.empty(2 * total, dtype=np.int64)
+    value = np.empty(total, dtype=np.float64)
+
+    for tree, offset, n in zip(trees, offsets, n_nodes):
+        nodes = np.arange(offset, offset + n)
+        leaf = tree.children_left == -1
+        feature[nodes] = np.where(leaf, 0, tree.feature)
+        threshold[nodes] = np.where(leaf, np.inf, tree.threshold)
+        children[2 * nodes] = np.where(leaf, nodes, tree.children_left + offset)
+        children[2 * nodes + 1] = np.where(leaf, nodes, tree.children_right + offset)
+        value[nodes] = tree.value[:, 0, 0]
+
+    return CompiledForest(feature, threshold, children, value, offsets[None, :],
+                          np.array([len(trees)]), max(tree.max_depth for tree in trees))
+
+
+def compiled_model_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def benchmark(model_dir: str, sensor_ids: List[int], repeats: int = 50) -> None:
+    import joblib
+    import pandas as pd
+    from rollout import FEATURES, array_predictor, rollout
+
+    rng = np.random.default_rng(42)
+    for sensor_id in sensor_ids:
+        model_path = os.path.join(model_dir, f"sensor_{sensor_id}_model.joblib")
+        if not os.path.exists(model_path):
+            print(f"Warning: Model file not found for sensor {sensor_id}")
+            continue
+        model = joblib.load(model_path)
+        compiled = compile_forest(model)
+
+        for batch in (1, 16, 256):
+            X = np.column_stack([
+                rng.integers(0, 24, batch), rng.integers(0, 7, batch), rng.integers(1, 13, batch),
+                rng.integers(0, 2, batch), rng.uniform(0, 100, (batch, 3)),
+            ]).astype(np.float64)
+            frame = pd.DataFrame(X, columns=FEATURES)
+
+            expected = model.predict(frame)
+            actual = compiled.predict(X)
+            assert np.array_equal(expected, actual), f"sensor {sensor_id}: compiled output differs"
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                model.predict(frame)
+            sklearn_us = (time.perf_counter() - start) / repeats * 1e6
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                compiled.predict(X)
+            compiled_us = (time.perf_counter() - start) / repeats * 1e6
+
+            print(f"sensor {sensor_id} batch {batch:>3}: model.predict {sklearn_us:9.1f} us, "
+                  f"compiled {compiled_us:7.1f} us ({sklearn_us / compiled_us:.0f}x)")
+
+        last = pd.Timestamp("2025-04-26 22:45:00")
+        levels = (20.0, 19.5, 19.0)
+        start = time.perf_counter()
+        sklearn_result = rollout(array_predictor(model), last, levels, threshold=101, max_steps=1000)
+        sklearn_s = time.perf_counter() - start
+        start = time.perf_counter()
+        compiled_result = rollout(compiled.predict, last, levels, threshold=101, max_steps=1000)
+        compiled_s = time.perf_counter() - start
+        assert sklearn_result == compiled_result
+        print(f"sensor {sensor_id} 1000-step rollout: trees {sklearn_s * 1e3:.0f} ms, "
+              f"compiled {compiled_s * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    from model_registry import default_model_directory
+
+    benchmark(default_model_directory(), list(range(1, 10)))
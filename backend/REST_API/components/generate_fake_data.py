@@ -41,7 +41,7 @@ def generate_realistic_fake_data(sensor_id, start_time, end_time, location_facto
             trash_level += increment
             trash_level = min(trash_level, 100)
 
-        sql = f"INSERT INTO sensor_record (smort_ID, time_stamp, trash_level, image) VALUES ('{sensor_id}', '{current_time.strftime('%Y-%m-%d %H:%M:%S')}', {trash_level:.2f}, '');"
+        sql = f"INSERT INTO sensor_record (smort_ID, time_stamp, trash_level) VALUES ('{sensor_id}', '{current_time.strftime('%Y-%m-%d %H:%M:%S')}', {trash_level:.2f});"
         sql_statements.append(sql)
 
         current_time += timedelta(hours=1)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from datetime import datetime
+from os import getenv
+from typing import List, Optional, Tuple
+
+DEFAULT_BATCH_ROWS = 500
+DEFAULT_FLUSH_MS = 20
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class IngestQueueFull(Exception):
+    """Raised by submit() when the buffer is full; the client should retry later."""
+
+
+class IngestQueue:
+    """
+    Write-behind buffer for single readings (POST /record).
+
+    Readings are queued and a background flusher writes them with
+    Database.add_sensor_records, one transaction per batch of up to
+    `batch_rows` readings or whatever arrived within `flush_ms` of the first
+    one. submit() only returns once its batch has committed, so an
+    acknowledged reading is durable; many concurrent requests share one
+    commit instead of paying for one each. When `queue_size` readings are
+    already waiting, submit() fails fast with IngestQueueFull.
+    """
+
+    def __init__(self, db, batch_rows: Optional[int] = None, flush_ms: Optional[float] = None,
+                 queue_size: Optional[int] = None):
+        if batch_rows is None:
+            batch_rows = int(getenv("INGEST_BATCH_ROWS") or DEFAULT_BATCH_ROWS)
+        if flush_ms is None:
+            flush_ms = float(getenv("INGEST_FLUSH_MS") or DEFAULT_FLUSH_MS)
+        if queue_size is None:
+            queue_size = int(getenv("INGEST_QUEUE_SIZE") or DEFAULT_QUEUE_SIZE)
+        self.db = db
+        self.batch_rows = batch_rows
+        self.flush_ms = flush_ms
+        self.queue: "asyncio.Queue[Tuple[dict, asyncio.Future]]" = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.rows = 0
+        self.rejected = 0
+        self.last_flush_s = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything already queued, then stop the flusher."""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, reading: dict) -> dict:
+        """
+        Queue one reading and wait until it is committed. Returns its
+        add_sensor_records result, or {"status": "unavailable"} if the batch
+        could not be written.
+        """
+        if "time_stamp" not in reading:
+            # Stamp on arrival, not when the batch happens to be written
+            reading = {**reading, "time_stamp": datetime.now().replace(microsecond=0).isoformat()}
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((reading, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise IngestQueueFull()
+        return await future
+
+    async def _next_batch(self) -> List[Tuple[dict, asyncio.Future]]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_ms / 1000
+        while len(batch) < self.batch_rows:
+            if self.queue.empty():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                start = time.perf_counter()
+                results = await self.db.add_sensor_records([reading for reading, _ in batch])
+                self.last_flush_s = time.perf_counter() - start
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                results = None
+
+            for i, (_, future) in enumerate(batch):
+                if not future.done():
+                    if results is None:
+                        future.set_result({"status": "unavailable"})
+                    else:
+                        future.set_result(results[i])
+                self.queue.task_done()
+            self.batches += 1
+            self.rows += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            'queued': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'batch_rows': self.batch_rows,
+            'flush_ms': self.flush_ms,
+            'batches': self.batches,
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'last_flush_s': self.last_flush_s,
+        }
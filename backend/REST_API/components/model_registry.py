@@ -0,0 +1,172 @@
+import os
+import threading
+from collections import OrderedDict
+from os import getenv
+from typing import Dict, Optional, Tuple
+
+import joblib
+
+from forest_engine import CompiledForest, compile_forest, compiled_model_path
+
+# Default budget for unpickled models kept in memory (bytes)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def default_model_directory() -> str:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.abspath(os.path.join(base_dir, '..', 'ML-model'))
+
+
+class _Entry:
+    def __init__(self, model, signature: tuple, nbytes: int):
+        self.model = model
+        self.signature = signature
+        self.nbytes = nbytes
+
+
+def _stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ModelRegistry:
+    """
+    Process-wide store of per-sensor models.
+
+    Models are loaded lazily on first use and kept in an LRU bounded by
+    `max_bytes`. Each lookup stats the model files and reloads only when
+    their version (mtime + size) changed, so retrained models are picked up
+    without a restart and without re-reading unchanged files.
+
+    Random forests are served as CompiledForest: the `.npz` export written by
+    training is loaded when it is at least as new as the `.joblib` file,
+    otherwise the pickled forest is compiled once at load time.
+    """
+
+    def __init__(self, model_dir: str, max_bytes: Optional[int] = None, compile_models: bool = True):
+        if max_bytes is None:
+            max_bytes = int(getenv("MODEL_CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES)
+        self.model_dir = model_dir
+        self.max_bytes = max_bytes
+        self.compile_models = compile_models
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[int, threading.Lock] = {}
+
+    def model_path(self, sensor_id: int) -> str:
+        return os.path.join(self.model_dir, f"sensor_{sensor_id}_model.joblib")
+
+    def compiled_path(self, sensor_id: int) -> str:
+        return compiled_model_path(self.model_path(sensor_id))
+
+    def _signature(self, sensor_id: int) -> Optional[tuple]:
+        signature = (_stat(self.model_path(sensor_id)),)
+        if self.compile_models:
+            signature += (_stat(self.compiled_path(sensor_id)),)
+        if all(stat is None for stat in signature):
+            return None
+        return signature
+
+    def version(self, sensor_id: int) -> Optional[str]:
+        """Version token of the model files on disk, None if there is no model."""
+        signature = self._signature(sensor_id)
+        if signature is None:
+            return None
+        return "/".join("-".join(map(str, stat)) if stat else "none" for stat in signature)
+
+    def _load(self, sensor_id: int, signature: tuple):
+        model_stat = signature[0]
+        if self.compile_models:
+            compiled_stat = signature[1]
+            if compiled_stat is not None and (model_stat is None or compiled_stat[0] >= model_stat[0]):
+                return CompiledForest.load(self.compiled_path(sensor_id))
+
+        model = joblib.load(self.model_path(sensor_id))
+        if self.compile_models and hasattr(model, 'estimators_'):
+            model = compile_forest(model)
+        return model
+
+    def get(self, sensor_id: int):
+        """Return the model for `sensor_id`, loading or reloading it if needed."""
+        signature = self._signature(sensor_id)
+        if signature is None:
+            print(f"Warning: Model file not found for sensor {sensor_id}")
+            self.invalidate(sensor_id)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(sensor_id)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(sensor_id)
+                return entry.model
+            load_lock = self._load_locks.setdefault(sensor_id, threading.Lock())
+
+        # Only one thread loads a given model; other sensors stay served
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(sensor_id)
+                if entry is not None and entry.signature == signature:
+                    self._entries.move_to_end(sensor_id)
+                    return entry.model
+
+            model = self._load(sensor_id, signature)
+            print(f"model path: {self.model_path(sensor_id)} loaded")
+
+            # file size is a close proxy for the size of an unpickled model
+            nbytes = getattr(model, 'nbytes', None) or max(stat[1] for stat in signature if stat)
+            with self._lock:
+                self._drop(sensor_id)
+                entry = _Entry(model, signature, nbytes)
+                self._entries[sensor_id] = entry
+                self._total_bytes += entry.nbytes
+                self._evict()
+            return model
+
+    def invalidate(self, sensor_id: Optional[int] = None) -> None:
+        """Forget one model (or all of them); the next get() reloads from disk."""
+        with self._lock:
+            if sensor_id is None:
+                self._entries.clear()
+                self._total_bytes = 0
+            else:
+                self._drop(sensor_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'loaded': list(self._entries.keys()),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _drop(self, sensor_id: int) -> None:
+        entry = self._entries.pop(sensor_id, None)
+        if entry is not None:
+            self._total_bytes -= entry.nbytes
+
+    def _evict(self) -> None:
+        # Always keep the most recently used model, even if it alone is over budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.nbytes
+
+
+_registries: Dict[str, ModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(model_dir: Optional[str] = None) -> ModelRegistry:
+    """Shared registry for a model directory (one per process)."""
+    if model_dir is None:
+        model_dir = default_model_directory()
+    model_dir = os.path.abspath(model_dir)
+    with _registries_lock:
+        registry = _registries.get(model_dir)
+        if registry is None:
+            registry = ModelRegistry(model_dir)
+            _registries[model_dir] = registry
+        return registry
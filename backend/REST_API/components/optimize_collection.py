@@ -10,6 +10,7 @@ from pathlib import Path
 from database import Database
 from router import router
 from smortPredictor import smortPredictorImplementor
+from vrp import plan_fleet
 
 # Constants
 CONFIDENCE_THRESHOLD = 0.75  # Only accept predictions above 75% confidence
@@ -18,53 +19,102 @@ BUFFER_HOURS = 0.2  # Safety margin before bin is fully full
 # Setup environment once
 load_dotenv()
 
+
+def expected_level(current_level: float, hours_until_full: float, hours_ahead: float,
+                   full_level: float = 90) -> float:
+    """Level (percent) a bin is expected to have `hours_ahead` from now, filling linearly to its forecast."""
+    if hours_until_full <= 0:
+        return 100.0
+    level = current_level + (full_level - current_level) * hours_ahead / hours_until_full
+    return float(min(max(level, current_level), 100.0))
+
+
+# Shared so the distance cache and HTTP connections are reused across requests
+_route_optimizer: Optional[router] = None
+
+
+def get_route_optimizer() -> router:
+    global _route_optimizer
+    if _route_optimizer is None:
+        _route_optimizer = router(os.getenv("GOOGLE_MAPS_API_KEY"))
+    return _route_optimizer
+
+
+async def close_route_optimizer() -> None:
+    global _route_optimizer
+    if _route_optimizer is not None:
+        await _route_optimizer.provider.aclose()
+        _route_optimizer = None
+
 async def get_sensors_for_collection(
     frequency_hours: int,
     start_time: datetime,
     region_id: int,
-    refered_date: Optional[datetime] = None
+    refered_date: Optional[datetime] = None,
+    db: Optional[Database] = None,
+    predictor: Optional[smortPredictorImplementor] = None
 ) -> List[Dict]:
     """
     Returns bins that will be full before next scheduled collection.
+    Pass the API's `db`/`predictor` to reuse its connection pool and caches.
     """
 
     if refered_date is None:
         refered_date = datetime.now()
 
-    db = Database(
-        os.getenv("DB_HOST"),
-        os.getenv("DB_PORT"),
-        os.getenv("DB_USER"),
-        os.getenv("DB_PASSWORD"),
-        os.getenv("DB_NAME")
-    )
-    
-    if not db.check_connection():
-        print("Error: Database connection failed.")
-        return []
+    own_db = db is None
+    if own_db:
+        db = Database(
+            os.getenv("DB_HOST"),
+            os.getenv("DB_PORT"),
+            os.getenv("DB_USER"),
+            os.getenv("DB_PASSWORD"),
+            os.getenv("DB_NAME")
+        )
+        await db.open()
+
+        if not await db.check_connection():
+            print("Error: Database connection failed.")
+            await db.close_connection()
+            return []
 
     sensors_for_collection = []
-    predictor = smortPredictorImplementor()
+    if predictor is None:
+        predictor = smortPredictorImplementor(db=db)
 
     try:
-        sensors = await db.get_region_sensors(region_id)  # Fetch sensors in the region
+        # Sensors of the region with their latest readings, in one query
+        sensors = await db.get_latest_region_records(region_id, num_of_row=4)
+
+        # Calculate next scheduled collection time
+        next_collection_time = start_time
+
+        if next_collection_time < refered_date:
+            diff_hours = (refered_date - next_collection_time).total_seconds() / 3600
+            skips = (diff_hours // frequency_hours) + 1
+            next_collection_time += timedelta(hours=skips * frequency_hours)
+
+        print(next_collection_time)
+
+        # Forecast the whole region in one batched rollout, only as far as the
+        # next collection: bins full later are not collected this time anyway
+        horizon_hours = (next_collection_time - refered_date).total_seconds() / 3600 + BUFFER_HOURS
+        predictions = await predictor.predict_sensors(
+            [sensor[0] for sensor in sensors], db,
+            latest_records={sensor[0]: sensor[4] for sensor in sensors},
+            horizon_hours=horizon_hours)
+        predictions = {prediction["sensor_id"]: prediction for prediction in predictions}
 
         for sensor in sensors:
             sensor_id = sensor[0]
             latitude = sensor[1]
             longitude = sensor[2]
 
-            # Calculate next scheduled collection time
-            next_collection_time = start_time
-            
-            if next_collection_time < refered_date:
-                diff_hours = (refered_date - next_collection_time).total_seconds() / 3600
-                skips = (diff_hours // frequency_hours) + 1
-                next_collection_time += timedelta(hours=skips * frequency_hours)
-
-            print(next_collection_time)
-            prediction = await predictor.predict_full_level(sensor_id)
-            if prediction:
+            prediction = predictions.get(sensor_id)
+            if prediction and not sensor[4]:
+                # Cached forecast, but its readings are gone (e.g. dropped by retention)
+                print(f"Warning: No readings left for sensor {sensor_id}. Skipping.")
+            elif prediction:
                 hours_until_full = prediction["hours_until_full"]
                 time_full = refered_date + timedelta(hours=hours_until_full)
                 print(f"Sensor {sensor_id} will be full at {time_full} " ,f"which is {hours_until_full:.2f} hours away.")
@@ -75,16 +125,22 @@ async def get_sensors_for_collection(
                 # Decision: urgent if it will overflow (with buffer) before next pickup
                 print("adjusted_time_full: {adjusted_time_full} , next_collection : {next_collection_time}")
                 if adjusted_time_full <= next_collection_time:
+                    hours_ahead = (next_collection_time - refered_date).total_seconds() / 3600
+                    current_level = float(sensor[4][0][2])
                     sensors_for_collection.append({
                         "id": sensor_id,
                         "latitude": latitude,
-                        "longitude": longitude
+                        "longitude": longitude,
+                        # Expected fill at pickup, what the bin adds to a truck's load
+                        "load": expected_level(current_level, hours_until_full, hours_ahead,
+                                               prediction["predicted_level"])
                     })
             else:
                 print(f"Warning: No prediction for sensor {sensor_id}. Skipping.")
     
     finally:
-        db.close_connection()
+        if own_db:
+            await db.close_connection()
 
     return sensors_for_collection
 
@@ -95,8 +151,7 @@ async def generate_optimized_route(sensors: List[Dict], origin: str) -> Optional
     if not sensors:
         return None
 
-    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
-    route_optimizer = router(api_key)
+    route_optimizer = get_route_optimizer()
 
     coordinates_json = json.dumps([
     {"latitude": float(s["latitude"]), "longitude": float(s["longitude"])}
@@ -104,7 +159,7 @@ async def generate_optimized_route(sensors: List[Dict], origin: str) -> Optional
     ])
 
     # Sort the coordinates to minimize travel distance
-    optimized_json = route_optimizer.sorting_waypoints(
+    optimized_json = await route_optimizer.sorting_waypoints(
         coordinates_json, origin,
         EmissionRatePerKM=0.1, FuelConsumptionRatePerKM=0.1
     )
@@ -113,7 +168,42 @@ async def generate_optimized_route(sensors: List[Dict], origin: str) -> Optional
     final_url = route_optimizer.generate_multi_stop_url(optimized_json, origin)
     return final_url
 
-async def main(frequency_hours: int,start_time_str: str,origin: str,region_id: int,refered_date_str: str): 
+async def generate_fleet_routes(sensors: List[Dict], origin: str,
+                                trucks: Optional[int] = None) -> List[Dict]:
+    """
+    Split the selected sensors across trucks leaving from `origin` within
+    truck capacity (see vrp.py) and return one route per truck with its
+    Google Maps URL.
+    """
+    if not sensors:
+        return []
+
+    route_optimizer = get_route_optimizer()
+    points = [origin] + [f"{s['latitude']},{s['longitude']}" for s in sensors]
+    matrix = await route_optimizer.provider.matrix(points, open_route=True)
+    coordinates = [[float(part) for part in point.split(',')] for point in points]
+    loads = [0.0] + [float(s.get("load", 100.0)) for s in sensors]
+
+    # CPU-bound for up to VRP_TIME_BUDGET_MS; keep the event loop free
+    plan = await asyncio.to_thread(plan_fleet, matrix, coordinates, loads, trucks=trucks)
+
+    routes = []
+    for truck, route in enumerate(plan.routes, start=1):
+        stops = [sensors[i - 1] for i in route.stops]
+        coordinates_json = json.dumps([
+            {"latitude": float(s["latitude"]), "longitude": float(s["longitude"])} for s in stops
+        ])
+        routes.append({
+            "truck": truck,
+            "sensor_ids": [s["id"] for s in stops],
+            "load_bins": round(route.load / 100, 2),
+            "distance_km": round(route.length / 1000, 2),
+            "url": route_optimizer.generate_multi_stop_url(coordinates_json, origin)
+        })
+    return routes
+
+async def main(frequency_hours: int,start_time_str: str,origin: str,region_id: int,refered_date_str: str,
+               db: Optional[Database] = None, predictor: Optional[smortPredictorImplementor] = None): 
 
     """
     wrapper for all process to get the final linke 
@@ -126,7 +216,7 @@ async def main(frequency_hours: int,start_time_str: str,origin: str,region_id: i
         return
 
     sensors_to_collect = await get_sensors_for_collection(
-        frequency_hours, start_time, region_id, refered_date
+        frequency_hours, start_time, region_id, refered_date, db=db, predictor=predictor
     )
 
     if sensors_to_collect:
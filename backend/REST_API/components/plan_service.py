@@ -0,0 +1,260 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from os import getenv
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from optimize_collection import get_route_optimizer, get_sensors_for_collection
+from scheduler import CollectionScheduler, refresh_schedule
+from tsp import solve
+
+# A dirty plan is rebuilt at most this often (readings arrive all the time)
+DEFAULT_MIN_INTERVAL_S = 30
+# A plan is rebuilt at least this often, even with no new readings
+DEFAULT_MAX_AGE_S = 900
+
+
+class RegionPlan:
+    """
+    A region's bins due for collection and a closed bin-to-bin tour through
+    them (the route skeleton). A driver's route is the skeleton cut open
+    where adding their origin costs least.
+    """
+
+    def __init__(self, region_id: int, bins: List[dict], tour: List[int], matrix: np.ndarray,
+                 sensor_ids: List[int], model_versions: Dict[int, Optional[str]],
+                 built_at: datetime, build_s: float):
+        self.region_id = region_id
+        self.bins = bins                      # in tour order
+        self.tour = tour
+        self.matrix = matrix                  # metres between the bins, in tour order
+        self.sensor_ids = sensor_ids          # every sensor in the region, due or not
+        self.model_versions = model_versions
+        self.built_at = built_at
+        self.built_monotonic = time.monotonic()
+        self.build_s = build_s
+
+    def points(self) -> List[str]:
+        return [f"{b['latitude']},{b['longitude']}" for b in self.bins]
+
+    def route_from(self, origin_distances: np.ndarray) -> List[dict]:
+        """
+        Bins in driving order from an origin `origin_distances[i]` metres from
+        bin i: start at the bin after the skeleton leg whose removal saves
+        the most relative to the detour to reach it.
+        """
+        n = len(self.bins)
+        if n <= 1:
+            return list(self.bins)
+        following = np.arange(1, n + 1) % n
+        legs = self.matrix[np.arange(n), following]
+        start = int(np.argmin(origin_distances[following] - legs))
+        first = (start + 1) % n
+        return self.bins[first:] + self.bins[:first]
+
+
+class PlanService:
+    """
+    Keeps a collection plan per region up to date in the background, so
+    /driverLocation only has to attach the driver's origin, along with the
+    region's multi-day schedule (see scheduler.py).
+
+    A plan is marked dirty when one of its sensors reports a reading
+    (record listener) or its model files change version, and rebuilt at
+    most every `min_interval_s` (PLAN_MIN_INTERVAL_S) while dirty, and at
+    least every `max_age_s` (PLAN_MAX_AGE_S) regardless. status() reports
+    each plan's age, dirtiness and build times. The forecast rollout and the
+    tour solve run in worker threads, so ingestion and other requests are
+    not stalled while a plan is rebuilt. A rebuilt plan's schedule is
+    refreshed afterwards by the background loop, so a request waiting on a
+    cold plan does not also wait for the schedule.
+    """
+
+    def __init__(self, db, predictor, frequency_hours: float, start_time: datetime,
+                 refered_date: Optional[Callable[[], datetime]] = None,
+                 min_interval_s: Optional[float] = None, max_age_s: Optional[float] = None):
+        if min_interval_s is None:
+            min_interval_s = float(getenv("PLAN_MIN_INTERVAL_S") or DEFAULT_MIN_INTERVAL_S)
+        if max_age_s is None:
+            max_age_s = float(getenv("PLAN_MAX_AGE_S") or DEFAULT_MAX_AGE_S)
+        self.db = db
+        self.predictor = predictor
+        self.frequency_hours = frequency_hours
+        self.start_time = start_time
+        self.refered_date = refered_date or datetime.now
+        self.min_interval_s = min_interval_s
+        self.max_age_s = max_age_s
+        self.plans: Dict[int, RegionPlan] = {}
+        self.schedules: Dict[int, CollectionScheduler] = {}
+        self._dirty: Dict[int, float] = {}    # region -> monotonic time it became dirty
+        self._schedule_due: set = set()        # regions whose schedule lags their plan
+        self._regions_of: Dict[int, List[int]] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.builds = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def mark_sensor_dirty(self, sensor_id: int) -> None:
+        """Record listener: a reading arrived, so the plans covering this sensor are stale."""
+        regions = self._regions_of.get(sensor_id)
+        # A sensor no plan knows yet (just added) may belong to any region
+        for region_id in (regions if regions is not None else list(self.plans)):
+            self._dirty.setdefault(region_id, time.monotonic())
+        self._wake.set()
+
+    def _models_changed(self, plan: RegionPlan) -> bool:
+        registry = self.predictor.predictor.registry
+        return any(registry.version(sensor_id) != version for sensor_id, version in plan.model_versions.items())
+
+    async def build(self, region_id: int) -> RegionPlan:
+        lock = self._locks.setdefault(region_id, asyncio.Lock())
+        async with lock:
+            started = time.perf_counter()
+            dirty_since = self._dirty.pop(region_id, None)
+            try:
+                sensors = await self.db.get_region_sensors(region_id)
+                sensor_ids = [sensor[0] for sensor in sensors]
+                registry = self.predictor.predictor.registry
+                versions = {sensor_id: registry.version(sensor_id) for sensor_id in sensor_ids}
+
+                bins = await get_sensors_for_collection(
+                    self.frequency_hours, self.start_time, region_id, self.refered_date(),
+                    db=self.db, predictor=self.predictor)
+                points = [f"{b['latitude']},{b['longitude']}" for b in bins]
+                if len(bins) > 1:
+                    matrix = np.asarray(await get_route_optimizer().provider.matrix(points), dtype=float)
+                    # Only the order is used; the solve runs off the event loop
+                    tour = (await asyncio.to_thread(solve, matrix, closed=True, bound=False)).order
+                else:
+                    matrix, tour = np.zeros((len(bins), len(bins))), list(range(len(bins)))
+            except BaseException:
+                if dirty_since is not None:
+                    self._dirty.setdefault(region_id, dirty_since)
+                self.failures += 1
+                raise
+
+            plan = RegionPlan(region_id, [bins[i] for i in tour], tour, matrix[np.ix_(tour, tour)],
+                              sensor_ids, versions, datetime.now(), time.perf_counter() - started)
+            self.plans[region_id] = plan
+            for sensor_id in sensor_ids:
+                regions = self._regions_of.setdefault(sensor_id, [])
+                if region_id not in regions:
+                    regions.append(region_id)
+            self.builds += 1
+
+        self._schedule_due.add(region_id)
+        self._wake.set()
+        return plan
+
+    async def refresh_schedule(self, region_id: int) -> CollectionScheduler:
+        """Feed the region's multi-day schedule the current forecasts; only changed bins are re-placed."""
+        scheduler = self.schedules.get(region_id)
+        if scheduler is None:
+            scheduler = self.schedules[region_id] = CollectionScheduler(self.frequency_hours, self.start_time)
+        return await refresh_schedule(scheduler, region_id, self.db, self.predictor, now=self.refered_date(),
+                                      provider=get_route_optimizer().provider)
+
+    async def get_schedule(self, region_id: int) -> CollectionScheduler:
+        """The region's schedule as last refreshed in the background, or a fresh one."""
+        scheduler = self.schedules.get(region_id)
+        if scheduler is None or self._task is None:
+            scheduler = await self.refresh_schedule(region_id)
+        return scheduler
+
+    async def get_plan(self, region_id: int) -> RegionPlan:
+        plan = self.plans.get(region_id)
+        if plan is None:
+            plan = await self.build(region_id)
+        return plan
+
+    async def route(self, region_id: int, origin: str) -> Optional[str]:
+        """Google Maps link for a driver at `origin` through the region's planned bins."""
+        plan = await self.get_plan(region_id)
+        if not plan.bins:
+            return None
+
+        route_optimizer = get_route_optimizer()
+        # Only the origin row is new; bin-to-bin distances are in the provider's cache
+        distances = await route_optimizer.provider.matrix([origin] + plan.points(), open_route=True)
+        ordered = plan.route_from(np.asarray(distances, dtype=float)[0, 1:])
+        coordinates_json = json.dumps([{"latitude": float(b["latitude"]), "longitude": float(b["longitude"])}
+                                       for b in ordered])
+        return route_optimizer.generate_multi_stop_url(coordinates_json, origin)
+
+    def _due(self, region_id: int, now: float) -> bool:
+        plan = self.plans.get(region_id)
+        if plan is None:
+            return True
+        age = now - plan.built_monotonic
+        if age >= self.max_age_s:
+            return True
+        return age >= self.min_interval_s and (region_id in self._dirty or self._models_changed(plan))
+
+    async def _run(self) -> None:
+        for region in await self.db.get_regions():
+            self._dirty.setdefault(region[0], time.monotonic())
+        while True:
+            self._wake.clear()
+            now = time.monotonic()
+            for region_id in sorted(set(self.plans) | set(self._dirty)):
+                if self._due(region_id, now):
+                    try:
+                        await self.build(region_id)
+                    except Exception as e:
+                        print(f"An error occurred while planning region {region_id}: {e}")
+            # Plans first: requests wait on them, nothing waits on a schedule refresh
+            while self._schedule_due:
+                region_id = min(self._schedule_due)
+                self._schedule_due.discard(region_id)
+                try:
+                    await self.refresh_schedule(region_id)
+                except Exception as e:
+                    print(f"An error occurred while scheduling region {region_id}: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.min_interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        regions = []
+        for region_id in sorted(set(self.plans) | set(self._dirty)):
+            plan = self.plans.get(region_id)
+            dirty_since = self._dirty.get(region_id)
+            age_s = now - plan.built_monotonic if plan else None
+            regions.append({
+                'region_id': region_id,
+                'bins': len(plan.bins) if plan else None,
+                'built_at': plan.built_at.isoformat(timespec='seconds') if plan else None,
+                'age_s': round(age_s, 1) if plan else None,
+                'build_ms': round(plan.build_s * 1000, 1) if plan else None,
+                'dirty_for_s': round(now - dirty_since, 1) if dirty_since is not None else None,
+                'stale': plan is None or dirty_since is not None or age_s >= self.max_age_s,
+                'schedule': self.schedules[region_id].stats() if region_id in self.schedules else None,
+            })
+        return {
+            'running': self._task is not None,
+            'min_interval_s': self.min_interval_s,
+            'max_age_s': self.max_age_s,
+            'builds': self.builds,
+            'failures': self.failures,
+            'regions': regions,
+        }
@@ -18,6 +18,7 @@ from dotenv import load_dotenv
 from pathlib import Path
 import asyncio 
 import random
+from rollout import array_predictor, rollout
 class SmortML:
     def __init__(self, data: List[Tuple[int, datetime.datetime, Decimal]]):
         self.data = self.convert_data_to_df(data)
@@ -95,35 +96,16 @@ class SmortML:
                     'predicted_level': current_data['trash_level']
                 }
             
-            predictions = []
-            for step in range(max_steps):
-                future_time = last_timestamp + pd.Timedelta(minutes=(step + 1) * 15)
-                features = {
-                    'hour': future_time.hour,
-                    'day_of_week': future_time.dayofweek,
-                    'month': future_time.month,
-                    'is_weekend': int(future_time.dayofweek in [5, 6]),
-                    'lag_1': current_data['trash_level'],
-                    'lag_2': current_data['lag_1'],
-                    'lag_3': current_data['lag_2']
+            levels = (current_data['trash_level'], current_data['lag_1'], current_data['lag_2'])
+            reached = rollout(array_predictor(self.model), last_timestamp, levels, threshold, max_steps)
+            if reached is not None:
+                steps, pred = reached
+                predicted_time = last_timestamp + pd.Timedelta(minutes=steps * 15)
+                return {
+                    'predicted_timestamp': predicted_time,
+                    'hours_until_full': steps * 0.25,  # 15 minutes = 0.25 hours
+                    'predicted_level': pred
                 }
-                
-                pred = self.model.predict(pd.DataFrame([features]))[0]
-                predictions.append(pred)
-                
-                # Update lags
-                current_data['lag_3'] = current_data['lag_2']
-                current_data['lag_2'] = current_data['lag_1']
-                current_data['lag_1'] = pred
-                current_data['trash_level'] = pred
-                
-                if pred >= threshold:
-                    predicted_time = last_timestamp + pd.Timedelta(minutes=(step + 1) * 15)
-                    return {
-                        'predicted_timestamp': predicted_time,
-                        'hours_until_full': (step + 1) * 0.25,  # 15 minutes = 0.25 hours
-                        'predicted_level': pred
-                    }
 
             # If threshold was never reached, pick a random future time (3 to 4 days later)
             random_minutes = random.randint(3 * 24 * 4, 4 * 24 * 4) * 15  # 3-4 days, in 15 min intervals
@@ -224,7 +206,14 @@ if __name__ == "__main__":
     db = Database(os.getenv("DB_HOST"), os.getenv("DB_PORT"), os.getenv(
         "DB_USER"), os.getenv("DB_PASSWORD"), os.getenv("DB_NAME"))
     
-    data = asyncio.run(db.get_partial_sensor_record(sensor))
+    async def fetch_records():
+        await db.open()
+        try:
+            return await db.get_partial_sensor_record(sensor)
+        finally:
+            await db.close_connection()
+
+    data = asyncio.run(fetch_records())
     model = SmortML(data)
     model.clean_data()
     model.extract_features()
@@ -0,0 +1,166 @@
+import math
+import threading
+from datetime import datetime
+from os import getenv
+from typing import Dict, Optional
+
+DEFAULT_MIN_INTERVAL_S = 60
+DEFAULT_MAX_INTERVAL_S = 3600
+# Interval used while a sensor's fill rate is still unknown (first reading, just emptied)
+DEFAULT_UNKNOWN_INTERVAL_S = 300
+# Level at which a bin counts as full (same threshold the forecasts use)
+FULL_LEVEL = 90
+# Report this many times on the way to full, so the crossing is seen promptly
+REPORTS_BEFORE_FULL = 20
+# A drop larger than this is a collection, not sensor noise
+EMPTIED_DROP = 20
+# Weight of the newest fill rate in the moving average
+RATE_SMOOTHING = 0.3
+
+
+class _SensorState:
+    def __init__(self, time_stamp: datetime, level: float):
+        self.time_stamp = time_stamp
+        self.level = level
+        self.fill_rate: Optional[float] = None  # level points per hour
+
+
+class ReportingPolicy:
+    """
+    Recommends when a sensor should report next.
+
+    Keeps, per sensor, its last reading and a smoothed fill rate. The
+    expected time until the bin reaches FULL_LEVEL is the sooner of the
+    linear extrapolation of that rate and the model's forecast, if one is
+    given; the sensor is asked to report REPORTS_BEFORE_FULL times before
+    then, within [min_interval_s, max_interval_s]. Full bins report at the
+    minimum interval so their collection is seen quickly; idle bins at the
+    maximum.
+    """
+
+    def __init__(self, min_interval_s: Optional[int] = None, max_interval_s: Optional[int] = None):
+        if min_interval_s is None:
+            min_interval_s = int(getenv("REPORT_INTERVAL_MIN_S") or DEFAULT_MIN_INTERVAL_S)
+        if max_interval_s is None:
+            max_interval_s = int(getenv("REPORT_INTERVAL_MAX_S") or DEFAULT_MAX_INTERVAL_S)
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max_interval_s
+        self._sensors: Dict[int, _SensorState] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, sensor_id: int, time_stamp: datetime, level: float,
+                full_at: Optional[datetime] = None) -> int:
+        """
+        Record a reading and return the recommended seconds until the next
+        one. `full_at` is the forecast time the bin reaches FULL_LEVEL.
+        """
+        with self._lock:
+            state = self._sensors.get(sensor_id)
+            if state is None:
+                state = self._sensors[sensor_id] = _SensorState(time_stamp, level)
+            else:
+                hours = (time_stamp - state.time_stamp).total_seconds() / 3600
+                if level < state.level - EMPTIED_DROP:
+                    state.fill_rate = None
+                elif hours > 0:
+                    rate = (level - state.level) / hours
+                    if state.fill_rate is None:
+                        state.fill_rate = rate
+                    else:
+                        state.fill_rate += RATE_SMOOTHING * (rate - state.fill_rate)
+                if hours >= 0:
+                    state.time_stamp = time_stamp
+                    state.level = level
+            fill_rate = state.fill_rate
+
+        return self.interval(level, fill_rate, time_stamp, full_at)
+
+    def interval(self, level: float, fill_rate: Optional[float], now: datetime,
+                 full_at: Optional[datetime] = None) -> int:
+        if level >= FULL_LEVEL:
+            return self.min_interval_s
+
+        hours_to_full = math.inf
+        if fill_rate is not None and fill_rate > 0:
+            hours_to_full = (FULL_LEVEL - level) / fill_rate
+        # A forecast time already passed belongs to an earlier fill, trust the reading instead
+        if full_at is not None and full_at > now:
+            hours_to_full = min(hours_to_full, (full_at - now).total_seconds() / 3600)
+
+        if math.isinf(hours_to_full):
+            if fill_rate is None:
+                seconds = DEFAULT_UNKNOWN_INTERVAL_S
+            else:
+                seconds = self.max_interval_s
+        else:
+            seconds = hours_to_full * 3600 / REPORTS_BEFORE_FULL
+        return int(min(max(seconds, self.min_interval_s), self.max_interval_s))
+
+    def forget(self, sensor_id: Optional[int] = None) -> None:
+        with self._lock:
+            if sensor_id is None:
+                self._sensors.clear()
+            else:
+                self._sensors.pop(sensor_id, None)
+
+
+def simulate(days: int = 7, fixed_interval_s: int = 5, seed: int = 0) -> None:
+    """
+    Replay synthetic bins (the fill profiles of generate_fake_data) at
+    one-minute resolution and compare a fixed reporting interval with the
+    adaptive policy: writes per bin per day, how stale the last reported
+    level is on average, and how late a bin crossing FULL_LEVEL is noticed.
+    """
+    import numpy as np
+    from datetime import timedelta
+
+    rng = np.random.default_rng(seed)
+    minutes = days * 24 * 60
+    start = datetime(2025, 4, 1)
+    # (morning, afternoon) hourly increments, as in generate_fake_data
+    profiles = {'busy': ((6, 10), (20, 50)), 'normal': ((0.1, 0.4), (5, 10)), 'quiet': ((0, 0.5), (1, 3))}
+
+    print(f"{'profile':>8} {'policy':>10} {'writes/day':>11} {'mean stale':>11} {'full seen after':>16}")
+    for name, (morning, afternoon) in profiles.items():
+        # Ground truth per minute: hourly increments spread evenly, emptied 1-3 h after full
+        level = np.empty(minutes)
+        current, wait = 20.0, 0
+        for hour in range(days * 24):
+            if wait:
+                wait -= 1
+                if not wait:
+                    current = 0.0
+                rate = 0.0
+            else:
+                rate = rng.uniform(*(morning if hour % 24 < 12 else afternoon))
+            for minute in range(60):
+                if not wait:
+                    current = min(current + rate / 60, 100.0)
+                    if current >= 100:
+                        wait = int(rng.integers(1, 4))
+                level[hour * 60 + minute] = current
+
+        crossings = np.flatnonzero((level[1:] >= FULL_LEVEL) & (level[:-1] < FULL_LEVEL)) + 1
+        fixed_writes = 24 * 3600 / fixed_interval_s
+        print(f"{name:>8} {f'fixed {fixed_interval_s}s':>10} {fixed_writes:>11.0f} {'~0':>11} "
+              f"{f'<= {fixed_interval_s} s':>16}")
+
+        policy = ReportingPolicy()
+        reported = np.empty(minutes, dtype=np.int64)
+        writes, t = 0, 0
+        while t < minutes:
+            seconds = policy.observe(1, start + timedelta(minutes=t), float(level[t]))
+            writes += 1
+            next_t = min(t + max(math.ceil(seconds / 60), 1), minutes)
+            reported[t:next_t] = t
+            t = next_t
+
+        stale = np.abs(level - level[reported]).mean()
+        delays = [int(np.argmax(reported[c:] >= c)) if (reported[c:] >= c).any() else minutes - c
+                  for c in crossings]
+        delay = f"{np.mean(delays):.1f} min" if delays else "-"
+        print(f"{name:>8} {'adaptive':>10} {writes / days:>11.0f} {stale:>10.2f}% {delay:>16}")
+
+
+if __name__ == "__main__":
+    simulate()
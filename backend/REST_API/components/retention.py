@@ -0,0 +1,99 @@
+import re
+from datetime import datetime
+from os import getenv
+from typing import List, Optional
+
+DEFAULT_MONTHS_AHEAD = 2
+ARCHIVE_SCHEMA = "archive"
+
+_PARTITION_NAME = re.compile(r"^sensor_record_(\d{4})_(\d{2})$")
+
+
+async def ensure_partitions(db, months_ahead: Optional[int] = None) -> List[str]:
+    """
+    Create the monthly sensor_record partitions for the coming months and
+    for any month that has rows in the default partition.
+    """
+    if months_ahead is None:
+        months_ahead = int(getenv("PARTITION_MONTHS_AHEAD") or DEFAULT_MONTHS_AHEAD)
+    async with db.pool.connection() as conn:
+        cursor = await conn.execute("SELECT sensor_record_ensure_partitions(%s)", (months_ahead,))
+        return [row[0] for row in await cursor.fetchall()]
+
+
+async def list_partitions(db) -> List[tuple]:
+    """(name, first day of month) of the attached monthly partitions, oldest first."""
+    async with db.pool.connection() as conn:
+        cursor = await conn.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'sensor_record'::regclass
+            """)
+        names = [row[0] for row in await cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def detach_old_partitions(db, keep_months: Optional[int] = None, drop: bool = False,
+                                now: Optional[datetime] = None) -> List[str]:
+    """
+    Detach the partitions of months that ended more than `keep_months`
+    months ago (RETENTION_MONTHS; unset keeps everything). Detached months
+    are moved to the `archive` schema, where they can be dumped and dropped,
+    or dropped right away with `drop`. Rollups and sensor_latest are kept.
+    """
+    if keep_months is None:
+        keep_months = int(getenv("RETENTION_MONTHS") or 0)
+    if not keep_months:
+        return []
+
+    now = now or datetime.now()
+    months = now.year * 12 + now.month - 1 - keep_months
+    cutoff = datetime(months // 12, months % 12 + 1, 1)
+
+    detached = []
+    for name, month in await list_partitions(db):
+        if month >= cutoff:
+            break
+        async with db.pool.connection() as conn:
+            async with conn.transaction():
+                await conn.execute(f'ALTER TABLE sensor_record DETACH PARTITION "{name}"')
+                if drop:
+                    await conn.execute(f'DROP TABLE "{name}"')
+                else:
+                    await conn.execute(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}')
+                    await conn.execute(f'ALTER TABLE "{name}" SET SCHEMA {ARCHIVE_SCHEMA}')
+        print(f"[+] {'Dropped' if drop else 'Archived'} partition {name}")
+        detached.append(name)
+    return detached
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from database import Database
+
+    env_path = Path(__file__).resolve().parents[3] / '.env'
+    load_dotenv(dotenv_path=env_path)
+
+    async def main():
+        db = Database(getenv("DB_HOST"), getenv("DB_PORT"), getenv("DB_USER"),
+                      getenv("DB_PASSWORD"), getenv("DB_NAME"))
+        await db.open()
+        try:
+            created = await ensure_partitions(db)
+            print(f"Partitions: {', '.join(created)}")
+            detached = await detach_old_partitions(db, drop="--drop" in sys.argv)
+            print(f"Detached: {', '.join(detached) or 'none'}")
+        finally:
+            await db.close_connection()
+
+    asyncio.run(main())
@@ -226,7 +226,14 @@ if __name__ == "__main__":
     db = Database(os.getenv("DB_HOST"), os.getenv("DB_PORT"), os.getenv(
         "DB_USER"), os.getenv("DB_PASSWORD"), os.getenv("DB_NAME"))
     
-    data = asyncio.run(db.get_partial_sensor_record(sensor))
+    async def fetch_records():
+        await db.open()
+        try:
+            return await db.get_partial_sensor_record(sensor)
+        finally:
+            await db.close_connection()
+
+    data = asyncio.run(fetch_records())
     model = SmortML(data)
     model.clean_data()
     model.extract_features()
@@ -0,0 +1,210 @@
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from forest_engine import CompiledForest
+
+# Feature order the per-sensor models were trained on (see SmortML.split_train_test)
+FEATURES = ['hour', 'day_of_week', 'month', 'is_weekend', 'lag_1', 'lag_2', 'lag_3']
+N_CALENDAR = 4
+N_LAGS = 3
+STEP_MINUTES = 15
+STEP = np.timedelta64(STEP_MINUTES, 'm')
+# Calendar features are precomputed for this many steps (one day) at a time
+CALENDAR_BLOCK_STEPS = 96
+
+ArrayPredictor = Callable[[np.ndarray], np.ndarray]
+# Called with the indices of the rows' sensors and their stacked feature matrix
+RowPredictor = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def _as_datetime64(timestamp) -> np.datetime64:
+    # Readings are stored as naive local timestamps; keep wall-clock time
+    ts = pd.Timestamp(timestamp)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.to_datetime64().astype('datetime64[ns]')
+
+
+def _calendar(times: np.ndarray, out: np.ndarray) -> None:
+    days = times.astype('datetime64[D]')
+    day_of_week = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    out[..., 0] = (times - days).astype('timedelta64[h]').astype(np.int64)
+    out[..., 1] = day_of_week
+    out[..., 2] = times.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    out[..., 3] = day_of_week >= 5
+
+
+def _calendar_block(bases: np.ndarray, first_step: int, steps: int) -> np.ndarray:
+    """(steps, n, 4) calendar features of steps first_step.. after each of the `n` bases."""
+    times = bases[None, :] + STEP * np.arange(first_step, first_step + steps)[:, None]
+    block = np.empty((steps, len(bases), N_CALENDAR), dtype=np.float64)
+    _calendar(times, block)
+    return block
+
+
+def calendar_features(last_timestamp, steps: int) -> np.ndarray:
+    """
+    Calendar features (hour, day_of_week, month, is_weekend) of the `steps`
+    15-minute slots following `last_timestamp`, as a (steps, 4) array.
+    """
+    return _calendar_block(np.array([_as_datetime64(last_timestamp)]), 1, steps)[:, 0]
+
+
+class LagBuffer:
+    """
+    Ring buffer of the most recent trash levels for a batch of sensors.
+
+    All rows advance together, so one head index serves the whole batch.
+    """
+
+    def __init__(self, levels):
+        # `levels` is (n_sensors, 3), newest first: (trash_level, lag_1, lag_2)
+        self._buf = np.array(levels, dtype=np.float64)[:, ::-1].copy()
+        self._size = self._buf.shape[1]
+        self._head = 0  # column holding the oldest level
+
+    def push(self, levels: np.ndarray) -> None:
+        self._buf[:, self._head] = levels
+        self._head = (self._head + 1) % self._size
+
+    def write_to(self, out: np.ndarray) -> None:
+        for i in range(self._size):
+            out[:, i] = self._buf[:, (self._head - 1 - i) % self._size]
+
+    def keep(self, mask: np.ndarray) -> None:
+        self._buf = self._buf[mask]
+
+
+def array_predictor(model) -> ArrayPredictor:
+    """
+    Wrap a fitted model so it can be fed raw float arrays in FEATURES order.
+
+    Random forests are evaluated tree by tree without sklearn's per-call input
+    validation and thread dispatch, accumulating in the same order as
+    `RandomForestRegressor.predict` so the results are identical.
+    """
+    if isinstance(model, CompiledForest):
+        return model.predict
+
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is not None and all(hasattr(e, 'tree_') for e in estimators):
+        trees = [e.tree_ for e in estimators]
+        n_trees = len(trees)
+
+        def predict(X: np.ndarray) -> np.ndarray:
+            X = np.ascontiguousarray(X, dtype=np.float32)
+            y = np.zeros(X.shape[0], dtype=np.float64)
+            for tree in trees:
+                y += tree.predict(X)[:, 0]
+            y /= n_trees
+            return y
+
+        return predict
+
+    if hasattr(model, 'feature_names_in_'):
+        return lambda X: model.predict(pd.DataFrame(X, columns=FEATURES))
+    return model.predict
+
+
+def stacked_predictor(predictors: Sequence[ArrayPredictor], owner: Sequence[int]) -> RowPredictor:
+    """
+    Route each row of a stacked feature matrix to its sensor's model.
+
+    `owner[i]` is the index in `predictors` of sensor i's model; sensors that
+    share a model are evaluated in a single call.
+    """
+    owner = np.asarray(owner)
+    if len(predictors) == 1:
+        return lambda rows, X: predictors[0](X)
+
+    def predict(rows: np.ndarray, X: np.ndarray) -> np.ndarray:
+        groups = owner[rows]
+        y = np.empty(len(rows), dtype=np.float64)
+        for group in np.unique(groups):
+            mask = groups == group
+            y[mask] = predictors[group](X[mask])
+        return y
+
+    return predict
+
+
+def batch_predictor(models: Sequence, owner: Sequence[int]) -> RowPredictor:
+    """
+    RowPredictor for sensors whose models are `models[owner[i]]`.
+
+    Compiled forests are stacked so a step evaluates every row against its own
+    trees in a single vectorized traversal; other models fall back to one
+    call per distinct model.
+    """
+    owner = np.asarray(owner, dtype=np.int64)
+    if models and all(isinstance(model, CompiledForest) for model in models):
+        bundle = models[0] if len(models) == 1 else CompiledForest.stack(models)
+        return lambda rows, X: bundle.predict_rows(owner[rows], X)
+    return stacked_predictor([array_predictor(model) for model in models], owner)
+
+
+def rollout_batch(predict: RowPredictor, last_timestamps: Sequence, levels,
+                  threshold: float = 90, max_steps: int = 1000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Step every sensor through the autoregressive forecast in lockstep.
+
+    Each step builds one stacked feature matrix for the sensors still below
+    `threshold`; sensors leave the batch as soon as they reach it. Calendar
+    features are precomputed CALENDAR_BLOCK_STEPS steps at a time. Returns
+    (steps, predicted_level) arrays, with steps == 0 where the threshold is
+    not reached within `max_steps`.
+    """
+    n = len(last_timestamps)
+    steps = np.zeros(n, dtype=np.int64)
+    predicted = np.full(n, np.nan)
+    if n == 0:
+        return steps, predicted
+
+    active = np.arange(n)
+    base = np.array([_as_datetime64(ts) for ts in last_timestamps], dtype='datetime64[ns]')
+    lags = LagBuffer(levels)
+    X = np.empty((n, N_CALENDAR + N_LAGS), dtype=np.float64)
+    block, block_start, columns = None, 1, None
+
+    for step in range(1, max_steps + 1):
+        if block is None or step - block_start >= len(block):
+            block_start = step
+            block = _calendar_block(base, step, min(CALENDAR_BLOCK_STEPS, max_steps - step + 1))
+            columns = np.arange(len(active))
+        rows = X[:len(active)]
+        rows[:, :N_CALENDAR] = block[step - block_start, columns]
+        lags.write_to(rows[:, N_CALENDAR:])
+        pred = np.asarray(predict(active, rows), dtype=np.float64)
+        lags.push(pred)
+
+        reached = pred >= threshold
+        if reached.any():
+            steps[active[reached]] = step
+            predicted[active[reached]] = pred[reached]
+            keep = ~reached
+            active = active[keep]
+            base = base[keep]
+            columns = columns[keep]
+            lags.keep(keep)
+            if not len(active):
+                break
+
+    return steps, predicted
+
+
+def rollout(predict: ArrayPredictor, last_timestamp, levels: Sequence[float],
+            threshold: float = 90, max_steps: int = 1000) -> Optional[Tuple[int, float]]:
+    """
+    Autoregressively forecast 15-minute steps until `threshold` is reached.
+
+    `levels` holds the latest reading followed by the two before it. Returns
+    (steps, predicted_level) for the first step at or above the threshold, or
+    None when it is not reached within `max_steps`.
+    """
+    steps, predicted = rollout_batch(lambda rows, X: predict(X), [last_timestamp], [levels],
+                                     threshold, max_steps)
+    if not steps[0]:
+        return None
+    return int(steps[0]), float(predicted[0])
@@ -1,37 +1,18 @@
+import asyncio
 import json
-import requests
 from itertools import permutations
 from dotenv import load_dotenv
 import os
 from pathlib import Path
+
+from distance_provider import DistanceProvider, get_provider
+from tsp import solve
+
 class router:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, provider: DistanceProvider = None):
         self.api_key = api_key
+        self.provider = provider if provider is not None else get_provider(api_key)
         self.base_url = "https://www.google.com/maps/dir/?api=1"
-        self.matrix_api_url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-
-    def get_distance_matrix(self, origins, destinations):
-        origin_str = "|".join(origins)
-        destination_str = "|".join(destinations)
-        params = {
-            "origins": origin_str,
-            "destinations": destination_str,
-            "key": self.api_key
-        }
-        response = requests.get(self.matrix_api_url, params=params)
-
-
-
-        data = response.json()
-
-        #------------testing ----------------------
-        # print ("Distance Matrix API response:", data)
-        # if response.status_code != 200:
-        #     print("Error: Failed to fetch distance matrix.")
-        #     return None
-
-
-        return data
 
     def generate_multi_stop_url(self, coordinates_json: str, origin: str) -> str:
         try:
@@ -61,7 +42,7 @@ class router:
             print("Error: Provided string is not valid JSON.")
             return None
 
-    def sorting_waypoints(self, coordinates_json: str, origin: str,
+    async def sorting_waypoints(self, coordinates_json: str, origin: str,
                           EmissionRatePerKM: float, FuelConsumptionRatePerKM: float) -> str:
 
         # emission rate per KM is kg /km       
@@ -73,34 +54,14 @@ class router:
 
             all_points = [origin] + [f"{c['latitude']},{c['longitude']}" for c in coordinates]
 
-            # Get distance matrix from Google API
-            matrix = self.get_distance_matrix(all_points, all_points)
-            if matrix['status'] != 'OK':
-                print("Error: Distance Matrix API failed.")
-                return coordinates_json
+            # Google (cached) or offline distances, per DISTANCE_PROVIDER
+            distance_matrix = await self.provider.matrix(all_points, open_route=True)
 
-            distance_matrix = [
-                [elem['distance']['value'] for elem in row['elements']]
-                for row in matrix['rows']
-            ]
-
-            n = len(all_points)
-            visited = [False] * n
-            visited[0] = True  # origin
-            order = []
-            current = 0
-
-            for _ in range(1, n):
-                next_point = min(
-                    ((i, distance_matrix[current][i]) for i in range(1, n) if not visited[i]),
-                    key=lambda x: x[1],
-                    default=(None, None)
-                )[0]
-                if next_point is None:
-                    break
-                order.append(next_point)
-                visited[next_point] = True
-                current = next_point
+            # Open route from the origin, ending at the last bin
+            tour = solve(distance_matrix)
+            print(f"Route: {tour.length / 1000:.2f} km, within {tour.gap:.1%} of optimal "
+                  f"({'exact' if tour.exact else 'local search'})")
+            order = tour.order[1:]
 
             sorted_coordinates = [coordinates[i - 1] for i in order]  # skip origin
             return json.dumps(sorted_coordinates)
@@ -126,9 +87,9 @@ def test_generate_multi_stop_url():
 
     origin = "4.382281,100.970367"  # Chancellor Hall
 
-    sorted_json = router_instance.sorting_waypoints(
+    sorted_json = asyncio.run(router_instance.sorting_waypoints(
         coordinates_json, origin, EmissionRatePerKM=0.2, FuelConsumptionRatePerKM=0.1
-    )
+    ))
     print("Sorted JSON:", sorted_json)
 
     url = router_instance.generate_multi_stop_url(sorted_json, origin)
@@ -0,0 +1,388 @@
+import math
+from datetime import datetime, timedelta
+from os import getenv
+from statistics import NormalDist
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from distance_provider import haversine_matrix
+
+DEFAULT_HORIZON_DAYS = 3
+# Accepted probability that a bin overflows before its collection
+DEFAULT_RISK_TARGET = 0.05
+# Spread of the time-to-full forecast, as a share of the forecast plus a floor
+DEFAULT_FORECAST_CV = 0.25
+FORECAST_SIGMA_FLOOR_H = 1.0
+# Bins are not collected before they are expected to be at least this full
+DEFAULT_MIN_LEVEL = 50
+FULL_LEVEL = 90
+# Fall back to a full rebuild once this share of bins has been patched incrementally
+REBUILD_SHARE = 0.25
+
+
+class _Bin:
+    def __init__(self, sensor_id: int, latitude: float, longitude: float):
+        self.sensor_id = sensor_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.level = 0.0
+        self.time_full: Optional[datetime] = None
+        self.forecast = None           # forecast the window was computed from
+        self.release = 0               # earliest shift worth collecting on
+        self.deadline = 0              # latest shift within the risk target
+        self.shift: Optional[int] = None
+
+
+class CollectionScheduler:
+    """
+    Rolling-horizon collection schedule for one region.
+
+    Collections happen on shifts every `frequency_hours` from `start_time`.
+    Each bin gets a window of shifts: from the first shift it is expected
+    to be at least `min_level` full, to the last shift before it overflows
+    with more than `risk_target` probability, treating its time to full as
+    normal with a standard deviation of `forecast_cv` times the forecast.
+    The fewest trips (shifts with a collection) covering every window
+    that closes within the horizon are found by the earliest-deadline
+    greedy; a bin whose window spans several trips rides on the one where
+    it is closest to the other bins, by the distance provider's matrix
+    (set_distances) or, for bins not in it, straight-line distance.
+
+    update() patches the schedule when a bin's forecast changes and
+    leaves everything else alone; a full rebuild only happens when the
+    horizon rolls past a shift or after many patches.
+    """
+
+    def __init__(self, frequency_hours: float, start_time: datetime, horizon_days: Optional[float] = None,
+                 risk_target: Optional[float] = None, forecast_cv: Optional[float] = None,
+                 min_level: Optional[float] = None):
+        if horizon_days is None:
+            horizon_days = float(getenv("SCHEDULE_HORIZON_DAYS") or DEFAULT_HORIZON_DAYS)
+        if risk_target is None:
+            risk_target = float(getenv("SCHEDULE_RISK_TARGET") or DEFAULT_RISK_TARGET)
+        if forecast_cv is None:
+            forecast_cv = float(getenv("SCHEDULE_FORECAST_CV") or DEFAULT_FORECAST_CV)
+        if min_level is None:
+            min_level = float(getenv("SCHEDULE_MIN_LEVEL") or DEFAULT_MIN_LEVEL)
+        self.frequency = timedelta(hours=frequency_hours)
+        self.start_time = start_time
+        self.horizon = timedelta(days=horizon_days)
+        self.risk_target = risk_target
+        self.z = NormalDist().inv_cdf(risk_target)
+        self.forecast_cv = forecast_cv
+        self.min_level = min_level
+        self.bins: Dict[int, _Bin] = {}
+        self.trips: Dict[int, List[int]] = {}  # shift -> sensor ids
+        self._matrix: Optional[np.ndarray] = None  # metres between bins, from the distance provider
+        self._index: Dict[int, int] = {}            # sensor id -> row of _matrix
+        self.now = start_time
+        self.updates = 0
+        self.patches = 0
+        self.rebuilds = 0
+
+    # Shift k starts at start_time + k * frequency
+    def shift_time(self, shift: int) -> datetime:
+        return self.start_time + shift * self.frequency
+
+    def _first_shift(self, at: datetime) -> int:
+        """First shift at or after `at`."""
+        return math.ceil((at - self.start_time) / self.frequency)
+
+    def _last_shift(self, at: datetime) -> int:
+        """Last shift at or before `at`."""
+        return math.floor((at - self.start_time) / self.frequency)
+
+    @property
+    def next_shift(self) -> int:
+        return self._first_shift(self.now)
+
+    @property
+    def horizon_shift(self) -> int:
+        return self._last_shift(self.now + self.horizon)
+
+    def forecast_horizon_hours(self) -> Optional[float]:
+        """
+        Longest time to full whose deadline can still fall within the
+        horizon (None when the forecast spread makes every forecast count):
+        forecasts beyond it never get a trip, so they need not be computed.
+        """
+        shrink = 1 + self.z * self.forecast_cv
+        if shrink <= 0:
+            return None
+        hours = (self.horizon + self.frequency).total_seconds() / 3600
+        return (hours - self.z * FORECAST_SIGMA_FLOOR_H) / shrink
+
+    def _window(self, b: _Bin) -> Tuple[int, int]:
+        hours = (b.time_full - self.now).total_seconds() / 3600
+        sigma = self.forecast_cv * max(hours, 0.0) + FORECAST_SIGMA_FLOOR_H
+        deadline = max(self._last_shift(self.now + timedelta(hours=hours + self.z * sigma)), self.next_shift)
+        if b.level >= self.min_level or hours <= 0:
+            release = self.next_shift
+        else:
+            hours_to_min = hours * (self.min_level - b.level) / max(FULL_LEVEL - b.level, 1e-9)
+            release = self._first_shift(self.now + timedelta(hours=hours_to_min))
+        return min(release, deadline), deadline
+
+    def overflow_risk(self, b: _Bin, shift: int) -> float:
+        """Probability that the bin is full before `shift`."""
+        hours = (b.time_full - self.now).total_seconds() / 3600
+        sigma = self.forecast_cv * max(hours, 0.0) + FORECAST_SIGMA_FLOOR_H
+        return NormalDist(hours, sigma).cdf((self.shift_time(shift) - self.now).total_seconds() / 3600)
+
+    def set_distances(self, sensor_ids: List[int], matrix) -> None:
+        """Road distances between `sensor_ids` (as the trucks drive them) for placing bins on trips."""
+        self._index = {sensor_id: i for i, sensor_id in enumerate(sensor_ids)}
+        self._matrix = np.asarray(matrix, dtype=float)
+        if self.bins:
+            self.rebuild()
+
+    def _detour(self, b: _Bin, shift: int) -> float:
+        """Metres to the bin from the closest other bin already on `shift` (0 for an empty trip)."""
+        others = [self.bins[s] for s in self.trips.get(shift, []) if s != b.sensor_id]
+        if not others:
+            return 0.0
+        if b.sensor_id in self._index and all(o.sensor_id in self._index for o in others):
+            rows = [self._index[o.sensor_id] for o in others]
+            return float(self._matrix[rows, self._index[b.sensor_id]].min())
+        here = np.array([[b.latitude, b.longitude]])
+        there = np.array([[o.latitude, o.longitude] for o in others])
+        return float(haversine_matrix(here, there).min())
+
+    def _assign(self, b: _Bin, shift: Optional[int]) -> None:
+        if b.shift is not None:
+            trip = self.trips[b.shift]
+            trip.remove(b.sensor_id)
+            if not trip:
+                del self.trips[b.shift]
+        b.shift = shift
+        if shift is not None:
+            self.trips.setdefault(shift, []).append(b.sensor_id)
+
+    def _place(self, b: _Bin) -> None:
+        """Put a bin on the best existing trip in its window, or open one at its deadline."""
+        candidates = [shift for shift in self.trips if b.release <= shift <= b.deadline]
+        if candidates:
+            # Closest to the trip's other bins; later (fuller) on ties
+            self._assign(b, min(candidates, key=lambda shift: (self._detour(b, shift), -shift)))
+        elif b.deadline <= self.horizon_shift:
+            self._assign(b, b.deadline)
+        else:
+            self._assign(b, None)  # not due within the horizon
+
+    def rebuild(self) -> None:
+        for b in self.bins.values():
+            b.shift = None
+        self.trips = {}
+        ordered = sorted((b for b in self.bins.values() if b.time_full is not None), key=lambda b: b.deadline)
+        # Earliest deadline first: the fewest trips covering every window in the horizon
+        for b in ordered:
+            if b.deadline <= self.horizon_shift and not any(b.release <= s <= b.deadline for s in self.trips):
+                self.trips[b.deadline] = []
+        for b in ordered:
+            self._place(b)
+        self.patches = 0
+        self.rebuilds += 1
+
+    def roll(self, now: datetime) -> None:
+        """Advance to `now`; windows are recomputed and the schedule rebuilt when a shift has passed."""
+        passed = self._first_shift(now) != self.next_shift or self._last_shift(now + self.horizon) != self.horizon_shift
+        self.now = now
+        if passed:
+            for b in self.bins.values():
+                if b.time_full is not None:
+                    b.release, b.deadline = self._window(b)
+            self.rebuild()
+
+    def update(self, sensor_id: int, latitude: float, longitude: float, level: float,
+               hours_until_full: float, forecast=None) -> bool:
+        """
+        Feed a bin's latest level and forecast. Returns whether its window
+        changed. `forecast` identifies the forecast (e.g. its predicted
+        timestamp); when it is the same as last time nothing is recomputed.
+        """
+        b = self.bins.get(sensor_id)
+        if b is None:
+            b = self.bins[sensor_id] = _Bin(sensor_id, latitude, longitude)
+        elif forecast is not None and forecast == b.forecast:
+            return False
+        self.updates += 1
+        b.level = level
+        b.forecast = forecast
+        b.time_full = self.now + timedelta(hours=hours_until_full)
+        window = self._window(b)
+        if window == (b.release, b.deadline) and (b.shift is not None or b.deadline > self.horizon_shift):
+            return False
+
+        b.release, b.deadline = window
+        if b.shift is None or not (b.release <= b.shift <= b.deadline):
+            self._place(b)
+        self.patches += 1
+        if self.patches > REBUILD_SHARE * len(self.bins):
+            self.rebuild()
+        return True
+
+    def remove(self, sensor_id: int) -> None:
+        b = self.bins.pop(sensor_id, None)
+        if b is not None:
+            self._assign(b, None)
+
+    def schedule(self) -> List[dict]:
+        shifts = []
+        for shift in sorted(self.trips):
+            bins = [self.bins[s] for s in sorted(self.trips[shift])]
+            shifts.append({
+                'time': self.shift_time(shift).isoformat(timespec='seconds'),
+                'sensor_ids': [b.sensor_id for b in bins],
+                'max_overflow_risk': round(max(self.overflow_risk(b, shift) for b in bins), 3),
+            })
+        return shifts
+
+    def stats(self) -> dict:
+        return {
+            'now': self.now.isoformat(timespec='seconds'),
+            'horizon_end': self.shift_time(self.horizon_shift).isoformat(timespec='seconds'),
+            'bins': len(self.bins),
+            'trips': len(self.trips),
+            'scheduled': sum(len(trip) for trip in self.trips.values()),
+            'updates': self.updates,
+            'patches_since_rebuild': self.patches,
+            'rebuilds': self.rebuilds,
+        }
+
+
+async def refresh_schedule(scheduler: CollectionScheduler, region_id: int, db, predictor,
+                           now: Optional[datetime] = None, provider=None) -> CollectionScheduler:
+    """
+    Roll the schedule to `now` and feed it the region's current forecasts
+    (one query), computed only as far as forecast_horizon_hours(): bins
+    not full by then are left off the schedule. With a distance `provider`,
+    the matrix between the scheduled bins is fetched whenever they change.
+    """
+    scheduler.roll(now or datetime.now())
+    sensors = await db.get_latest_region_records(region_id, num_of_row=4)
+    sensor_ids = [sensor[0] for sensor in sensors]
+    predictions = await predictor.predict_sensors(
+        sensor_ids, db,
+        latest_records={sensor[0]: sensor[4] for sensor in sensors},
+        horizon_hours=scheduler.forecast_horizon_hours())
+    predictions = {prediction["sensor_id"]: prediction for prediction in predictions}
+
+    for sensor_id in [s for s in scheduler.bins if s not in predictions]:
+        scheduler.remove(sensor_id)
+    for sensor_id, latitude, longitude, _, records in sensors:
+        prediction = predictions.get(sensor_id)
+        if not prediction or not records or prediction.get('beyond_horizon'):
+            scheduler.remove(sensor_id)
+        else:
+            scheduler.update(sensor_id, float(latitude), float(longitude), float(records[0][2]),
+                             prediction["hours_until_full"], forecast=prediction["predicted_timestamp"])
+
+    # Only bins due within the horizon are placed on trips, so only they need road distances
+    due = sorted(scheduler.bins)
+    if provider is not None and len(due) > 1 and set(due) != set(scheduler._index):
+        bins = [scheduler.bins[sensor_id] for sensor_id in due]
+        matrix = await provider.matrix([f"{b.latitude},{b.longitude}" for b in bins])
+        scheduler.set_distances(due, matrix)
+    return scheduler
+
+
+def simulate(bins: int = 50, days: int = 14, rate_range=(0.2, 1.5), frequency_hours: int = 8,
+             seed: int = 0) -> None:
+    """
+    Compare the fixed rule of get_sensors_for_collection (on every shift,
+    collect each bin predicted to be full before the next one) with the
+    scheduler on synthetic bins that fill at steady random rates: trips,
+    bin collections and overflows. Forecasts are the true time to full
+    with 25% noise, refreshed every hour. Lowering SCHEDULE_MIN_LEVEL
+    trades more (earlier) bin collections for fewer trips.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 4, 1, 8)
+    rates = rng.uniform(*rate_range, bins)  # level points per hour
+    coordinates = np.array([4.38, 100.97]) + rng.normal(0, 0.02, (bins, 2))
+
+    def forecast_hours(level, rate):
+        return max(FULL_LEVEL - level, 0) / rate * rng.lognormal(0, 0.25)
+
+    for policy in ("fixed rule", "scheduler"):
+        levels = rng.uniform(0, 60, bins)
+        scheduler = CollectionScheduler(frequency_hours, start)
+        trips = collections = overflow_hours = 0
+        for hour in range(days * 24):
+            now = start + timedelta(hours=hour)
+            hours_full = [forecast_hours(levels[i], rates[i]) for i in range(bins)]
+            if policy == "scheduler":
+                scheduler.roll(now)
+                for i in range(bins):
+                    scheduler.update(i, *coordinates[i], float(levels[i]), hours_full[i], forecast=None)
+            if hour % frequency_hours == 0:
+                if policy == "fixed rule":
+                    due = [i for i in range(bins) if hours_full[i] - 0.2 <= frequency_hours]
+                else:
+                    due = scheduler.trips.get(scheduler._first_shift(now), [])
+                if due:
+                    trips += 1
+                    collections += len(due)
+                    levels[due] = 0
+                    for i in due:
+                        scheduler.remove(i)
+            levels = levels + rates
+            overflow_hours += int((levels >= 100).sum())
+            levels = np.minimum(levels, 100)
+        print(f"{bins} bins filling {rate_range[0]}-{rate_range[1]}%/h, {frequency_hours} h shifts, "
+              f"{policy:>10}: {trips} trips, {collections} bin collections, "
+              f"{overflow_hours} bin-hours overflowing over {days} days")
+
+
+async def check(region_id: int = 1, frequency_hours: float = 24,
+                start_time: datetime = datetime(2024, 1, 1, 8), now: Optional[datetime] = None) -> None:
+    """
+    Feed the scheduler the real forecasts of a region (the database and
+    models in .env) and check that only bins forecast to fill within the
+    horizon are scheduled, and that refreshing again without new readings
+    leaves the schedule unchanged.
+    """
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from database import Database
+    from smortPredictor import smortPredictorImplementor
+
+    load_dotenv(dotenv_path=Path(__file__).resolve().parents[3] / '.env')
+    now = now or datetime.fromisoformat(getenv("COLLECTION_REFERENCE_TIME") or datetime.now().isoformat())
+    db = Database(getenv("DB_HOST"), getenv("DB_PORT"), getenv("DB_USER"), getenv("DB_PASSWORD"), getenv("DB_NAME"))
+    await db.open()
+    try:
+        predictor = smortPredictorImplementor(db=db)
+        scheduler = CollectionScheduler(frequency_hours, start_time)
+        await refresh_schedule(scheduler, region_id, db, predictor, now=now)
+        first = scheduler.schedule()
+
+        sensors = await db.get_latest_region_records(region_id, num_of_row=4)
+        forecasts = {p["sensor_id"]: p for p in await predictor.predict_sensors(
+            [sensor[0] for sensor in sensors], db, horizon_hours=scheduler.forecast_horizon_hours())}
+        scheduled = {sensor_id for shift in first for sensor_id in shift['sensor_ids']}
+        beyond = {sensor_id for sensor_id, p in forecasts.items() if p.get('beyond_horizon')}
+        assert not scheduled & beyond, f"bins not due within the horizon were scheduled: {scheduled & beyond}"
+        assert set(scheduler.bins).isdisjoint(beyond), "bins beyond the horizon are kept"
+
+        await refresh_schedule(scheduler, region_id, db, predictor, now=now)
+        assert scheduler.schedule() == first, "the schedule changed without new readings"
+    finally:
+        await db.close_connection()
+
+    print(f"region {region_id} at {now}: {len(forecasts)} forecasts, {len(beyond)} beyond "
+          f"{scheduler.forecast_horizon_hours():.0f} h, {len(scheduled)} bins on {len(first)} trips")
+    for shift in first:
+        print(f"  {shift['time']}: {shift['sensor_ids']} (max overflow risk {shift['max_overflow_risk']})")
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    if "--check" in sys.argv:
+        asyncio.run(check())
+    else:
+        simulate()
+        simulate(bins=200, rate_range=(0.3, 4.0), frequency_hours=24)
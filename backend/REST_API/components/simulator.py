@@ -0,0 +1,303 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from distance_provider import DistanceProvider, HaversineDistanceProvider
+from tsp import nearest_neighbour, solve, tour_length
+
+FULL_LEVEL = 90
+OVERFLOW_LEVEL = 100
+# Same safety margin as optimize_collection.get_sensors_for_collection
+BUFFER_HOURS = 0.2
+# How far ahead the oracle looks for the time a bin gets full
+LOOKAHEAD_HOURS = 7 * 24
+# Hours of history the rate forecast averages over
+RATE_WINDOW_HOURS = 24
+
+# (morning, afternoon) hourly increments of the generate_fake_data profiles
+PROFILES = {
+    'busy': ((6, 10), (20, 50)),      # sensors 3, 5, 6
+    'normal': ((0.1, 0.4), (5, 10)),  # sensors 1, 2, 4
+    'quiet': ((0, 0.5), (1, 3)),      # the rest
+}
+
+
+class Replay:
+    """Hourly fill increments of `n` bins (T x n), their coordinates and the depot."""
+
+    def __init__(self, start: datetime, increments: np.ndarray, coordinates: np.ndarray,
+                 depot: Sequence[float], initial_levels: Optional[np.ndarray] = None,
+                 sensor_ids: Optional[List[int]] = None):
+        self.start = start
+        self.increments = np.asarray(increments, dtype=float)
+        self.coordinates = np.asarray(coordinates, dtype=float)
+        self.depot = np.asarray(depot, dtype=float)
+        n = self.increments.shape[1]
+        self.initial_levels = np.zeros(n) if initial_levels is None else np.asarray(initial_levels, dtype=float)
+        self.sensor_ids = sensor_ids or list(range(1, n + 1))
+
+    @property
+    def hours(self) -> int:
+        return self.increments.shape[0]
+
+
+def synthetic_replay(bins: int = 1000, days: int = 365, seed: int = 0,
+                     start: datetime = datetime(2025, 1, 1)) -> Replay:
+    """
+    generate_fake_data's fill profiles for `bins` bins over `days`, drawn in
+    one vectorized pass (busy, normal and quiet bins in its 3:3:3 mix),
+    scattered around a depot.
+    """
+    rng = np.random.default_rng(seed)
+    hours = days * 24
+    kinds = np.array(['normal', 'normal', 'busy', 'normal', 'busy', 'busy', 'quiet', 'quiet', 'quiet'])
+    profile = kinds[np.arange(bins) % len(kinds)]
+    morning = (np.arange(hours) + start.hour) % 24 < 12
+
+    increments = np.empty((hours, bins))
+    for name, ((m_low, m_high), (a_low, a_high)) in PROFILES.items():
+        columns = np.flatnonzero(profile == name)
+        low = np.where(morning, m_low, a_low)[:, None]
+        high = np.where(morning, m_high, a_high)[:, None]
+        increments[:, columns] = rng.uniform(low, high, (hours, len(columns)))
+    # Busy bins would overflow every few hours at the original rates; scale the
+    # profiles so a daily collection is reasonable, keeping their relative shape
+    increments /= 10
+
+    depot = np.array([4.38, 100.97])
+    coordinates = depot + rng.normal(0, 0.03, (bins, 2))
+    return Replay(start, increments, coordinates, depot, rng.uniform(0, 50, bins))
+
+
+async def history_replay(db, start: datetime, end: datetime, depot: Sequence[float],
+                         sensor_ids: Optional[List[int]] = None) -> Replay:
+    """
+    Hourly increments of every sensor (or `sensor_ids`) between `start` and
+    `end` from sensor_record. Drops in level are past collections and count
+    as no fill.
+    """
+    import pandas as pd
+
+    async with db.pool.connection() as conn:
+        cursor = await conn.execute(
+            "SELECT ID, latitude, longitude FROM sensor WHERE %s::INTEGER[] IS NULL OR ID = ANY(%s) ORDER BY ID",
+            (sensor_ids, sensor_ids))
+        sensors = await cursor.fetchall()
+        cursor = await conn.execute(
+            """
+            SELECT smort_ID, time_stamp, trash_level FROM sensor_record
+            WHERE time_stamp >= %s AND time_stamp < %s AND smort_ID = ANY(%s)
+            """, (start, end, [sensor[0] for sensor in sensors]))
+        records = await cursor.fetchall()
+
+    frame = pd.DataFrame(records, columns=['smort_ID', 'time_stamp', 'trash_level'])
+    frame['trash_level'] = frame['trash_level'].astype(float)
+    index = pd.date_range(start, end, freq='h', inclusive='left')
+    levels = (frame.pivot_table(index='time_stamp', columns='smort_ID', values='trash_level', aggfunc='last')
+              .reindex(columns=[sensor[0] for sensor in sensors])
+              .resample('h').last().reindex(index).ffill().fillna(0.0))
+    values = levels.to_numpy()
+    increments = np.clip(np.diff(values, axis=0, prepend=values[:1]), 0, None)
+    coordinates = np.array([[float(sensor[1]), float(sensor[2])] for sensor in sensors])
+    return Replay(start, increments, coordinates, depot, values[0], [sensor[0] for sensor in sensors])
+
+
+class State:
+    """What a policy sees at a collection shift."""
+
+    def __init__(self, hour: int, time_stamp: datetime, levels: np.ndarray, replay: Replay,
+                 frequency_hours: int):
+        self.hour = hour
+        self.time_stamp = time_stamp
+        self.levels = levels
+        self.replay = replay
+        self.frequency_hours = frequency_hours
+
+    def hours_until_full_oracle(self) -> np.ndarray:
+        """True hours until each bin reaches FULL_LEVEL, from the future increments (inf beyond the lookahead)."""
+        future = self.replay.increments[self.hour:self.hour + LOOKAHEAD_HOURS]
+        filled = self.levels + np.cumsum(future, axis=0)
+        reached = filled >= FULL_LEVEL
+        hours = np.where(reached.any(axis=0), reached.argmax(axis=0) + 1.0, np.inf)
+        return np.where(self.levels >= FULL_LEVEL, 0.0, hours)
+
+    def hours_until_full_rate(self) -> np.ndarray:
+        """Hours until full at each bin's mean fill rate over the last RATE_WINDOW_HOURS."""
+        past = self.replay.increments[max(self.hour - RATE_WINDOW_HOURS, 0):self.hour]
+        rate = past.mean(axis=0) if len(past) else np.zeros(len(self.levels))
+        with np.errstate(divide='ignore'):
+            hours = np.where(rate > 0, (FULL_LEVEL - self.levels) / rate, np.inf)
+        return np.maximum(hours, 0.0)
+
+
+Policy = Callable[[State], np.ndarray]
+
+
+def threshold_policy(level: float = 70) -> Policy:
+    """Collect every bin at least `level` full."""
+    return lambda state: state.levels >= level
+
+
+def rule_policy(forecast: str = "rate") -> Policy:
+    """
+    get_sensors_for_collection's rule: collect a bin if it is forecast to be
+    full (less BUFFER_HOURS) before the next shift. `forecast` is "rate"
+    (recent fill rate) or "oracle" (the actual future).
+    """
+    def policy(state: State) -> np.ndarray:
+        if forecast == "oracle":
+            hours = state.hours_until_full_oracle()
+        else:
+            hours = state.hours_until_full_rate()
+        return hours - BUFFER_HOURS <= state.frequency_hours
+    return policy
+
+
+def scheduler_policy(frequency_hours: int, start: datetime) -> Policy:
+    """The rolling-horizon CollectionScheduler fed rate forecasts, collecting its trip for each shift."""
+    from scheduler import CollectionScheduler
+
+    scheduler = CollectionScheduler(frequency_hours, start)
+
+    def policy(state: State) -> np.ndarray:
+        scheduler.roll(state.time_stamp)
+        hours = state.hours_until_full_rate()
+        for i in range(len(state.levels)):
+            if np.isfinite(hours[i]):
+                scheduler.update(i, *state.replay.coordinates[i], float(state.levels[i]), float(hours[i]))
+            else:
+                scheduler.remove(i)
+        collect = np.zeros(len(state.levels), dtype=bool)
+        collect[scheduler.trips.get(scheduler._first_shift(state.time_stamp), [])] = True
+        for i in np.flatnonzero(collect):
+            scheduler.remove(int(i))
+        return collect
+    return policy
+
+
+def simulate(replay: Replay, policy: Policy, frequency_hours: int = 24, routing: str = "tsp",
+             provider: Optional[DistanceProvider] = None, route_budget_ms: float = 20) -> Dict:
+    """
+    Replay `replay` through `policy`, which picks the bins to empty at each
+    shift (every `frequency_hours`); the picked bins are routed from the
+    depot with `routing` ("tsp", "greedy" or "vrp") over distances from
+    `provider` (haversine by default, so no network is needed).
+
+    Between shifts, levels of all bins over all hours are computed in one
+    cumulative sum, so the Python loop only runs once per shift. Bins fill
+    linearly within each hour, so overflow minutes count from the minute a
+    bin crosses OVERFLOW_LEVEL, not from the end of that hour.
+    """
+    provider = provider or HaversineDistanceProvider()
+    points = [f"{lat},{lng}" for lat, lng in np.vstack((replay.depot, replay.coordinates))]
+    matrix = np.asarray(asyncio.run(provider.matrix(points, open_route=True)), dtype=float)
+
+    levels = replay.initial_levels.copy()
+    overflow_minutes = 0.0
+    overflow_events = 0
+    collections = 0
+    collected_level = 0.0
+    trips = 0
+    trucks = 0
+    distance = 0.0
+    started = time.perf_counter()
+
+    for hour in range(0, replay.hours, frequency_hours):
+        state = State(hour, replay.start + timedelta(hours=hour), levels, replay, frequency_hours)
+        collect = np.asarray(policy(state), dtype=bool)
+        picked = np.flatnonzero(collect)
+        if len(picked):
+            trips += 1
+            collections += len(picked)
+            collected_level += float(levels[picked].sum())
+            levels = np.where(collect, 0.0, levels)
+            stops = [0] + list(picked + 1)
+            sub = matrix[np.ix_(stops, stops)]
+            if routing == "vrp":
+                from vrp import plan_fleet
+
+                loads = np.concatenate(([0.0], np.full(len(picked), 100.0)))
+                coordinates = np.vstack((replay.depot, replay.coordinates[picked]))
+                plan = plan_fleet(sub, coordinates, loads, time_budget_ms=route_budget_ms * 10)
+                distance += plan.length
+                trucks += len(plan.routes)
+            else:
+                if routing == "greedy" or len(stops) <= 2:
+                    order = nearest_neighbour(sub)
+                else:
+                    order = solve(sub, time_budget_ms=route_budget_ms, bound=False).order
+                distance += tour_length(sub, order)
+                trucks += 1
+
+        # Every bin, every hour until the next shift, in one pass
+        block = replay.increments[hour:hour + frequency_hours]
+        filled = levels + np.cumsum(block, axis=0)
+        over = filled >= OVERFLOW_LEVEL
+        if over.any():
+            before = np.vstack((levels, filled[:-1]))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                share = np.where(before >= OVERFLOW_LEVEL, 1.0,
+                                 (filled - OVERFLOW_LEVEL) / (filled - before))
+            overflow_minutes += 60 * float(share[over].sum())
+        overflow_events += int((over.any(axis=0) & (levels < OVERFLOW_LEVEL)).sum())
+        levels = np.minimum(filled[-1], OVERFLOW_LEVEL) if len(block) else levels
+
+    return {
+        'bins': len(replay.sensor_ids),
+        'days': replay.hours / 24,
+        'trips': trips,
+        'trucks': trucks,
+        'collections': collections,
+        'mean_level_collected': collected_level / collections if collections else None,
+        'distance_km': distance / 1000,
+        'overflow_minutes': round(overflow_minutes),
+        'overflow_events': overflow_events,
+        'runtime_s': time.perf_counter() - started,
+    }
+
+
+def compare(replay: Replay, policies: Dict[str, Policy], frequency_hours: int = 24, **kwargs) -> None:
+    print(f"{replay.increments.shape[1]} bins, {replay.hours / 24:.0f} days, shifts every {frequency_hours} h")
+    print(f"{'policy':>16} {'trips':>6} {'collections':>12} {'level':>6} {'km':>10} "
+          f"{'overflow min':>13} {'events':>7} {'run s':>6}")
+    for name, policy in policies.items():
+        result = simulate(replay, policy, frequency_hours, **kwargs)
+        level = result['mean_level_collected'] or 0
+        print(f"{name:>16} {result['trips']:>6} {result['collections']:>12} {level:>5.0f}% "
+              f"{result['distance_km']:>10.0f} {result['overflow_minutes']:>13} "
+              f"{result['overflow_events']:>7} {result['runtime_s']:>6.1f}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--history" in sys.argv:
+        from os import getenv
+        from pathlib import Path
+        from dotenv import load_dotenv
+        from database import Database
+
+        load_dotenv(dotenv_path=Path(__file__).resolve().parents[3] / '.env')
+
+        async def load():
+            db = Database(getenv("DB_HOST"), getenv("DB_PORT"), getenv("DB_USER"),
+                          getenv("DB_PASSWORD"), getenv("DB_NAME"))
+            await db.open()
+            try:
+                return await history_replay(db, datetime(2025, 2, 2), datetime(2025, 4, 27), (4.382281, 100.970367))
+            finally:
+                await db.close_connection()
+
+        replay = asyncio.run(load())
+    else:
+        replay = synthetic_replay()
+
+    compare(replay, {
+        'threshold 70%': threshold_policy(70),
+        'rule (rate)': rule_policy("rate"),
+        'rule (oracle)': rule_policy("oracle"),
+        'scheduler': scheduler_policy(24, replay.start),
+    })
@@ -1,78 +1,108 @@
+import math
 import os
 import joblib
 import pandas as pd
 import os
-from typing import Dict
+from typing import Dict, List, Optional
 from database import  Database
 from dotenv import load_dotenv
 from pathlib import Path
 import asyncio 
+from contextlib import asynccontextmanager
 from randomForest import SmortML
+from model_registry import ModelRegistry, default_model_directory, get_registry
+from rollout import batch_predictor, rollout_batch
+from forecast_cache import ForecastCache, get_forecast_cache
 import random
 class SmortPredictor:
-    def __init__(self, model_dir: str, sensor_ids: list):
+    def __init__(self, model_dir: str, sensor_ids: list, registry: ModelRegistry = None):
         self.model_dir = model_dir
         self.sensors = sensor_ids
-        self.models = self.load_models()
+        self.registry = registry if registry is not None else get_registry(model_dir)
 
     def load_models(self) -> Dict[int, joblib]:
+        # Warms the shared registry; models are otherwise loaded on first use
         models = {}
         for sensor_id in self.sensors:
-            model_path = os.path.join(self.model_dir, f"sensor_{sensor_id}_model.joblib")
-            print(f"model path: {model_path} loaded")
-            if os.path.exists(model_path):
-                models[sensor_id] = joblib.load(model_path)
-            else:
-                print(f"Warning: Model file not found for sensor {sensor_id}")
+            model = self.registry.get(sensor_id)
+            if model is not None:
+                models[sensor_id] = model
         return models
 
-    def predict_full_level(self, sensor_id: int, latest_data: dict, threshold=90, max_steps=1000):
-        if sensor_id not in self.models:
-            raise ValueError(f"Model for sensor {sensor_id} is not loaded.")
+    def get_model(self, sensor_id: int):
+        if sensor_id not in self.sensors:
+            return None
+        return self.registry.get(sensor_id)
 
-        model = self.models[sensor_id]
-        last_timestamp = latest_data['time_stamp']
-        current_data = latest_data.copy()
+    def predict_full_level(self, sensor_id: int, latest_data: dict, threshold=90, max_steps=1000,
+                           unreached: Optional[set] = None):
+        if self.get_model(sensor_id) is None:
+            raise ValueError(f"Model for sensor {sensor_id} is not loaded.")
 
-        # Check if already full
-        if current_data['trash_level'] >= threshold:
-            return {
-                'sensor_id': sensor_id,
-                'predicted_timestamp': last_timestamp,
-                'hours_until_full': 0,
-                'predicted_level': current_data['trash_level']
-            }
+        return self.predict_full_levels({sensor_id: latest_data}, threshold, max_steps, unreached=unreached)[0]
 
-        predictions = []
-        for step in range(max_steps):
-            future_time = last_timestamp + pd.Timedelta(minutes=(step + 1) * 15)
-            features = {
-                'hour': future_time.hour,
-                'day_of_week': future_time.dayofweek,
-                'month': future_time.month,
-                'is_weekend': int(future_time.dayofweek in [5, 6]),
-                'lag_1': current_data['trash_level'],
-                'lag_2': current_data['lag_1'],
-                'lag_3': current_data['lag_2']
-            }
+    def predict_full_levels(self, latest_by_sensor: Dict[int, dict], threshold=90, max_steps=1000,
+                            horizon_only: bool = False, unreached: Optional[set] = None) -> List[dict]:
+        """
+        Forecast several sensors at once. Sensors still below the threshold are
+        stepped through the rollout together, one stacked feature matrix per step.
 
-            pred = model.predict(pd.DataFrame([features]))[0]
-            predictions.append(pred)
+        With `horizon_only`, `max_steps` is a planning horizon: sensors not full
+        within it are reported as full just after it, flagged 'beyond_horizon',
+        instead of getting the 3-4 day placeholder. Sensors not full within
+        `max_steps` are added to `unreached`, when given.
+        """
+        results = {}
+        batch_ids, timestamps, levels = [], [], []
+        models, owner, model_index = [], [], {}
 
-            # Update the lags
-            current_data['lag_3'] = current_data['lag_2']
-            current_data['lag_2'] = current_data['lag_1']
-            current_data['lag_1'] = pred
-            current_data['trash_level'] = pred
+        for sensor_id, latest_data in latest_by_sensor.items():
+            model = self.get_model(sensor_id)
+            if model is None:
+                print(f"Warning: Model for sensor {sensor_id} is not loaded. Skipping.")
+                continue
 
-            if pred >= threshold:
-                predicted_time = last_timestamp + pd.Timedelta(minutes=(step + 1) * 15)
-                return {
+            # Check if already full
+            if latest_data['trash_level'] >= threshold:
+                results[sensor_id] = {
                     'sensor_id': sensor_id,
-                    'predicted_timestamp': predicted_time,
-                    'hours_until_full': (step + 1) * 0.25,  # 15 minutes = 0.25 hours
-                    'predicted_level': pred
+                    'predicted_timestamp': latest_data['time_stamp'],
+                    'hours_until_full': 0,
+                    'predicted_level': latest_data['trash_level']
                 }
+                continue
+
+            if id(model) not in model_index:
+                model_index[id(model)] = len(models)
+                models.append(model)
+            owner.append(model_index[id(model)])
+            batch_ids.append(sensor_id)
+            timestamps.append(latest_data['time_stamp'])
+            levels.append((latest_data['trash_level'], latest_data['lag_1'], latest_data['lag_2']))
+
+        if batch_ids:
+            steps, predicted = rollout_batch(batch_predictor(models, owner), timestamps, levels,
+                                             threshold, max_steps)
+            for i, sensor_id in enumerate(batch_ids):
+                if not steps[i] and unreached is not None:
+                    unreached.add(sensor_id)
+                if horizon_only and not steps[i]:
+                    results[sensor_id] = self._beyond_horizon(sensor_id, timestamps[i], max_steps, threshold)
+                    continue
+                results[sensor_id] = self._prediction(sensor_id, timestamps[i], int(steps[i]),
+                                                      float(predicted[i]), threshold)
+
+        return [results[sensor_id] for sensor_id in latest_by_sensor if sensor_id in results]
+
+    def _prediction(self, sensor_id: int, last_timestamp, steps: int, pred: float, threshold) -> dict:
+        if steps:
+            predicted_time = last_timestamp + pd.Timedelta(minutes=steps * 15)
+            return {
+                'sensor_id': sensor_id,
+                'predicted_timestamp': predicted_time,
+                'hours_until_full': steps * 0.25,  # 15 minutes = 0.25 hours
+                'predicted_level': pred
+            }
 
         # If threshold is never reached
         random_minutes = random.randint(3 * 24 * 4, 4 * 24 * 4) * 15  # 3-4 days, in 15-min steps
@@ -85,35 +115,143 @@ class SmortPredictor:
             'predicted_level': threshold
         }
 
+
+    def _beyond_horizon(self, sensor_id: int, last_timestamp, max_steps: int, threshold) -> dict:
+        steps = max_steps + 1
+        return {
+            'sensor_id': sensor_id,
+            'predicted_timestamp': last_timestamp + pd.Timedelta(minutes=steps * 15),
+            'hours_until_full': steps * 0.25,
+            'predicted_level': threshold,
+            'beyond_horizon': True
+        }
+
+
+def latest_records_to_data(latest_data: list) -> Optional[dict]:
+    """Build the rollout input from the 4 most recent (smort_ID, time_stamp, trash_level) rows."""
+    if len(latest_data) < 4:
+        return None
+    return {
+        'time_stamp': pd.Timestamp(latest_data[0][1]),
+        'trash_level': float(latest_data[0][2]),
+        'lag_1': float(latest_data[1][2]),
+        'lag_2': float(latest_data[2][2]),
+        'lag_3': float(latest_data[3][2])
+    }
+
+
 class smortPredictorImplementor:
-    def __init__(self, model_directory=None, sensor_ids=[1, 2, 3, 4, 5, 6, 7, 8, 9]):
+    def __init__(self, model_directory=None, sensor_ids=[1, 2, 3, 4, 5, 6, 7, 8, 9],
+                 cache: ForecastCache = None, db: Database = None):
         if model_directory is None:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            model_directory = os.path.abspath(os.path.join(base_dir, '..', 'ML-model'))
+            model_directory = default_model_directory()
 
         self.model_directory = model_directory
         self.sensor_ids = sensor_ids
         self.predictor = SmortPredictor(self.model_directory, self.sensor_ids)
+        self.cache = cache if cache is not None else get_forecast_cache()
+        # Shared pool (the API's); without one each call opens a short-lived pool
+        self.db = db
+
+    @asynccontextmanager
+    async def _database(self, db: Database = None):
+        db = db or self.db
+        if db is not None:
+            yield db
+            return
 
-    async def predict_full_level(self, sensor_id: int):
         env_path = Path(__file__).resolve().parents[3] / '.env'
         load_dotenv(dotenv_path=env_path)
         db = Database(os.getenv("DB_HOST"), os.getenv("DB_PORT"), os.getenv("DB_USER"),
-                      os.getenv("DB_PASSWORD"), os.getenv("DB_NAME"))
+                      os.getenv("DB_PASSWORD"), os.getenv("DB_NAME"), min_size=1, max_size=1)
+        await db.open()
+        try:
+            yield db
+        finally:
+            await db.close_connection()
 
-        latest_data = await db.get_latest_sensor_record(
-            sensor_ID=sensor_id, num_of_row=4)
+    async def predict_full_level(self, sensor_id: int, db: Database = None):
+        version = self.predictor.registry.version(sensor_id)
+        cached = self.cache.get(sensor_id, version)
+        if cached is not None:
+            return cached
 
-        data = {
-            'time_stamp': pd.Timestamp(latest_data[0][1]),
-            'trash_level': float(latest_data[0][2]),
-            'lag_1': float(latest_data[1][2]),
-            'lag_2': float(latest_data[2][2]),
-            'lag_3': float(latest_data[3][2])
-        }
+        generation = self.cache.generation(sensor_id)
+        async with self._database(db) as db:
+            latest_data = await db.get_latest_sensor_record(
+                sensor_ID=sensor_id, num_of_row=4)
+
+        data = latest_records_to_data(latest_data)
+        if data is None:
+            print(f"Warning: Not enough records for sensor {sensor_id}. Skipping.")
+            return None
+
+        unreached = set()
+        prediction = await asyncio.to_thread(self.predictor.predict_full_level, sensor_id, data,
+                                             unreached=unreached)
+        # The never-full placeholder is random; a horizon-capped caller must not get it from the cache
+        if sensor_id not in unreached:
+            self.cache.put(sensor_id, data['time_stamp'], version, prediction, generation)
+        return prediction
+
+    async def predict_sensors(self, sensor_ids: List[int], db: Database = None,
+                              latest_records: Dict[int, list] = None,
+                              horizon_hours: Optional[float] = None) -> List[dict]:
+        """
+        Forecast a group of sensors in one batched rollout, reusing cached
+        forecasts. The lags of the rest come from `latest_records` (sensor ->
+        newest-first rows, as the planner already has them) or one bulk query.
+
+        The rollout runs in a worker thread. Callers that only need to know
+        which sensors are full within `horizon_hours` (the planner) stop the
+        rollout there; sensors beyond it are flagged 'beyond_horizon'. Neither
+        those nor the never-full placeholders are cached, so a cached forecast
+        is always a real time to full.
+        """
+        max_steps = 1000
+        if horizon_hours is not None:
+            max_steps = min(max(math.ceil(horizon_hours * 4), 1), max_steps)
+        results = {}
+        versions = {}
+        for sensor_id in sensor_ids:
+            versions[sensor_id] = self.predictor.registry.version(sensor_id)
+            cached = self.cache.get(sensor_id, versions[sensor_id])
+            if cached is not None:
+                results[sensor_id] = cached
+
+        missing = [sensor_id for sensor_id in sensor_ids if sensor_id not in results]
+        if missing:
+            generations = {sensor_id: self.cache.generation(sensor_id) for sensor_id in missing}
+            if latest_records is None or any(sensor_id not in latest_records for sensor_id in missing):
+                async with self._database(db) as db:
+                    latest_records = await db.get_latest_sensor_records(missing, num_of_row=4)
+
+            latest_by_sensor = {}
+            for sensor_id in missing:
+                data = latest_records_to_data(latest_records.get(sensor_id, []))
+                if data is None:
+                    print(f"Warning: Not enough records for sensor {sensor_id}. Skipping.")
+                    continue
+                latest_by_sensor[sensor_id] = data
+
+            unreached = set()
+            predictions = await asyncio.to_thread(self.predictor.predict_full_levels, latest_by_sensor,
+                                                  max_steps=max_steps, horizon_only=horizon_hours is not None,
+                                                  unreached=unreached)
+            for prediction in predictions:
+                sensor_id = prediction['sensor_id']
+                results[sensor_id] = prediction
+                if sensor_id in unreached:
+                    continue
+                self.cache.put(sensor_id, latest_by_sensor[sensor_id]['time_stamp'],
+                               versions[sensor_id], prediction, generations[sensor_id])
+
+        return [results[sensor_id] for sensor_id in sensor_ids if sensor_id in results]
 
-        # Now it uses the 
-        return self.predictor.predict_full_level(sensor_id, data)
+    async def predict_region(self, region_id: int, db: Database = None) -> List[dict]:
+        async with self._database(db) as db:
+            sensors = await db.get_region_sensors(region_id)
+            return await self.predict_sensors([sensor[0] for sensor in sensors], db)
 
 if __name__ == "__main__":
     # example of predicting sensor 9
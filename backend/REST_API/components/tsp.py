@@ -0,0 +1,305 @@
+import math
+import random
+import time
+from os import getenv
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+# Up to this many stops (besides the start) are solved exactly
+HELD_KARP_MAX_STOPS = 12
+DEFAULT_TIME_BUDGET_MS = 200
+# Longest run of consecutive stops an Or-opt move relocates
+OR_OPT_MAX_SEGMENT = 3
+
+
+class Tour(NamedTuple):
+    order: List[int]     # matrix indices, starting with 0 (the start point)
+    length: float        # in the matrix's unit (metres for the Distance Matrix API)
+    lower_bound: float   # no tour can be shorter than this
+    gap: float           # (length - lower_bound) / lower_bound; 0.0 when proven optimal
+    exact: bool          # solved by Held-Karp
+
+
+def _working_matrix(matrix: Sequence[Sequence[float]], closed: bool) -> np.ndarray:
+    """
+    Float copy of `matrix` for solving as a closed tour from index 0.
+    An open route (the truck stops at the last bin) is a closed tour whose
+    way back to the start is free.
+    """
+    d = np.array(matrix, dtype=float)
+    if d.ndim != 2 or d.shape[0] != d.shape[1]:
+        raise ValueError("Distance matrix must be square")
+    if not closed:
+        d[:, 0] = 0.0
+    np.fill_diagonal(d, 0.0)
+    return d
+
+
+def _cycle_length(d: np.ndarray, order: Sequence[int]) -> float:
+    order = np.asarray(order)
+    return float(d[order, np.roll(order, -1)].sum())
+
+
+def tour_length(matrix: Sequence[Sequence[float]], order: Sequence[int], closed: bool = False) -> float:
+    """Length of visiting `order` (starting at order[0]), returning to it if `closed`."""
+    d = np.asarray(matrix, dtype=float)
+    legs = sum(d[a, b] for a, b in zip(order, order[1:]))
+    if closed and len(order) > 1:
+        legs += d[order[-1], order[0]]
+    return float(legs)
+
+
+def nearest_neighbour(matrix: Sequence[Sequence[float]]) -> List[int]:
+    """Greedy order from index 0: always drive to the closest unvisited stop."""
+    d = np.asarray(matrix, dtype=float)
+    unvisited = set(range(1, len(d)))
+    order = [0]
+    while unvisited:
+        current = order[-1]
+        nearest = min(unvisited, key=lambda i: d[current, i])
+        order.append(nearest)
+        unvisited.remove(nearest)
+    return order
+
+
+def held_karp(d: np.ndarray) -> List[int]:
+    """Optimal closed tour from 0 by dynamic programming over subsets, O(2^n n^2)."""
+    n = len(d) - 1  # stops besides the start
+    if n <= 1:
+        return list(range(n + 1))
+
+    full = 1 << n
+    # cost[mask, j]: shortest path from 0 through the stops in mask, ending at stop j
+    cost = np.full((full, n), np.inf)
+    parent = np.full((full, n), -1, dtype=np.int64)
+    stops = d[1:, 1:]
+    cost[1 << np.arange(n), np.arange(n)] = d[0, 1:]
+    for mask in range(1, full):
+        members = [j for j in range(n) if mask >> j & 1]
+        if len(members) < 2:
+            continue
+        for j in members:
+            previous = mask ^ (1 << j)
+            candidates = cost[previous] + stops[:, j]
+            k = int(np.argmin(candidates))
+            cost[mask, j] = candidates[k]
+            parent[mask, j] = k
+
+    last = int(np.argmin(cost[full - 1] + d[1:, 0]))
+    order, mask = [], full - 1
+    while last >= 0:
+        order.append(last + 1)
+        last, mask = int(parent[mask, last]), mask ^ (1 << last)
+    return [0] + order[::-1]
+
+
+def _two_opt(d: np.ndarray, order: List[int], deadline: float) -> bool:
+    """
+    Reverse segments while that shortens the tour. Reversed legs are
+    re-costed in their new direction, so asymmetric matrices (one-way
+    streets) are handled. Returns whether anything improved.
+    """
+    improved_any = False
+    n = len(order)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        t = np.array(order + [order[0]])
+        forward = np.concatenate(([0.0], np.cumsum(d[t[:-1], t[1:]])))
+        backward = np.concatenate(([0.0], np.cumsum(d[t[1:], t[:-1]])))
+        for i in range(1, n - 1):
+            j = np.arange(i + 1, n)
+            old = d[t[i - 1], t[i]] + (forward[j] - forward[i]) + d[t[j], t[j + 1]]
+            new = d[t[i - 1], t[j]] + (backward[j] - backward[i]) + d[t[i], t[j + 1]]
+            delta = new - old
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = int(j[best])
+                order[i:j + 1] = order[i:j + 1][::-1]
+                improved = improved_any = True
+                break
+    return improved_any
+
+
+def _or_opt(d: np.ndarray, order: List[int], deadline: float) -> bool:
+    """Move runs of up to OR_OPT_MAX_SEGMENT consecutive stops elsewhere in the tour."""
+    improved_any = False
+    n = len(order)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for length in range(1, min(OR_OPT_MAX_SEGMENT, n - 2) + 1):
+            for i in range(1, n - length + 1):
+                first, last = order[i], order[i + length - 1]
+                before, after = order[i - 1], order[(i + length) % n]
+                removed = d[before, first] + d[last, after] - d[before, after]
+                rest = order[:i] + order[i + length:]
+                t = np.array(rest + [rest[0]])
+                inserted = d[t[:-1], first] + d[last, t[1:]] - d[t[:-1], t[1:]]
+                inserted[i - 1] = np.inf  # where it came from
+                p = int(np.argmin(inserted))
+                if inserted[p] - removed < -1e-9:
+                    segment = order[i:i + length]
+                    order[:] = rest[:p + 1] + segment + rest[p + 1:]
+                    improved = improved_any = True
+                    break
+            if improved:
+                break
+    return improved_any
+
+
+def _local_search(d: np.ndarray, order: List[int], deadline: float) -> List[int]:
+    while time.perf_counter() < deadline:
+        if not (_two_opt(d, order, deadline) | _or_opt(d, order, deadline)):
+            break
+    return order
+
+
+def _perturb(order: List[int], rng: random.Random) -> List[int]:
+    """Double-bridge kick: reconnect three random cuts so 2-opt cannot simply undo it."""
+    n = len(order)
+    a, b, c = sorted(rng.sample(range(1, n), 3))
+    return order[:a] + order[b:c] + order[a:b] + order[c:]
+
+
+def _one_tree(c: np.ndarray):
+    """Weight and node degrees of the minimum 1-tree: an MST of 1..n-1 plus 0's two cheapest edges."""
+    n = len(c)
+    degree = np.zeros(n, dtype=np.int64)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[:2] = True  # 0 joins last, 1 seeds the tree
+    link = c[1].copy()
+    parent = np.ones(n, dtype=np.int64)
+    weight = 0.0
+    for _ in range(n - 2):
+        candidates = np.where(in_tree, np.inf, link)
+        j = int(np.argmin(candidates))
+        weight += candidates[j]
+        degree[j] += 1
+        degree[parent[j]] += 1
+        in_tree[j] = True
+        closer = c[j] < link
+        link[closer] = c[j][closer]
+        parent[closer] = j
+    nearest = np.argsort(c[0, 1:])[:2] + 1
+    weight += c[0, nearest].sum()
+    degree[0] = 2
+    degree[nearest] += 1
+    return weight, degree
+
+
+def lower_bound(d: np.ndarray, upper_bound: float, iterations: int = 100) -> float:
+    """
+    No tour is shorter than the best of two relaxations: the assignment
+    bound (each stop left and entered once, subtours allowed) and the
+    Held-Karp 1-tree bound on the cheaper direction of every pair, tightened
+    by subgradient optimisation. Both hold for asymmetric matrices.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    n = len(d)
+    if n < 3:
+        return _cycle_length(d, list(range(n)))
+    relaxed = d.copy()
+    np.fill_diagonal(relaxed, relaxed.max() * n + 1)
+    rows, cols = linear_sum_assignment(relaxed)
+    best = float(relaxed[rows, cols].sum())
+
+    symmetric = np.minimum(d, d.T)
+    np.fill_diagonal(symmetric, np.inf)
+    penalty = np.zeros(n)
+    step_scale = 2.0
+    for _ in range(iterations):
+        weight, degree = _one_tree(symmetric + penalty[:, None] + penalty[None, :])
+        bound = weight - 2 * penalty.sum()
+        if bound > best:
+            best = bound
+        slack = degree - 2
+        norm = float((slack ** 2).sum())
+        if norm == 0:  # the 1-tree is a tour, so it is optimal
+            break
+        penalty += step_scale * (upper_bound - bound) / norm * slack
+        step_scale *= 0.95
+    return best
+
+
+def solve(matrix: Sequence[Sequence[float]], closed: bool = False,
+          time_budget_ms: Optional[float] = None, seed: int = 0, bound: bool = True) -> Tour:
+    """
+    Shortest visit of every point in `matrix`, starting at index 0. Open
+    routes (the default) end at the last stop; closed ones return to 0.
+
+    Up to HELD_KARP_MAX_STOPS stops are solved exactly. Larger instances
+    start from the nearest-neighbour order, are improved by 2-opt and
+    Or-opt, and then kicked and re-improved until `time_budget_ms`
+    (TSP_TIME_BUDGET_MS) runs out, keeping the best tour found. The lower
+    bound costs extra time on top of the budget; `bound=False` skips it
+    (lower_bound 0, gap inf) for callers that only need the order.
+    """
+    if time_budget_ms is None:
+        time_budget_ms = float(getenv("TSP_TIME_BUDGET_MS") or DEFAULT_TIME_BUDGET_MS)
+    d = _working_matrix(matrix, closed)
+    n = len(d)
+
+    if n <= HELD_KARP_MAX_STOPS + 1:
+        order = held_karp(d) if n > 1 else list(range(n))
+        length = _cycle_length(d, order)
+        return Tour(order, length, length, 0.0, True)
+
+    deadline = time.perf_counter() + time_budget_ms / 1000
+    rng = random.Random(seed)
+    best = _local_search(d, nearest_neighbour(d), deadline)
+    best_length = _cycle_length(d, best)
+    while time.perf_counter() < deadline:
+        candidate = _local_search(d, _perturb(best, rng), deadline)
+        candidate_length = _cycle_length(d, candidate)
+        if candidate_length < best_length - 1e-9:
+            best, best_length = candidate, candidate_length
+
+    if not bound:
+        return Tour(best, best_length, 0.0, math.inf, False)
+    bound_length = lower_bound(d, best_length)
+    gap = (best_length - bound_length) / bound_length if bound_length > 0 else 0.0
+    return Tour(best, best_length, bound_length, gap, False)
+
+
+def benchmark(sizes=(8, 12, 25, 50, 100), instances: int = 5, seed: int = 0) -> None:
+    """
+    Compare the nearest-neighbour order router.sorting_waypoints used to
+    return with solve() on synthetic bin layouts: scattered over a campus,
+    and clustered around a few residential blocks, with street distances
+    approximated by Manhattan metres and 10% one-way asymmetry.
+    """
+    rng = np.random.default_rng(seed)
+    print(f"{'layout':>10} {'stops':>6} {'greedy m':>10} {'solver m':>10} {'saved':>7} "
+          f"{'gap':>7} {'exact':>6} {'time ms':>8}")
+    for layout in ("scattered", "clustered"):
+        for size in sizes:
+            totals = np.zeros(4)
+            exact = False
+            for _ in range(instances):
+                if layout == "scattered":
+                    points = rng.uniform(0, 3000, (size + 1, 2))
+                else:
+                    centres = rng.uniform(0, 3000, (max(size // 8, 2), 2))
+                    points = centres[rng.integers(len(centres), size=size + 1)] + rng.normal(0, 150, (size + 1, 2))
+                matrix = np.abs(points[:, None, :] - points[None, :, :]).sum(axis=2)
+                matrix *= rng.uniform(1.0, 1.1, matrix.shape)
+
+                greedy = tour_length(matrix, nearest_neighbour(matrix))
+                start = time.perf_counter()
+                tour = solve(matrix)
+                elapsed = (time.perf_counter() - start) * 1000
+                assert sorted(tour.order) == list(range(size + 1)) and tour.order[0] == 0
+                assert abs(tour_length(matrix, tour.order) - tour.length) < 1e-6
+                assert tour.length <= greedy + 1e-6
+                totals += (greedy, tour.length, tour.gap, elapsed)
+                exact = tour.exact
+            greedy, solved, gap, elapsed = totals / instances
+            print(f"{layout:>10} {size:>6} {greedy:>10.0f} {solved:>10.0f} {1 - solved / greedy:>7.1%} "
+                  f"{gap:>7.1%} {str(exact):>6} {elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    benchmark()
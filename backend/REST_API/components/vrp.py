@@ -0,0 +1,241 @@
+import math
+import random
+import time
+from os import getenv
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from tsp import solve, tour_length
+
+# A truck holds this many full bins (bin loads are in percent of a bin)
+DEFAULT_TRUCK_CAPACITY_BINS = 30
+DEFAULT_TIME_BUDGET_MS = 2000
+# Relocation only considers inserting a bin next to its nearest neighbours
+NEIGHBOURS = 10
+
+
+class Route(NamedTuple):
+    stops: List[int]     # matrix indices of the bins, in driving order (the depot 0 excluded)
+    load: float          # percent-of-bin units
+    length: float        # metres from the depot to the last bin
+
+
+class FleetPlan(NamedTuple):
+    routes: List[Route]
+    length: float
+    capacity: float
+
+
+def truck_capacity() -> float:
+    return 100.0 * float(getenv("TRUCK_CAPACITY_BINS") or DEFAULT_TRUCK_CAPACITY_BINS)
+
+
+def _path_length(d: np.ndarray, stops: Sequence[int]) -> float:
+    if not stops:
+        return 0.0
+    return float(d[0, stops[0]] + sum(d[a, b] for a, b in zip(stops, stops[1:])))
+
+
+def sweep(coordinates: np.ndarray, loads: np.ndarray, capacity: float, trucks: int) -> List[List[int]]:
+    """
+    Cluster bins 1..n-1 into `trucks` capacity-feasible groups by sweeping
+    a ray around the depot (coordinates[0]) and cutting whenever a group is
+    full or has its fair share of the total load.
+    """
+    offsets = coordinates[1:] - coordinates[0]
+    angles = np.arctan2(offsets[:, 0], offsets[:, 1] * math.cos(math.radians(coordinates[0, 0])))
+    order = np.argsort(angles) + 1
+    # Start the sweep at the widest angular gap, so no cluster straddles it
+    gaps = np.diff(np.concatenate((np.sort(angles), [np.sort(angles)[0] + 2 * math.pi])))
+    order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+
+    share = loads[1:].sum() / trucks
+    groups, current, load = [], [], 0.0
+    for stop in order:
+        if current and (load + loads[stop] > capacity
+                        or (load + loads[stop] / 2 > share and len(groups) < trucks - 1)):
+            groups.append(current)
+            current, load = [], 0.0
+        current.append(int(stop))
+        load += loads[stop]
+    groups.append(current)
+    return groups
+
+
+def _relocate(d: np.ndarray, loads: np.ndarray, capacity: float, routes: List[List[int]],
+              neighbours: np.ndarray, deadline: float, rng: random.Random) -> bool:
+    """
+    Move single bins to the route and position next to one of their nearest
+    neighbours that shortens the total distance, within capacity. Routes
+    are never emptied, so the requested number of trucks is kept.
+    """
+    route_of, position = {}, {}
+
+    def index(r):
+        for i, stop in enumerate(routes[r]):
+            route_of[stop], position[stop] = r, i
+
+    for r in range(len(routes)):
+        index(r)
+    route_loads = [float(loads[route].sum()) for route in routes]
+
+    def prev_of(stop):
+        i = position[stop]
+        return routes[route_of[stop]][i - 1] if i > 0 else 0
+
+    def next_of(stop):
+        route = routes[route_of[stop]]
+        i = position[stop]
+        return route[i + 1] if i + 1 < len(route) else None
+
+    def leg(a, b):
+        return d[a, b] if b is not None else 0.0
+
+    improved_any = False
+    stops = list(route_of)
+    rng.shuffle(stops)
+    for stop in stops:
+        if time.perf_counter() > deadline:
+            break
+        r = route_of[stop]
+        if len(routes[r]) == 1:
+            continue  # every truck keeps at least one stop
+        before, after = prev_of(stop), next_of(stop)
+        removed = d[before, stop] + leg(stop, after) - leg(before, after)
+
+        best = (1e-9, None, None)
+        for neighbour in neighbours[stop]:
+            target = route_of.get(int(neighbour))
+            if target is None or target == r or route_loads[target] + loads[stop] > capacity:
+                continue
+            # Insert just before or just after the neighbour
+            for p, q in ((prev_of(neighbour), neighbour), (neighbour, next_of(neighbour))):
+                gain = removed - (d[p, stop] + leg(stop, q) - leg(p, q))
+                if gain > best[0]:
+                    best = (gain, target, position[q] if q is not None else len(routes[target]))
+        if best[1] is None:
+            continue
+
+        _, target, at = best
+        routes[r].pop(position[stop])
+        routes[target].insert(at, stop)
+        route_loads[r] -= loads[stop]
+        route_loads[target] += loads[stop]
+        index(r)
+        index(target)
+        improved_any = True
+    return improved_any
+
+
+def plan_fleet(matrix: Sequence[Sequence[float]], coordinates: np.ndarray, loads: Sequence[float],
+               trucks: Optional[int] = None, capacity: Optional[float] = None,
+               time_budget_ms: Optional[float] = None, seed: int = 0) -> FleetPlan:
+    """
+    Split bins 1..n-1 of `matrix` across trucks starting at the depot 0,
+    each carrying at most `capacity` (TRUCK_CAPACITY_BINS full bins), and
+    order every truck's stops.
+
+    Bins are clustered by a sweep around the depot, each cluster is ordered
+    with tsp.solve, and bins are then relocated between neighbouring routes
+    while that shortens the total, re-ordering the routes that changed,
+    until `time_budget_ms` (VRP_TIME_BUDGET_MS) runs out. `trucks` defaults
+    to the fewest that can carry the load.
+    """
+    if capacity is None:
+        capacity = truck_capacity()
+    if time_budget_ms is None:
+        time_budget_ms = float(getenv("VRP_TIME_BUDGET_MS") or DEFAULT_TIME_BUDGET_MS)
+    d = np.asarray(matrix, dtype=float)
+    loads = np.asarray(loads, dtype=float)
+    n = len(d)
+    if n <= 1:
+        return FleetPlan([], 0.0, capacity)
+    if loads[1:].max() > capacity:
+        raise ValueError("A single bin exceeds the truck capacity")
+
+    minimum = max(math.ceil(loads[1:].sum() / capacity), 1)
+    trucks = max(trucks or minimum, minimum)
+    trucks = min(trucks, n - 1)
+    started = time.perf_counter()
+    deadline = started + time_budget_ms / 1000
+    rng = random.Random(seed)
+
+    # Sweep clusters can still overflow when loads are uneven; add trucks until they fit
+    while True:
+        routes = sweep(np.asarray(coordinates, dtype=float), loads, capacity, trucks)
+        if len(routes) <= trucks:
+            break
+        trucks += 1
+
+    def order(route: List[int], budget_ms: float) -> List[int]:
+        if len(route) < 2:
+            return route
+        points = [0] + route
+        tour = solve(d[np.ix_(points, points)], time_budget_ms=budget_ms, bound=False)
+        return [points[i] for i in tour.order[1:]]
+
+    per_route_ms = time_budget_ms / (4 * len(routes))
+    routes = [order(route, per_route_ms) for route in routes]
+
+    within = d[1:, 1:] + np.diag(np.full(n - 1, np.inf))
+    k = min(NEIGHBOURS, n - 2)
+    neighbours = np.zeros((n, k), dtype=np.int64)
+    if k > 0:
+        neighbours[1:] = np.argpartition(within, k - 1, axis=1)[:, :k] + 1
+
+    while time.perf_counter() < deadline:
+        before = [list(route) for route in routes]
+        if not _relocate(d, loads, capacity, routes, neighbours, deadline, rng):
+            break
+        remaining_ms = (deadline - time.perf_counter()) * 1000
+        changed = [i for i, route in enumerate(routes) if route != before[i]]
+        for i in changed:
+            reordered = order(routes[i], max(remaining_ms, 0) / (2 * len(changed)))
+            if _path_length(d, reordered) < _path_length(d, routes[i]):
+                routes[i] = reordered
+
+    result = [Route(route, float(loads[route].sum()), _path_length(d, route)) for route in routes if route]
+    return FleetPlan(result, sum(route.length for route in result), capacity)
+
+
+def benchmark(bins: int = 1000, seed: int = 0) -> None:
+    """
+    Plan 1,000 bins spread over a 10 km town with haversine distances and
+    compare the sweep clusters (each ordered by nearest neighbour) with the
+    optimized plan.
+    """
+    from distance_provider import HaversineDistanceProvider, haversine_matrix
+    from tsp import nearest_neighbour
+
+    rng = np.random.default_rng(seed)
+    depot = np.array([4.38, 100.97])
+    coordinates = np.vstack((depot, depot + rng.normal(0, 0.03, (bins, 2))))
+    loads = np.concatenate(([0.0], rng.uniform(60, 100, bins)))
+    d = haversine_matrix(coordinates, coordinates) * HaversineDistanceProvider().detour_factor
+    capacity = truck_capacity()
+
+    trucks = math.ceil(loads.sum() / capacity)
+    baseline = 0.0
+    for group in sweep(coordinates, loads, capacity, trucks):
+        points = [0] + group
+        greedy = nearest_neighbour(d[np.ix_(points, points)])
+        baseline += tour_length(d[np.ix_(points, points)], greedy)
+
+    start = time.perf_counter()
+    plan = plan_fleet(d, coordinates, loads)
+    elapsed = time.perf_counter() - start
+
+    served = sorted(stop for route in plan.routes for stop in route.stops)
+    assert served == list(range(1, bins + 1)), "every bin is served exactly once"
+    assert all(route.load <= capacity + 1e-9 for route in plan.routes), "capacity respected"
+    print(f"{bins} bins, {len(plan.routes)} trucks of {capacity / 100:.0f} full bins")
+    print(f"sweep + nearest neighbour: {baseline / 1000:.1f} km")
+    print(f"sweep + TSP + relocate:    {plan.length / 1000:.1f} km "
+          f"({1 - plan.length / baseline:.1%} shorter) in {elapsed:.1f} s")
+    fullest = max(route.load for route in plan.routes) / capacity
+    print(f"fullest truck {fullest:.0%}, longest route {max(r.length for r in plan.routes) / 1000:.1f} km")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,35 @@
+-- Adds sensor_latest (see smort.sql) to an existing database and backfills it.
+BEGIN;
+
+CREATE TABLE sensor_latest (
+    smort_ID INTEGER PRIMARY KEY,
+    time_stamp TIMESTAMP NOT NULL,
+    trash_level DECIMAL(5,2),
+    FOREIGN KEY (smort_ID) REFERENCES sensor(ID) ON DELETE CASCADE
+);
+
+CREATE FUNCTION sensor_latest_upsert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_latest (smort_ID, time_stamp, trash_level)
+    VALUES (NEW.smort_ID, NEW.time_stamp, NEW.trash_level)
+    ON CONFLICT (smort_ID) DO UPDATE
+        SET time_stamp = EXCLUDED.time_stamp,
+            trash_level = EXCLUDED.trash_level
+        WHERE sensor_latest.time_stamp <= EXCLUDED.time_stamp;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Block writers while backfilling so no reading slips between the two steps
+LOCK TABLE sensor_record IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TRIGGER sensor_record_latest
+    AFTER INSERT ON sensor_record
+    FOR EACH ROW EXECUTE FUNCTION sensor_latest_upsert();
+
+INSERT INTO sensor_latest (smort_ID, time_stamp, trash_level)
+SELECT DISTINCT ON (smort_ID) smort_ID, time_stamp, trash_level
+FROM sensor_record
+ORDER BY smort_ID, time_stamp DESC;
+
+COMMIT;
@@ -0,0 +1,9 @@
+-- Step 1 of moving camera images out of sensor_record: add the blob
+-- reference column. Then run `python blob_store.py` from components/ to move
+-- the inline base64 images into the image store, and apply 003.
+BEGIN;
+
+ALTER TABLE sensor_record ADD COLUMN image_ref CHAR(64);
+ALTER TABLE sensor_record ALTER COLUMN image DROP NOT NULL;
+
+COMMIT;
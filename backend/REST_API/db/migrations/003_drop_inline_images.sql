@@ -0,0 +1,14 @@
+-- Step 2: drop the inline image column once blob_store.py has moved every image.
+BEGIN;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM sensor_record WHERE image <> '' AND image_ref IS NULL) THEN
+        RAISE EXCEPTION 'sensor_record still has inline images; run blob_store.py first';
+    END IF;
+END;
+$$;
+
+ALTER TABLE sensor_record DROP COLUMN image;
+
+COMMIT;
@@ -0,0 +1,94 @@
+-- Adds the hourly/daily rollups (see smort.sql) to an existing database and backfills them.
+BEGIN;
+
+-- Per sensor per hour/day aggregates, maintained by a statement trigger on
+-- sensor_record so analytics read a few hundred rows instead of raw history.
+-- Rows are only ever added to: deleting raw readings keeps their rollups.
+CREATE TABLE sensor_record_hourly (
+    smort_ID INTEGER NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    min_level DECIMAL(5,2),
+    max_level DECIMAL(5,2),
+    sum_level DECIMAL(14,2) NOT NULL DEFAULT 0,
+    readings INTEGER NOT NULL DEFAULT 0,
+    last_time TIMESTAMP NOT NULL,
+    last_level DECIMAL(5,2),
+    PRIMARY KEY (smort_ID, bucket),
+    FOREIGN KEY (smort_ID) REFERENCES sensor(ID) ON DELETE CASCADE
+);
+
+CREATE TABLE sensor_record_daily (
+    smort_ID INTEGER NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    min_level DECIMAL(5,2),
+    max_level DECIMAL(5,2),
+    sum_level DECIMAL(14,2) NOT NULL DEFAULT 0,
+    readings INTEGER NOT NULL DEFAULT 0,
+    last_time TIMESTAMP NOT NULL,
+    last_level DECIMAL(5,2),
+    PRIMARY KEY (smort_ID, bucket),
+    FOREIGN KEY (smort_ID) REFERENCES sensor(ID) ON DELETE CASCADE
+);
+
+CREATE FUNCTION sensor_rollup_upsert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_record_hourly AS r
+        (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+    SELECT smort_ID, date_trunc('hour', time_stamp), MIN(trash_level), MAX(trash_level),
+           COALESCE(SUM(trash_level), 0), COUNT(trash_level), MAX(time_stamp),
+           (ARRAY_AGG(trash_level ORDER BY time_stamp DESC))[1]
+    FROM new_records
+    GROUP BY 1, 2
+    ON CONFLICT (smort_ID, bucket) DO UPDATE
+        SET min_level = LEAST(r.min_level, EXCLUDED.min_level),
+            max_level = GREATEST(r.max_level, EXCLUDED.max_level),
+            sum_level = r.sum_level + EXCLUDED.sum_level,
+            readings = r.readings + EXCLUDED.readings,
+            last_level = CASE WHEN EXCLUDED.last_time >= r.last_time
+                              THEN EXCLUDED.last_level ELSE r.last_level END,
+            last_time = GREATEST(r.last_time, EXCLUDED.last_time);
+
+    INSERT INTO sensor_record_daily AS r
+        (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+    SELECT smort_ID, date_trunc('day', time_stamp), MIN(trash_level), MAX(trash_level),
+           COALESCE(SUM(trash_level), 0), COUNT(trash_level), MAX(time_stamp),
+           (ARRAY_AGG(trash_level ORDER BY time_stamp DESC))[1]
+    FROM new_records
+    GROUP BY 1, 2
+    ON CONFLICT (smort_ID, bucket) DO UPDATE
+        SET min_level = LEAST(r.min_level, EXCLUDED.min_level),
+            max_level = GREATEST(r.max_level, EXCLUDED.max_level),
+            sum_level = r.sum_level + EXCLUDED.sum_level,
+            readings = r.readings + EXCLUDED.readings,
+            last_level = CASE WHEN EXCLUDED.last_time >= r.last_time
+                              THEN EXCLUDED.last_level ELSE r.last_level END,
+            last_time = GREATEST(r.last_time, EXCLUDED.last_time);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Block writers while backfilling so no reading is counted twice or missed
+LOCK TABLE sensor_record IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TRIGGER sensor_record_rollup
+    AFTER INSERT ON sensor_record
+    REFERENCING NEW TABLE AS new_records
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_rollup_upsert();
+
+INSERT INTO sensor_record_hourly
+    (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+SELECT smort_ID, date_trunc('hour', time_stamp), MIN(trash_level), MAX(trash_level),
+       COALESCE(SUM(trash_level), 0), COUNT(trash_level), MAX(time_stamp),
+       (ARRAY_AGG(trash_level ORDER BY time_stamp DESC))[1]
+FROM sensor_record
+GROUP BY 1, 2;
+
+INSERT INTO sensor_record_daily
+    (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+SELECT smort_ID, date_trunc('day', time_stamp), MIN(trash_level), MAX(trash_level),
+       COALESCE(SUM(trash_level), 0), COUNT(trash_level), MAX(time_stamp),
+       (ARRAY_AGG(trash_level ORDER BY time_stamp DESC))[1]
+FROM sensor_record
+GROUP BY 1, 2;
+
+COMMIT;
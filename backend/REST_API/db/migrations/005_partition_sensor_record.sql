@@ -0,0 +1,116 @@
+-- Moves sensor_record to monthly range partitions (see smort.sql): REAL
+-- trash_level, BRIN index on time_stamp, default partition, same triggers.
+-- Rewrites the table, so run it in a maintenance window. Rollups and
+-- sensor_latest are kept as they are.
+BEGIN;
+
+LOCK TABLE sensor_record IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE sensor_record RENAME TO sensor_record_unpartitioned;
+ALTER INDEX sensor_record_pkey RENAME TO sensor_record_unpartitioned_pkey;
+
+CREATE TABLE sensor_record (
+    smort_ID INTEGER NOT NULL,
+    trash_level REAL,
+    time_stamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    image_ref CHAR(64),
+    PRIMARY KEY (smort_ID, time_stamp),
+    FOREIGN KEY (smort_ID) REFERENCES sensor(ID)
+) PARTITION BY RANGE (time_stamp);
+
+CREATE TABLE sensor_record_default PARTITION OF sensor_record DEFAULT;
+
+CREATE INDEX sensor_record_time_brin ON sensor_record USING BRIN (time_stamp);
+
+-- Creates the partition for the month containing `month` (if missing),
+-- moving any of its rows out of the default partition first
+CREATE FUNCTION sensor_record_create_partition(month TIMESTAMP) RETURNS TEXT AS $$
+DECLARE
+    start_at TIMESTAMP := date_trunc('month', month);
+    end_at TIMESTAMP := date_trunc('month', month) + INTERVAL '1 month';
+    partition_name TEXT := 'sensor_record_' || to_char(month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    LOCK TABLE sensor_record_default IN ACCESS EXCLUSIVE MODE;
+    EXECUTE format('CREATE TABLE %I (LIKE sensor_record INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM sensor_record_default WHERE time_stamp >= %L AND time_stamp < %L RETURNING *)
+         INSERT INTO %I SELECT * FROM moved', start_at, end_at, partition_name);
+    EXECUTE format('ALTER TABLE sensor_record ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, start_at, end_at);
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for every month present in the default partition and the next
+-- `months_ahead` months, so new readings never land in the default one
+CREATE FUNCTION sensor_record_ensure_partitions(months_ahead INTEGER DEFAULT 2) RETURNS SETOF TEXT AS $$
+    SELECT sensor_record_create_partition(month)
+    FROM (
+        SELECT DISTINCT date_trunc('month', time_stamp) AS month FROM sensor_record_default
+        UNION
+        SELECT date_trunc('month', LOCALTIMESTAMP) + make_interval(months => ahead)
+        FROM generate_series(0, months_ahead) AS ahead
+    ) months
+    ORDER BY month;
+$$ LANGUAGE sql;
+
+
+-- Copied before the triggers exist: rollups and sensor_latest already cover these rows
+INSERT INTO sensor_record (smort_ID, trash_level, time_stamp, image_ref)
+SELECT smort_ID, trash_level, time_stamp, image_ref FROM sensor_record_unpartitioned;
+
+SELECT sensor_record_ensure_partitions();
+
+DROP TABLE sensor_record_unpartitioned;
+
+-- Aggregates the REAL levels as DECIMAL so rollup sums stay exact
+CREATE OR REPLACE FUNCTION sensor_rollup_upsert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_record_hourly AS r
+        (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+    SELECT smort_ID, date_trunc('hour', time_stamp), MIN(level), MAX(level),
+           COALESCE(SUM(level), 0), COUNT(level), MAX(time_stamp),
+           (ARRAY_AGG(level ORDER BY time_stamp DESC))[1]
+    FROM (SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS level FROM new_records) new_levels
+    GROUP BY 1, 2
+    ON CONFLICT (smort_ID, bucket) DO UPDATE
+        SET min_level = LEAST(r.min_level, EXCLUDED.min_level),
+            max_level = GREATEST(r.max_level, EXCLUDED.max_level),
+            sum_level = r.sum_level + EXCLUDED.sum_level,
+            readings = r.readings + EXCLUDED.readings,
+            last_level = CASE WHEN EXCLUDED.last_time >= r.last_time
+                              THEN EXCLUDED.last_level ELSE r.last_level END,
+            last_time = GREATEST(r.last_time, EXCLUDED.last_time);
+
+    INSERT INTO sensor_record_daily AS r
+        (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+    SELECT smort_ID, date_trunc('day', time_stamp), MIN(level), MAX(level),
+           COALESCE(SUM(level), 0), COUNT(level), MAX(time_stamp),
+           (ARRAY_AGG(level ORDER BY time_stamp DESC))[1]
+    FROM (SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS level FROM new_records) new_levels
+    GROUP BY 1, 2
+    ON CONFLICT (smort_ID, bucket) DO UPDATE
+        SET min_level = LEAST(r.min_level, EXCLUDED.min_level),
+            max_level = GREATEST(r.max_level, EXCLUDED.max_level),
+            sum_level = r.sum_level + EXCLUDED.sum_level,
+            readings = r.readings + EXCLUDED.readings,
+            last_level = CASE WHEN EXCLUDED.last_time >= r.last_time
+                              THEN EXCLUDED.last_level ELSE r.last_level END,
+            last_time = GREATEST(r.last_time, EXCLUDED.last_time);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sensor_record_latest
+    AFTER INSERT ON sensor_record
+    FOR EACH ROW EXECUTE FUNCTION sensor_latest_upsert();
+
+CREATE TRIGGER sensor_record_rollup
+    AFTER INSERT ON sensor_record
+    REFERENCING NEW TABLE AS new_records
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_rollup_upsert();
+
+COMMIT;
@@ -8,7 +8,7 @@ from io import StringIO
 def sql_to_dataframe(sql_file_path):
     """Convert SQL INSERT statements to a pandas DataFrame"""
     data = []
-    pattern = re.compile(r"INSERT INTO sensor_record \(smort_ID, time_stamp, trash_level, image\) VALUES \('(\d+)', '([^']+)', (\d+), ''\);")
+    pattern = re.compile(r"INSERT INTO sensor_record \(smort_ID, time_stamp, trash_level\) VALUES \('(\d+)', '([^']+)', (\d+)\);")
     
     with open(sql_file_path, 'r') as file:
         for line in file:
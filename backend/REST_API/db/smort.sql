@@ -21,11 +21,155 @@ CREATE TABLE region_sensor (
     FOREIGN KEY (sensor_ID) REFERENCES sensor(ID) ON DELETE CASCADE
 );
 
+-- Readings, partitioned by month so time-ranged queries only touch the months
+-- they need and old months can be detached (components/retention.py). Columns
+-- are ordered so a row packs without padding; trash_level is a 4-byte REAL
+-- that queries read back as DECIMAL(5,2).
 CREATE TABLE sensor_record (
     smort_ID INTEGER NOT NULL,
+    trash_level REAL,
     time_stamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    trash_level DECIMAL(5,2),
-    image TEXT NOT NULL,
+    -- SHA-256 of the camera frame in the image store (components/blob_store.py)
+    image_ref CHAR(64),
     PRIMARY KEY (smort_ID, time_stamp),
     FOREIGN KEY (smort_ID) REFERENCES sensor(ID)
-);
\ No newline at end of file
+) PARTITION BY RANGE (time_stamp);
+
+-- Catches readings for months without a partition yet
+CREATE TABLE sensor_record_default PARTITION OF sensor_record DEFAULT;
+
+CREATE INDEX sensor_record_time_brin ON sensor_record USING BRIN (time_stamp);
+
+-- Creates the partition for the month containing `month` (if missing),
+-- moving any of its rows out of the default partition first
+CREATE FUNCTION sensor_record_create_partition(month TIMESTAMP) RETURNS TEXT AS $$
+DECLARE
+    start_at TIMESTAMP := date_trunc('month', month);
+    end_at TIMESTAMP := date_trunc('month', month) + INTERVAL '1 month';
+    partition_name TEXT := 'sensor_record_' || to_char(month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    LOCK TABLE sensor_record_default IN ACCESS EXCLUSIVE MODE;
+    EXECUTE format('CREATE TABLE %I (LIKE sensor_record INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM sensor_record_default WHERE time_stamp >= %L AND time_stamp < %L RETURNING *)
+         INSERT INTO %I SELECT * FROM moved', start_at, end_at, partition_name);
+    EXECUTE format('ALTER TABLE sensor_record ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, start_at, end_at);
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for every month present in the default partition and the next
+-- `months_ahead` months, so new readings never land in the default one
+CREATE FUNCTION sensor_record_ensure_partitions(months_ahead INTEGER DEFAULT 2) RETURNS SETOF TEXT AS $$
+    SELECT sensor_record_create_partition(month)
+    FROM (
+        SELECT DISTINCT date_trunc('month', time_stamp) AS month FROM sensor_record_default
+        UNION
+        SELECT date_trunc('month', LOCALTIMESTAMP) + make_interval(months => ahead)
+        FROM generate_series(0, months_ahead) AS ahead
+    ) months
+    ORDER BY month;
+$$ LANGUAGE sql;
+
+SELECT sensor_record_ensure_partitions();
+
+-- Latest reading per sensor, kept current by a trigger on every insert so
+-- "current level" queries cost O(sensors) however much history is stored
+CREATE TABLE sensor_latest (
+    smort_ID INTEGER PRIMARY KEY,
+    time_stamp TIMESTAMP NOT NULL,
+    trash_level DECIMAL(5,2),
+    FOREIGN KEY (smort_ID) REFERENCES sensor(ID) ON DELETE CASCADE
+);
+
+CREATE FUNCTION sensor_latest_upsert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_latest (smort_ID, time_stamp, trash_level)
+    VALUES (NEW.smort_ID, NEW.time_stamp, NEW.trash_level)
+    ON CONFLICT (smort_ID) DO UPDATE
+        SET time_stamp = EXCLUDED.time_stamp,
+            trash_level = EXCLUDED.trash_level
+        WHERE sensor_latest.time_stamp <= EXCLUDED.time_stamp;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sensor_record_latest
+    AFTER INSERT ON sensor_record
+    FOR EACH ROW EXECUTE FUNCTION sensor_latest_upsert();
+
+-- Per sensor per hour/day aggregates, maintained by a statement trigger on
+-- sensor_record so analytics read a few hundred rows instead of raw history.
+-- Rows are only ever added to: deleting raw readings keeps their rollups.
+CREATE TABLE sensor_record_hourly (
+    smort_ID INTEGER NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    min_level DECIMAL(5,2),
+    max_level DECIMAL(5,2),
+    sum_level DECIMAL(14,2) NOT NULL DEFAULT 0,
+    readings INTEGER NOT NULL DEFAULT 0,
+    last_time TIMESTAMP NOT NULL,
+    last_level DECIMAL(5,2),
+    PRIMARY KEY (smort_ID, bucket),
+    FOREIGN KEY (smort_ID) REFERENCES sensor(ID) ON DELETE CASCADE
+);
+
+CREATE TABLE sensor_record_daily (
+    smort_ID INTEGER NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    min_level DECIMAL(5,2),
+    max_level DECIMAL(5,2),
+    sum_level DECIMAL(14,2) NOT NULL DEFAULT 0,
+    readings INTEGER NOT NULL DEFAULT 0,
+    last_time TIMESTAMP NOT NULL,
+    last_level DECIMAL(5,2),
+    PRIMARY KEY (smort_ID, bucket),
+    FOREIGN KEY (smort_ID) REFERENCES sensor(ID) ON DELETE CASCADE
+);
+
+CREATE FUNCTION sensor_rollup_upsert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_record_hourly AS r
+        (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+    SELECT smort_ID, date_trunc('hour', time_stamp), MIN(level), MAX(level),
+           COALESCE(SUM(level), 0), COUNT(level), MAX(time_stamp),
+           (ARRAY_AGG(level ORDER BY time_stamp DESC))[1]
+    FROM (SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS level FROM new_records) new_levels
+    GROUP BY 1, 2
+    ON CONFLICT (smort_ID, bucket) DO UPDATE
+        SET min_level = LEAST(r.min_level, EXCLUDED.min_level),
+            max_level = GREATEST(r.max_level, EXCLUDED.max_level),
+            sum_level = r.sum_level + EXCLUDED.sum_level,
+            readings = r.readings + EXCLUDED.readings,
+            last_level = CASE WHEN EXCLUDED.last_time >= r.last_time
+                              THEN EXCLUDED.last_level ELSE r.last_level END,
+            last_time = GREATEST(r.last_time, EXCLUDED.last_time);
+
+    INSERT INTO sensor_record_daily AS r
+        (smort_ID, bucket, min_level, max_level, sum_level, readings, last_time, last_level)
+    SELECT smort_ID, date_trunc('day', time_stamp), MIN(level), MAX(level),
+           COALESCE(SUM(level), 0), COUNT(level), MAX(time_stamp),
+           (ARRAY_AGG(level ORDER BY time_stamp DESC))[1]
+    FROM (SELECT smort_ID, time_stamp, trash_level::DECIMAL(5,2) AS level FROM new_records) new_levels
+    GROUP BY 1, 2
+    ON CONFLICT (smort_ID, bucket) DO UPDATE
+        SET min_level = LEAST(r.min_level, EXCLUDED.min_level),
+            max_level = GREATEST(r.max_level, EXCLUDED.max_level),
+            sum_level = r.sum_level + EXCLUDED.sum_level,
+            readings = r.readings + EXCLUDED.readings,
+            last_level = CASE WHEN EXCLUDED.last_time >= r.last_time
+                              THEN EXCLUDED.last_level ELSE r.last_level END,
+            last_time = GREATEST(r.last_time, EXCLUDED.last_time);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sensor_record_rollup
+    AFTER INSERT ON sensor_record
+    REFERENCING NEW TABLE AS new_records
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_rollup_upsert();
@@ -1,7 +1,6 @@
 #include <WiFi.h>
 #include <HTTPClient.h>
 #include "esp_camera.h"
-#include "mbedtls/base64.h"
 #include <Wire.h>
 #include <Adafruit_GFX.h>
 #include <Adafruit_SSD1306.h>
@@ -38,10 +37,14 @@ float distanceInch;
 float maxDistanceCm = 13;
 float currentPercentage;
 
+// Time until the next reading; the server recommends it in X-Next-Report-S
+unsigned long nextReportMs = 5000;
+const char* responseHeaders[] = {"X-Next-Report-S"};
+
 // WiFi credentials
 const char* ssid = "depressingFutures";
 const char* password = "12345678";
-const char* serverUrl = "http://45.118.132.167/record";
+const char* serverUrl = "http://45.118.132.167/record/image";
 
 // Camera pins for ESP32-CAM
 #define CAMERA_MODEL_AI_THINKER
@@ -166,57 +169,39 @@ void loop() {
     }
     analogWrite(FLASH_LED_PIN, maxBrightness);
     delay(100);
-    bool conversionDone = false;
-    char* b64_str = NULL;
-    
-    // Loop until we get a valid frame and complete the conversion
-    while (!conversionDone) {
-      // Try to capture a frame from the camera
-      camera_fb_t* fb = esp_camera_fb_get();
-      if (fb) {
-        // Determine required buffer length for Base64 conversion
-        size_t b64_len = 0;
-        mbedtls_base64_encode(NULL, 0, &b64_len, fb->buf, fb->len);
-        
-        // Allocate memory for Base64 string
-        b64_str = (char*)malloc(b64_len);
-        if (b64_str != NULL) {
-          // Perform the Base64 encoding
-          if (mbedtls_base64_encode((unsigned char*)b64_str, b64_len, &b64_len, fb->buf, fb->len) == 0) {
-            // Conversion succeeded, exit loop
-            conversionDone = true;
-          }
-          else {
-            // Conversion failed; free allocated memory and try again
-            free(b64_str);
-            b64_str = NULL;
-          }
-        }
-        // Return the frame buffer back to the driver
-        esp_camera_fb_return(fb);
-      }
+    camera_fb_t* fb = NULL;
+
+    // Loop until we get a valid frame
+    while (!fb) {
+      fb = esp_camera_fb_get();
       // Small delay before retrying
       delay(10);
     }
     delay(100);
 
-    // Once conversion is done, turn off the flash
+    // Once the frame is captured, turn off the flash
     analogWrite(FLASH_LED_PIN, maxBrightness-maxBrightness);
 
     int counter = 0;
-    // Send HTTP POST request
+    // Send the JPEG as the raw request body, the reading goes in headers
     while (WiFi.status() == WL_CONNECTED && counter < 5) {
         HTTPClient http;
         http.begin(serverUrl);
-        http.addHeader("Content-Type", "application/json");
-        
-        String payload = "{\"sensor_ID\":" + String(SENSOR_ID) + ", \"trash_level\":" + String(currentPercentage) + ", \"image_base64\":\"" + String(b64_str) + "\"}";
-        Serial.println(payload);
-        int httpResponseCode = http.POST(payload);
+        http.addHeader("Content-Type", "image/jpeg");
+        http.addHeader("X-Sensor-ID", String(SENSOR_ID));
+        http.addHeader("X-Trash-Level", String(currentPercentage));
+        http.collectHeaders(responseHeaders, 1);
+
+        int httpResponseCode = http.POST(fb->buf, fb->len);
         
         if (httpResponseCode > 0) {
             Serial.println("Image sent successfully");
             Serial.println(httpResponseCode);
+            long nextReportS = http.header("X-Next-Report-S").toInt();
+            if (nextReportS > 0) {
+                nextReportMs = nextReportS * 1000UL;
+            }
+            http.end();
             break;
         } else {
             Serial.print("Error sending image: ");
@@ -228,9 +213,9 @@ void loop() {
         http.end();
     }
 
-    // Free memory
-    free(b64_str);
-    delay(5000); // Wait 5 seconds before next capture
+    // Return the frame buffer back to the driver
+    esp_camera_fb_return(fb);
+    delay(nextReportMs); // Wait until the server wants the next reading
 
     // Clear the display buffer
     display.clearDisplay();